@@ -0,0 +1,32 @@
+"""
+Copy the entries of transpose.json into a SQLite database, transpose.db
+
+Once transpose.db exists in the store path it is used automatically. The original
+transpose.json (and change log, if any) is kept as transpose.json.migrated
+"""
+
+import os
+
+from transpose import DEFAULT_STORE_PATH, TransposeConfig
+from transpose.backends import JsonBackend, get_backend
+
+
+def main() -> None:
+    config_file = f"{DEFAULT_STORE_PATH}/transpose.json"
+    db_file = f"{DEFAULT_STORE_PATH}/transpose.db"
+
+    if os.path.exists(db_file):
+        raise SystemExit(f"Already migrated: '{db_file}' exists")
+
+    config = TransposeConfig.load(config_file, backend="json")
+    config.backend = get_backend("sqlite")
+    config.save(db_file)
+
+    os.rename(config_file, f"{config_file}.migrated")
+    log_file = JsonBackend.log_path(config_file)
+    if log_file.exists():
+        os.rename(log_file, f"{log_file}.migrated")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,40 @@
+"""
+Move directories to a central store path and symlink them back in place
+
+transpose is run once per command, so its startup time is most of the time taken by
+quick commands. Modules which are slow to import and only needed by some commands (such
+as concurrent.futures, tarfile, sqlite3 and asyncio) are imported in the functions using
+them rather than at the top of each module, which tests/test_startup.py checks.
+"""
+
 import os
 
-from importlib.metadata import version
+from functools import lru_cache
 
 DEFAULT_XDG_PATH = os.environ.get("XDG_DATA_HOME", f"{os.environ['HOME']}/.local/share")
 STORE_PATH = f"{DEFAULT_XDG_PATH}/transpose"
 DEFAULT_STORE_PATH = os.environ.get("TRANSPOSE_STORE_PATH", STORE_PATH)
+DEFAULT_CONFIG_BACKEND = os.environ.get("TRANSPOSE_CONFIG_BACKEND", "json")
+
+
+@lru_cache(maxsize=None)
+def get_version() -> str:
+    """
+    Get the installed version of transpose
+
+    Reading package metadata scans the installed distributions, so this is only done
+    when needed (--version and saving the config) rather than on import
+    """
+    from importlib.metadata import version
+
+    return version("transpose")
+
+
+def __getattr__(name: str):
+    # Keep `transpose.version` working without resolving it on import (PEP 562)
+    if name == "version":
+        return get_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-version = version("transpose")
 
 from .transpose import Transpose, TransposeConfig, TransposeEntry  # noqa: E402
@@ -0,0 +1,340 @@
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, List
+
+import fnmatch
+import os
+
+from .exceptions import TransposeError
+from .utils import DEFAULT_WORKERS, fsync_directory
+
+# Compressed independently by each worker, so larger chunks compress a little better but
+# need more memory: at most workers + 1 chunks are held at once
+ARCHIVE_CHUNK_SIZE = 8 * 1024 * 1024
+ARCHIVE_INDEX_VERSION = 1
+
+# Types of tar members in the index
+MEMBER_FILE = "0"
+MEMBER_HARDLINK = "1"
+MEMBER_SYMLINK = "2"
+MEMBER_DIRECTORY = "5"
+
+
+@dataclass
+class Codec:
+    suffix: str  # Of the archive, such as ".tar.zst"
+    compress: Callable[[bytes], bytes]  # One chunk into a complete frame (or stream)
+    decompress: Callable[[bytes], bytes]  # One frame
+    open: Callable[[str], BinaryIO]  # Reads the concatenated frames decompressed
+
+
+def get_codecs() -> List[Codec]:
+    """
+    Get the codecs available in the standard library, in order of preference
+
+    zstd is only in the standard library from Python 3.14, otherwise xz is preferred over
+    gzip for its ratio, since frozen entries are rarely read. Each concatenates its chunks
+    as separate frames, which the usual tools (zstd, xz, gzip) decompress as one.
+    """
+    codecs = []
+
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        pass
+    else:
+        codecs.append(Codec(".tar.zst", zstd.compress, zstd.decompress, zstd.open))
+
+    try:
+        import lzma
+    except ImportError:  # Python can be built without it
+        pass
+    else:
+        codecs.append(Codec(".tar.xz", lzma.compress, lzma.decompress, lzma.open))
+
+    import gzip
+    import zlib
+
+    def gzip_compress(data: bytes) -> bytes:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: a gzip member
+        return compressor.compress(data) + compressor.flush()
+
+    codecs.append(Codec(".tar.gz", gzip_compress, gzip.decompress, gzip.open))
+    return codecs
+
+
+def get_codec(archive_name: str = None) -> Codec:
+    """
+    Get the codec of an archive by its name, or the preferred codec for new archives
+    """
+    codecs = get_codecs()
+    if archive_name is None:
+        return codecs[0]
+
+    for codec in codecs:
+        if archive_name.endswith(codec.suffix):
+            return codec
+    raise TransposeError(
+        f"Unsupported archive format, can't decompress: '{archive_name}'"
+    )
+
+
+def pack(source: Path, archive: Path, codec: Codec, workers: int = None) -> dict:
+    """
+    Pack a file or directory into a compressed tar archive, synced to disk
+
+    The tar stream is split into chunks which are compressed in a pool of workers (the
+    compressors release the GIL) and written in order, so the whole directory is never
+    held in memory. Symlinks are kept as symlinks and hardlinks as hardlinks.
+
+    Args:
+        source: The path to pack, stored in the archive under its own name
+        archive: The path of the archive to create
+        codec: How to compress the archive, see get_codec
+        workers: The number of chunks to compress concurrently (default: DEFAULT_WORKERS)
+
+    Returns:
+        The index of the archive, for extracting single members with extract
+    """
+    import tarfile
+
+    members = {}
+
+    class IndexingTarFile(tarfile.TarFile):
+        def addfile(self, tarinfo, fileobj=None) -> None:
+            super().addfile(tarinfo, fileobj)
+            size = tarinfo.size if tarinfo.isreg() else 0
+            padded = -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            members[tarinfo.name.partition("/")[2]] = [
+                MEMBER_FILE if tarinfo.isreg() else tarinfo.type.decode(),
+                self.offset - padded,  # Of the data, in the uncompressed stream
+                size,
+                tarinfo.mode,
+                tarinfo.mtime,
+                (
+                    tarinfo.linkname.partition("/")[2]
+                    if tarinfo.islnk()
+                    else tarinfo.linkname
+                ),
+            ]
+
+    with open(archive, "wb") as f:
+        with _ChunkedCompressor(f, codec, workers or DEFAULT_WORKERS) as compressor:
+            with IndexingTarFile.open(
+                fileobj=compressor, mode="w|", format=tarfile.PAX_FORMAT
+            ) as tar:
+                tar.add(str(source), arcname=source.name)
+        f.flush()
+        os.fsync(f.fileno())
+    fsync_directory(archive.parent)
+
+    return {
+        "version": ARCHIVE_INDEX_VERSION,
+        "chunk_size": ARCHIVE_CHUNK_SIZE,
+        "chunks": compressor.offsets,
+        "members": members,
+    }
+
+
+def unpack(archive: Path, destination: Path, codec: Codec) -> None:
+    """
+    Extract an archive created by pack into a directory, streaming it
+
+    Args:
+        archive: The path of the archive
+        destination: The directory to extract the archive's path into
+        codec: How the archive was compressed, see get_codec
+
+    Returns:
+        None
+    """
+    import tarfile
+
+    # The archive was created by pack, so it's extracted exactly as it was packed. Newer
+    # Pythons default to the "data" filter, which refuses symlinks to absolute paths.
+    options = {"filter": "fully_trusted"} if hasattr(tarfile, "data_filter") else {}
+
+    with codec.open(str(archive)) as f:
+        with tarfile.open(fileobj=f, mode="r|") as tar:
+            tar.extractall(str(destination), **options)
+
+
+def match_members(index: dict, pattern: str) -> List[str]:
+    """
+    Get the members of an archive matching a glob, or inside a directory matching it
+
+    Args:
+        index: The index returned by pack
+        pattern: Such as "*.conf" or "saves/slot1", relative to the packed path
+
+    Returns:
+        The member paths relative to the packed path, in the order they're archived
+    """
+    matched = []
+    for name in index["members"]:
+        parts = name.split("/")
+        if name and any(
+            fnmatch.fnmatchcase("/".join(parts[:i]), pattern)
+            for i in range(1, len(parts) + 1)
+        ):
+            matched.append(name)
+    return matched
+
+
+def extract(
+    archive: Path, index: dict, names: List[str], destination: Path, codec: Codec
+) -> List[str]:
+    """
+    Extract some members of an archive created by pack, using its index
+
+    Only the chunks containing the members are read and decompressed, so a single file is
+    extracted in about the time it takes to decompress one chunk, however large the
+    archive. Members which already exist in the destination are skipped.
+
+    Args:
+        archive: The path of the archive
+        index: The index returned by pack
+        names: Member paths relative to the packed path, see match_members
+        destination: The directory to extract them into, the packed path itself
+        codec: How the archive was compressed, see get_codec
+
+    Returns:
+        The names which were extracted
+    """
+    if index.get("version") != ARCHIVE_INDEX_VERSION:
+        raise TransposeError(f"Unsupported archive index version for '{archive}'")
+
+    members = index["members"]
+    names = sorted(set(names), key=lambda name: members[name][1])
+    extracted = []
+
+    with open(archive, "rb") as f:
+        reader = _ChunkReader(f, index, codec)
+
+        def extract_member(name: str) -> None:
+            kind, offset, size, mode, mtime, linkname = members[name]
+            path = destination.joinpath(name)
+            if os.path.lexists(path):
+                return
+            _make_parents(destination, name, members)
+
+            if kind == MEMBER_DIRECTORY:
+                path.mkdir()
+                os.chmod(path, mode)
+            elif kind == MEMBER_SYMLINK:
+                os.symlink(linkname, path)
+            elif kind == MEMBER_HARDLINK:
+                extract_member(linkname)
+                os.link(destination.joinpath(linkname), path)
+            elif kind == MEMBER_FILE:
+                temp_path = path.with_name(f".{path.name}.hydrate")
+                with open(temp_path, "wb") as out:
+                    for data in reader.read(offset, size):
+                        out.write(data)
+                os.chmod(temp_path, mode)
+                os.utime(temp_path, (mtime, mtime))
+                os.rename(temp_path, path)
+            else:  # Such as a fifo, which only a full thaw recreates
+                return
+            extracted.append(name)
+
+        for name in names:
+            extract_member(name)
+
+    return extracted
+
+
+def _make_parents(destination: Path, name: str, members: dict) -> None:
+    """
+    Create the missing parent directories of a member, with their archived modes
+    """
+    parts = name.split("/")[:-1]
+    for i in range(len(parts)):
+        parent = "/".join(parts[: i + 1])
+        path = destination.joinpath(parent)
+        if not path.is_dir():
+            path.mkdir(parents=True)
+            if parent in members:
+                os.chmod(path, members[parent][3])
+
+
+class _ChunkReader:
+    """
+    Reads ranges of the uncompressed tar stream by decompressing only the chunks they span
+    """
+
+    def __init__(self, f: BinaryIO, index: dict, codec: Codec) -> None:
+        self._f = f
+        self._chunk_size = index["chunk_size"]
+        self._offsets = index["chunks"]
+        self._codec = codec
+        self._cached = (None, b"")  # The last chunk read, small files often share one
+
+    def read(self, offset: int, size: int) -> Iterator[bytes]:
+        end = offset + size
+        while offset < end:
+            i = offset // self._chunk_size
+            chunk = self._chunk(i)
+            start = i * self._chunk_size
+            data = chunk[offset - start : end - start]
+            if not data:
+                raise TransposeError(
+                    "Archive is shorter than its index, it may be damaged"
+                )
+            offset += len(data)
+            yield data
+
+    def _chunk(self, i: int) -> bytes:
+        if self._cached[0] != i:
+            self._f.seek(self._offsets[i])
+            frame = self._f.read(self._offsets[i + 1] - self._offsets[i])
+            self._cached = (i, self._codec.decompress(frame))
+        return self._cached[1]
+
+
+class _ChunkedCompressor:
+    """
+    Write-only file object which compresses what's written to another file in chunks
+    """
+
+    def __init__(self, f: BinaryIO, codec: Codec, workers: int) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._f = f
+        self._codec = codec
+        self._workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._buffer = bytearray()
+        self._pending = deque()
+        # Where each chunk starts in the file, and where the last one ends
+        self.offsets = [0]
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= ARCHIVE_CHUNK_SIZE:
+            self._submit(bytes(self._buffer[:ARCHIVE_CHUNK_SIZE]))
+            del self._buffer[:ARCHIVE_CHUNK_SIZE]
+        return len(data)
+
+    def _submit(self, chunk: bytes) -> None:
+        self._pending.append(self._executor.submit(self._codec.compress, chunk))
+        while len(self._pending) > self._workers:  # Bound the chunks held in memory
+            self._write(self._pending.popleft().result())
+
+    def _write(self, frame: bytes) -> None:
+        self._f.write(frame)
+        self.offsets.append(self.offsets[-1] + len(frame))
+
+    def __enter__(self) -> "_ChunkedCompressor":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        try:
+            if exc_type is None:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                while self._pending:
+                    self._write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown()
@@ -0,0 +1,397 @@
+from collections.abc import Mapping
+from contextlib import closing
+from dataclasses import asdict
+from pathlib import Path
+
+import json
+import os
+import threading
+
+from . import get_version
+from .exceptions import TransposeError
+from .utils import read_jsonl, write_atomic
+
+# The log is folded into the snapshot once it has more records than this or the entries
+CONFIG_LOG_COMPACT_MIN = 100
+
+
+class ConfigBackend:
+    """
+    Storage interface behind TransposeConfig.load and TransposeConfig.save
+
+    read returns the config in the transpose.json format ({"entries": {name: {...}}}) and
+    write persists a TransposeConfig, using the changes recorded since it was loaded
+    where the backend can apply them incrementally
+    """
+
+    name: str
+    # Whether write only touches the changed entries, keeping those saved by other processes
+    # as they are, so a stale config doesn't need merging before it is written
+    keeps_other_changes = False
+
+    def __init__(self) -> None:
+        # The path this backend last read or wrote, recorded changes are relative to it
+        self._source = None
+
+    def read(self, config_path: Path) -> dict:
+        raise NotImplementedError
+
+    def write(self, config, config_path: Path) -> None:
+        raise NotImplementedError
+
+    def is_stale(self, config_path: Path) -> bool:
+        """
+        Check if another process saved the config since this backend read or wrote it, so
+        the loaded entries are out of date and unsaved changes need merging before writing
+        """
+        return False
+
+    def _is_source(self, config_path: Path) -> bool:
+        return self._source is not None and Path(config_path) == self._source
+
+
+class JsonBackend(ConfigBackend):
+    """
+    The whole config in a single JSON file, rewritten atomically on every save
+
+    A change log left by LogBackend is replayed when reading and removed when writing
+    """
+
+    name = "json"
+    _log_records = 0
+    _stamp = None
+
+    def read(self, config_path: Path) -> dict:
+        try:
+            in_config = json.load(open(config_path, "r"))
+        except json.decoder.JSONDecodeError as e:
+            raise TransposeError(f"Invalid JSON format for '{config_path}': {e}")
+        except FileNotFoundError:
+            in_config = {"entries": {}}
+
+        self._source = Path(config_path)
+        self._stamp = self._fingerprint(config_path)
+        self._log_records = self._replay_log(in_config, self.log_path(config_path))
+        return in_config
+
+    def write(self, config, config_path: Path) -> None:
+        write_atomic(config_path, json.dumps(config.to_dict(), default=str))
+        config.pop_changes()
+
+        # The snapshot now includes everything in the log, replaying it again is harmless
+        log_path = self.log_path(config_path)
+        if log_path.exists():
+            log_path.unlink()
+        self._source = Path(config_path)
+        self._stamp = self._fingerprint(config_path)
+        self._log_records = 0
+
+    def is_stale(self, config_path: Path) -> bool:
+        return (
+            self._is_source(config_path)
+            and self._fingerprint(config_path) != self._stamp
+        )
+
+    @staticmethod
+    def log_path(config_path: Path) -> Path:
+        """
+        Get the path of the change log that belongs to a config file
+        """
+        config_path = Path(config_path)
+        return config_path.with_name(f"{config_path.name}.log")
+
+    @classmethod
+    def _fingerprint(cls, config_path: Path) -> tuple:
+        """
+        Identify the current version of the config file and log, which are replaced or
+        appended to on every save
+        """
+        stamps = []
+        for path in (Path(config_path), cls.log_path(config_path)):
+            try:
+                st = path.stat()
+                stamps.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    @staticmethod
+    def _replay_log(in_config: dict, log_path: Path) -> int:
+        """
+        Apply the changes from the log on top of the loaded snapshot
+
+        Changes are applied leniently (adding replaces, missing entries are skipped) so
+        replaying changes already included in the snapshot gives the same result
+
+        Returns:
+            The number of records in the log
+        """
+        changes = read_jsonl(log_path)
+        entries = in_config.get("entries")
+        for change in changes:
+            try:
+                apply_change(entries, change)
+            except (AttributeError, KeyError, TypeError) as e:
+                raise TransposeError(f"Unrecognized Transpose config log format: {e}")
+
+        return len(changes)
+
+
+class LogBackend(JsonBackend):
+    """
+    A JSON snapshot plus an append-only log of changes, making single entry edits O(1)
+
+    The log is compacted into the snapshot once it grows larger than the entries
+    """
+
+    name = "log"
+
+    def write(self, config, config_path: Path) -> None:
+        if not self._is_source(config_path) or not Path(config_path).exists():
+            return super().write(config, config_path)
+
+        changes = config.pop_changes()
+        if changes:
+            lines = "".join(
+                json.dumps(change, default=str) + "\n" for change in changes
+            )
+            with open(self.log_path(config_path), "a") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_records += len(changes)
+            self._stamp = self._fingerprint(config_path)
+
+        if self._log_records > max(CONFIG_LOG_COMPACT_MIN, len(config.entries)):
+            super().write(config, config_path)
+
+
+class SqliteBackend(ConfigBackend):
+    """
+    Entries as rows of a SQLite database indexed by name and path
+
+    Saving only touches the rows of entries changed since loading, in one transaction. A
+    revision in the meta table is incremented by every save, so a process holding the
+    config open can tell when to reload it
+    """
+
+    name = "sqlite"
+    keeps_other_changes = True
+    _revision = None
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS entries (
+            name TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_path ON entries (path);
+    """
+
+    def read(self, config_path: Path) -> dict:
+        self._source = Path(config_path)
+        self._revision = self._read_revision(config_path)
+        if not Path(config_path).exists():  # Connecting would create it
+            return {"entries": {}}
+
+        entries = SqliteEntries(config_path)
+        return {"entries": entries, "version": entries.query_value("version")}
+
+    def write(self, config, config_path: Path) -> None:
+        changes = config.pop_changes()
+        full = not self._is_source(config_path) or not Path(config_path).exists()
+
+        with self._connect(config_path) as db:
+            db.executescript(self.SCHEMA)
+            with db:  # One transaction
+                if full:
+                    db.execute("DELETE FROM entries")
+                    names = list(config.entries)
+                else:
+                    names = list(dict.fromkeys(change["name"] for change in changes))
+
+                for name in names:
+                    entry = config.entries.get(name)
+                    if entry is None:
+                        db.execute("DELETE FROM entries WHERE name = ?", (name,))
+                    else:
+                        db.execute(
+                            "INSERT OR REPLACE INTO entries (name, path, data) VALUES (?, ?, ?)",
+                            (name, entry.path, json.dumps(asdict(entry), default=str)),
+                        )
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                    (str(config.version or get_version()),),
+                )
+                revision = self._query_revision(db)
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)",
+                    (str(revision + 1),),
+                )
+
+        # Saves by other processes since reading stay unseen until the config is reloaded
+        if full or revision == self._revision:
+            self._revision = revision + 1
+        self._source = Path(config_path)
+
+    def is_stale(self, config_path: Path) -> bool:
+        return (
+            self._is_source(config_path)
+            and self._read_revision(config_path) != self._revision
+        )
+
+    @classmethod
+    def _read_revision(cls, config_path: Path) -> int:
+        """
+        Get the revision of the config, which every write increments
+        """
+        if not Path(config_path).exists():
+            return 0
+
+        import sqlite3
+
+        with cls._connect(config_path) as db:
+            try:
+                return cls._query_revision(db)
+            except sqlite3.OperationalError:  # No meta table yet
+                return 0
+            except sqlite3.DatabaseError as e:
+                raise TransposeError(f"Invalid SQLite config '{config_path}': {e}")
+
+    @staticmethod
+    def _query_revision(db) -> int:
+        row = db.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _connect(config_path: Path):
+        import sqlite3
+
+        try:
+            return closing(sqlite3.connect(str(config_path)))
+        except sqlite3.Error as e:
+            raise TransposeError(f"Unable to open SQLite config '{config_path}': {e}")
+
+
+class SqliteEntries(Mapping):
+    """
+    Read-only mapping of entry names to their transpose.json format, queried per access
+
+    Looking up an entry reads only its row, so single entry commands don't depend on
+    the size of the store
+    """
+
+    def __init__(self, config_path: Path) -> None:
+        self.config_path = Path(config_path)
+        self._db = None
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> dict:
+        row = self._fetchone("SELECT data FROM entries WHERE name = ?", (name,))
+        if row is None:
+            raise KeyError(name)
+        return json.loads(row[0])
+
+    def __contains__(self, name: object) -> bool:
+        return (
+            self._fetchone("SELECT 1 FROM entries WHERE name = ?", (name,)) is not None
+        )
+
+    def __iter__(self):
+        with self._lock:
+            names = self._execute("SELECT name FROM entries ORDER BY rowid").fetchall()
+        return (name for name, in names)
+
+    def __len__(self) -> int:
+        return self._fetchone("SELECT COUNT(*) FROM entries")[0]
+
+    def names_by_paths(self, paths: list) -> list:
+        """
+        Get the names of the entries with any of these exact paths, using the path index
+        """
+        names = []
+        for i in range(0, len(paths), 500):  # Stay below SQLite's variable limit
+            chunk = paths[i : i + 500]
+            query = "SELECT name FROM entries WHERE path IN ({})".format(
+                ", ".join("?" * len(chunk))
+            )
+            with self._lock:
+                names += [
+                    name for name, in self._execute(query, tuple(chunk)).fetchall()
+                ]
+        return names
+
+    def query_value(self, key: str) -> str:
+        """
+        Get a value from the meta table, such as the version
+        """
+        row = self._fetchone("SELECT value FROM meta WHERE key = ?", (key,))
+        return row[0] if row else None
+
+    def _fetchone(self, query: str, params: tuple = ()) -> tuple:
+        # fetchall finishes the statement, so no read lock is held between queries
+        with self._lock:
+            rows = self._execute(query, params).fetchall()
+        return rows[0] if rows else None
+
+    def _execute(self, query: str, params: tuple = ()):
+        import sqlite3
+
+        try:
+            if self._db is None:
+                self._db = sqlite3.connect(
+                    str(self.config_path), check_same_thread=False
+                )
+            return self._db.execute(query, params)
+        except sqlite3.DatabaseError as e:
+            raise TransposeError(f"Invalid SQLite config '{self.config_path}': {e}")
+
+
+def apply_change(entries: dict, change: dict) -> None:
+    """
+    Apply a change recorded by TransposeConfig to entries in the transpose.json format
+
+    Changes are applied leniently (adding replaces, missing entries are skipped) so
+    applying changes which are already included gives the same result
+
+    Args:
+        entries: The entry names mapped to their transpose.json format
+        change: A change record such as {"op": "remove", "name": name}
+
+    Returns:
+        None
+    """
+    name = change["name"]
+    if change["op"] == "add":
+        entries[name] = {
+            "name": name,
+            "path": change["path"],
+            "created": change["created"],
+            "enabled": True,
+        }
+    elif change["op"] == "remove":
+        entries.pop(name, None)
+    elif change["op"] == "update" and name in entries:
+        entries[name][change["field"]] = change["value"]
+
+
+CONFIG_BACKENDS = {
+    backend.name: backend for backend in (JsonBackend, LogBackend, SqliteBackend)
+}
+
+
+def get_backend(name: str) -> ConfigBackend:
+    """
+    Create a config backend by name
+
+    Args:
+        name: One of CONFIG_BACKENDS ("json", "log" or "sqlite")
+
+    Returns:
+        ConfigBackend
+    """
+    try:
+        return CONFIG_BACKENDS[name]()
+    except KeyError:
+        raise TransposeError(f"Unknown Transpose config backend: '{name}'")
@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import Optional
+
+import json
+
+from .exceptions import TransposeError
+from .transpose import STATE_DIR
+
+
+def socket_path(config_path: str) -> Path:
+    """
+    Get the path of the socket `transpose serve` listens on for a store
+    """
+    return Path(config_path).parent.joinpath(STATE_DIR, "transpose.sock")
+
+
+def is_serving(config_path: str) -> bool:
+    """
+    Check if a daemon is accepting connections on the socket of a store
+    """
+    sock = _connect(socket_path(config_path))
+    if sock is None:
+        return False
+    sock.close()
+    return True
+
+
+def request(config_path: str, args: dict) -> Optional[dict]:
+    """
+    Run a command in the daemon serving the store, if there is one
+
+    Args:
+        config_path: The path of the config of the store
+        args: The parsed command line arguments, as from vars(parse_arguments())
+
+    Returns:
+        The response with the command's output, log and error (None if it succeeded), or
+        None if no daemon is running
+    """
+    sock = _connect(socket_path(config_path))
+    if sock is None:
+        return None
+
+    with sock:
+        sock.sendall((json.dumps({"args": args}) + "\n").encode())
+        with sock.makefile("rb") as f:
+            line = f.readline()
+
+    try:
+        return json.loads(line)
+    except json.decoder.JSONDecodeError:
+        raise TransposeError(
+            "Transpose daemon closed the connection without a response"
+        )
+
+
+def _connect(path: Path):
+    """
+    Connect to a Unix socket, or return None if nothing is listening on it
+    """
+    if not path.exists():
+        return None
+
+    import socket  # Only needed while serving
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except OSError:  # Such as a socket left behind by a daemon that was killed
+        sock.close()
+        return None
+    return sock
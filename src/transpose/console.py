@@ -1,59 +1,261 @@
 import argparse
+import json
+import logging
+import os
+import sys
 
+from contextlib import contextmanager
+from dataclasses import asdict
 from pathlib import Path
+from typing import Optional
 
-from transpose import Transpose, version, DEFAULT_STORE_PATH
+from transpose import Transpose, get_version, DEFAULT_STORE_PATH
+from .client import request
+from .dedup import DedupResult
 from .exceptions import TransposeError
+from .stores import PLACEMENT_POLICIES
+from .transpose import default_config_path
+from .utils import DEFAULT_WORKERS, REFLINK_MODES, MoveProgress
+
+# Long running commands, never handed to the daemon
+LOCAL_ACTIONS = ("serve", "watch")
+OUTPUT_FORMATS = ("table", "json", "ndjson")
 
 
 def entry_point() -> None:
     args = parse_arguments()
-    config_path = f"{args.store_path}/transpose.json"
+    config_path = default_config_path(args.store_path)
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.INFO if args.verbose else logging.WARNING,
+    )
 
     try:
-        run(args, config_path)
+        if args.action in LOCAL_ACTIONS or not run_remote(args, config_path):
+            run(args, config_path)
     except TransposeError as e:
-        print(f"Transpose Error: {e}")
+        Output(args.output).write({"error": str(e)}, f"Transpose Error: {e}")
 
 
 def run(args, config_path) -> None:
-    t = Transpose(config_path)
+    if args.action == "serve":
+        run_serve(config_path)
+        return
+
+    run_command(Transpose(config_path), args, config_path)
+
+
+def run_command(t: Transpose, args, config_path) -> None:
+    """
+    Run a command with a Transpose instance, either loaded for this run or kept by serve
+    """
+    output = Output(args.output)
 
     if args.action == "apply":
         t.apply(args.name, force=args.force)
+        output.write({"name": args.name, "error": None})
     elif args.action == "apply-all":
-        run_apply_all(t, force=args.force)
+        run_apply_all(t, force=args.force, jobs=args.jobs, output=args.output)
     elif args.action == "restore":
-        t.restore(args.name, force=args.force)
+        run_restore(t, args)
     elif args.action == "store":
-        if not args.name:
-            target_path = Path(args.target_path)
-            args.name = str(target_path.parts[-1])
-        t.store(args.name, args.target_path)
+        run_store(t, args)
+    elif args.action == "dedup":
+        print_dedup(t.dedup(jobs=args.jobs, hardlink=args.hardlink), output)
+    elif args.action == "freeze":
+        size = t.freeze(args.name, jobs=args.jobs)
+        archive = t.config.entries[args.name].frozen
+        output.write(
+            {"name": args.name, "archive": archive, "size": size},
+            f"{args.name} -> {archive} ({format_size(size)})",
+        )
+    elif args.action == "thaw":
+        t.thaw(args.name)
+        output.write({"name": args.name, "error": None})
+    elif args.action == "hydrate":
+        paths = t.hydrate(args.name, args.pattern)
+        with output.records() as write:
+            for path in paths:
+                write({"name": args.name, "path": path}, f"\t{args.name}/{path}")
+    elif args.action == "snapshot":
+        result = t.snapshot(jobs=args.jobs)
+        output.write(
+            asdict(result),
+            f"Snapshot {result.name}: copied {result.copied} file(s) "
+            f"({format_size(result.copied_bytes)}), linked {result.linked} unchanged",
+        )
+    elif args.action == "sync":
+        result = t.sync(args.destination, jobs=args.jobs, checksum=args.checksum)
+        output.write(
+            asdict(result),
+            f"Synced {result.copied} file(s) ({format_size(result.copied_bytes)}), "
+            f"removed {result.removed}, {result.unchanged} unchanged",
+        )
+    elif args.action == "gc":
+        run_gc(t, dry_run=args.dry_run, jobs=args.jobs, output=args.output)
+    elif args.action == "status":
+        run_status(t, output=args.output, jobs=args.jobs)
+    elif args.action == "watch":
+        run_watch(t, force=args.force, debounce=args.debounce, output=args.output)
+    elif args.action == "which":
+        entry = t.config.find_by_path(args.path)
+        if not entry:
+            raise TransposeError(f"Path is not managed by any entry: '{args.path}'")
+        output.write(asdict(entry), f"{entry.name} -> {entry.path}")
     elif args.action == "config":
-        if args.config_action == "add":
-            t.config.add(args.name, args.path)
-            t.config.save(config_path)
-        elif args.config_action == "disable":
-            t.config.disable(args.name)
-            t.config.save(config_path)
-        elif args.config_action == "enable":
-            t.config.enable(args.name)
-            t.config.save(config_path)
-        elif args.config_action == "get":
-            print(t.config.get(args.name))
-        elif args.config_action == "list":
-            for name in t.config.entries:
-                print(f"\t{name:<30} -> {t.config.entries[name].path}")
-        elif args.config_action == "remove":
-            t.config.remove(args.name)
-            t.config.save(config_path)
-        elif args.config_action == "update":
-            t.config.update(args.name, args.field_key, args.field_value)
-            t.config.save(config_path)
+        run_config(t, args, config_path)
+
+
+def run_remote(args, config_path) -> bool:
+    """
+    Run the command in the daemon serving the store (see run_serve), if there is one
 
+    Relative paths in the arguments are made absolute first, since the daemon has its own
+    working directory. What the command logs is written to stderr here, as if it ran in
+    this process.
 
-def run_apply_all(t: Transpose, force: bool = False) -> None:
+    Returns:
+        True if the daemon ran the command, False if none is running
+    """
+    remote_args = vars(args).copy()
+    for key in ("also", "destination", "path", "stores", "target_path"):
+        value = remote_args.get(key)
+        if isinstance(value, list):
+            remote_args[key] = [os.path.abspath(path) for path in value]
+        elif value:
+            remote_args[key] = os.path.abspath(value)
+    if remote_args.get("field_key") == "path":  # config update NAME path PATH
+        remote_args["field_value"] = os.path.abspath(remote_args["field_value"])
+
+    response = request(config_path, remote_args)
+    if response is None:
+        return False
+
+    print(response.get("log", ""), end="", file=sys.stderr)
+    print(response["output"], end="")
+    if response["error"]:
+        raise TransposeError(response["error"])
+    return True
+
+
+def run_serve(config_path) -> None:
+    """
+    Keep the store loaded and run the commands of other transpose invocations until
+    interrupted, see TransposeServer
+    """
+    from .server import TransposeServer
+
+    server = TransposeServer(
+        config_path, lambda t, args: run_command(t, args, config_path)
+    )
+    server.run()
+
+
+def run_config(t: Transpose, args, config_path) -> None:
+    """
+    Run a 'config' sub-action, modifying the config without any filesystem changes
+    """
+    output = Output(args.output)
+
+    if args.config_action == "add":
+        t.config.add(args.name, args.path)
+        t.config.save(config_path)
+    elif args.config_action == "disable":
+        t.config.disable(args.name)
+        t.config.save(config_path)
+    elif args.config_action == "enable":
+        t.config.enable(args.name)
+        t.config.save(config_path)
+    elif args.config_action == "get":
+        entry = t.config.get(args.name)
+        output.write(asdict(entry), str(entry))
+        return
+    elif args.config_action == "list":
+        with output.records() as write:
+            for name in t.config.entries:
+                entry = t.config.entries[name]
+                write(asdict(entry), f"\t{name:<30} -> {entry.path}")
+        return
+    elif args.config_action == "remove":
+        t.config.remove(args.name)
+        t.config.save(config_path)
+        output.write({"name": args.name, "error": None})
+        return
+    elif args.config_action == "update":
+        t.config.update(args.name, args.field_key, args.field_value)
+        t.config.save(config_path)
+
+    output.write(asdict(t.config.get(args.name)))  # The entry as changed
+
+
+def run_restore(t: Transpose, args) -> None:
+    """
+    Restore one or more entries, saving the config once
+    """
+    if len(args.name) == 1:
+        with progress_line() as progress:
+            t.restore(
+                args.name[0], force=args.force, reflink=args.reflink, progress=progress
+            )
+        print_results({args.name[0]: None}, Output(args.output), quiet=True)
+        return
+
+    with progress_line() as progress:
+        results = t.restore_many(
+            args.name,
+            force=args.force,
+            jobs=args.jobs,
+            reflink=args.reflink,
+            progress=progress,
+        )
+    print_results(results, Output(args.output))
+
+
+def run_store(t: Transpose, args) -> None:
+    """
+    Store the target path, and any additional paths, saving the config once
+    """
+    output = Output(args.output)
+    if not args.name:
+        target_path = Path(args.target_path)
+        args.name = str(target_path.parts[-1])
+
+    if not args.also:
+        with progress_line() as progress:
+            result = t.store(
+                args.name,
+                args.target_path,
+                dedup=args.dedup,
+                reflink=args.reflink,
+                progress=progress,
+                stores=args.stores,
+                placement=args.placement,
+            )
+        print_results({args.name: None}, output, dedup=result, quiet=True)
+        return
+
+    targets = {args.name: args.target_path}
+    for path in args.also:
+        name = str(Path(path).parts[-1])
+        if name in targets:
+            raise TransposeError(f"Duplicate entry name in store: '{name}'")
+        targets[name] = path
+
+    with progress_line() as progress:
+        results = t.store_many(
+            targets,
+            jobs=args.jobs,
+            reflink=args.reflink,
+            progress=progress,
+            stores=args.stores,
+            placement=args.placement,
+        )
+    print_results(results, output, dedup=t.dedup() if args.dedup else None)
+
+
+def run_apply_all(
+    t: Transpose, force: bool = False, jobs: int = 1, output: str = "table"
+) -> None:
     """
     Loop over the entries and recreate the symlinks to the store location
 
@@ -62,20 +264,364 @@ def run_apply_all(t: Transpose, force: bool = False) -> None:
     Args:
         t: An instance of Transpose
         force: If enabled and path already exists, move the path to '{path}.backup' first
+        jobs: The number of entries to apply concurrently (results still print in order)
+        output: The output format, see OUTPUT_FORMATS
 
     Returns:
         None
     """
-    for entry_name in sorted(t.config.entries):
+
+    def apply(entry_name: str) -> Optional[str]:
         try:
             t.apply(entry_name, force)
-            print(f"\t{entry_name:<30}: success")
+            return None
         except TransposeError as e:
-            print(f"\t{entry_name:<30}: {e}")
+            return str(e)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    entry_names = sorted(t.config.entries)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        with Output(output).records() as write:
+            for entry_name, error in zip(entry_names, executor.map(apply, entry_names)):
+                write(
+                    {"name": entry_name, "error": error},
+                    f"\t{entry_name:<30}: {error or 'success'}",
+                )
+
+
+def run_gc(
+    t: Transpose,
+    dry_run: bool = False,
+    jobs: int = DEFAULT_WORKERS,
+    output: str = "table",
+) -> None:
+    """
+    Print, and unless dry_run remove, the orphans in the store path with their sizes
+
+    Args:
+        t: An instance of Transpose
+        dry_run: Only report the orphans
+        jobs: The number of directories to measure concurrently
+        output: The output format, see OUTPUT_FORMATS
+
+    Returns:
+        None
+    """
+    orphans = t.gc(dry_run=dry_run, jobs=jobs)
+
+    action = "Would reclaim" if dry_run else "Reclaimed"
+    lines = [f"\t{name:<30} {format_size(size)}" for name, size in orphans.items()]
+    lines.append(
+        f"{action} {format_size(sum(orphans.values()))} from {len(orphans)} orphan(s)"
+    )
+    Output(output).write(
+        {
+            "orphans": [{"name": name, "size": size} for name, size in orphans.items()],
+            "reclaimed": sum(orphans.values()),
+            "dry_run": dry_run,
+        },
+        "\n".join(lines),
+    )
+
+
+def run_status(
+    t: Transpose, output: str = "table", jobs: int = DEFAULT_WORKERS
+) -> None:
+    """
+    Print the health of every entry, and any orphans in the store path
+
+    Args:
+        t: An instance of Transpose
+        output: The output format, see OUTPUT_FORMATS
+        jobs: The number of entry paths to check concurrently
+
+    Returns:
+        None
+    """
+    statuses = t.check(jobs=jobs)
+
+    with Output(output).records() as write:
+        for status in statuses:
+            write(
+                asdict(status),
+                f"\t{status.name:<30} {status.status:<14} {status.path or ''}",
+            )
+
+
+def run_watch(
+    t: Transpose,
+    force: bool = False,
+    debounce: float = None,
+    output: str = "table",
+) -> None:
+    """
+    Watch the entries until interrupted, printing each one repaired or drifted from the store
+
+    Args:
+        t: An instance of Transpose
+        force: Also repair entries whose path was replaced by a real file or directory
+        debounce: The seconds without changes to wait before checking (default: 0.5)
+        output: The output format, see OUTPUT_FORMATS
+
+    Returns:
+        None
+    """
+    from .watch import DEBOUNCE_SECONDS, EntryWatcher
+
+    watcher = EntryWatcher(t, force=force, debounce=debounce or DEBOUNCE_SECONDS)
+    with Output(output).records() as write:
+
+        def report(status, outcome: str) -> None:
+            write(
+                {**asdict(status), "outcome": outcome},
+                f"\t{status.name:<30} {status.status:<14} {outcome}",
+            )
+
+        try:
+            watcher.run(report)
+        except KeyboardInterrupt:
+            pass
+
+
+class Output:
+    """
+    Prints the results of a command for humans (table) or as JSON (json or ndjson)
+
+    Lists of records, such as the entries of 'config list', are printed one at a time as
+    they're produced, in a JSON array or one JSON object per line, so large stores can be
+    piped into tools such as jq without being held in memory
+    """
+
+    format: str
+
+    def __init__(self, format: str = "table") -> None:
+        self.format = format
+
+    def write(self, data: dict, text: Optional[str] = None) -> None:
+        """
+        Print a single result, as its text for tables (or nothing if there's no text)
+        """
+        if self.format != "table":
+            indent = 2 if self.format == "json" else None
+            print(json.dumps(data, indent=indent, default=str))
+        elif text is not None:
+            print(text)
+
+    @contextmanager
+    def records(self):
+        """
+        Print a list of records as they're written
+
+        Yields:
+            A function taking each record and its text for tables
+        """
+
+        first = True
+
+        def write(data: dict, text: str) -> None:
+            nonlocal first
+            if self.format == "table":
+                print(text, flush=True)
+            elif self.format == "ndjson":
+                print(json.dumps(data, default=str), flush=True)
+            else:
+                separator = "" if first else ",\n"
+                print(separator + json.dumps(data, default=str), end="", flush=True)
+            first = False
+
+        if self.format == "json":
+            print("[")
+        try:
+            yield write
+        finally:
+            if self.format == "json":
+                print("]" if first else "\n]")
+
+
+@contextmanager
+def progress_line(stream=None):
+    """
+    Provide a MoveProgress callback that redraws the progress of a copy on one line
+
+    Yields None instead if the stream (default: stderr) isn't a terminal, so output that
+    is redirected or piped isn't filled with progress updates
+    """
+    stream = stream or sys.stderr
+    if not stream.isatty():
+        yield None
+        return
+
+    drawn = False
+
+    def draw(progress: MoveProgress) -> None:
+        nonlocal drawn
+        # \x1b[K clears the rest of the line
+        stream.write(f"\r{format_progress(progress)}\x1b[K")
+        stream.flush()
+        drawn = True
+
+    try:
+        yield draw
+    finally:
+        if drawn:
+            stream.write("\n")
+
+
+def format_progress(progress: MoveProgress) -> str:
+    """
+    Format the progress of a copy, such as 'zsh: 1.0 GiB / 4.0 GiB (25%), 100.0 MiB/s, ...'
+    """
+    percent = (
+        progress.bytes_copied / progress.total_bytes * 100
+        if progress.total_bytes
+        else 100
+    )
+    return (
+        f"{progress.source.name}: {format_size(progress.bytes_copied)} / "
+        f"{format_size(progress.total_bytes)} ({percent:.0f}%), "
+        f"{format_size(progress.bytes_per_second)}/s, "
+        f"{progress.files_per_second:.0f} files/s, ETA {format_duration(progress.eta)}"
+    )
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Format a number of seconds for humans, such as 1h 02m or 6m 50s
+    """
+    if seconds is None:
+        return "--"
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+def format_size(size: int) -> str:
+    """
+    Format a number of bytes for humans, such as 1.5 GiB
+    """
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+def print_dedup(result: DedupResult, output: Output = None) -> None:
+    """
+    Print how many files were replaced by a deduplication, and the space saved
+    """
+    (output or Output()).write(
+        asdict(result),
+        f"Deduplicated {result.files} file(s), reclaimed {format_size(result.reclaimed)}",
+    )
+
+
+def print_results(
+    results: dict,
+    output: Output = None,
+    dedup: DedupResult = None,
+    quiet: bool = False,
+) -> None:
+    """
+    Print the outcome of each entry of a batch operation, such as Transpose.store_many
+
+    Args:
+        results: The entry names mapped to None on success or the error encountered
+        output: How to print them (default: a table)
+        dedup: The result of deduplicating the store afterwards, if it was
+        quiet: Only print the outcomes for JSON, such as for a single entry
+
+    Returns:
+        None
+    """
+    output = output or Output()
+    if output.format != "table":
+        output.write(
+            {
+                "entries": [
+                    {"name": name, "error": error} for name, error in results.items()
+                ],
+                "dedup": asdict(dedup) if dedup else None,
+            }
+        )
+        return
+
+    if not quiet:
+        for name, error in results.items():
+            print(f"\t{name:<30}: {error or 'success'}")
+    if dedup:
+        print_dedup(dedup)
+
+
+class VersionAction(argparse.Action):
+    """
+    Like action="version", but only looks up the installed version when it's requested
+    """
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, **kwargs) -> None:
+        super().__init__(
+            option_strings,
+            dest=dest,
+            default=argparse.SUPPRESS,
+            nargs=0,
+            help="show program's version number and exit",
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None) -> None:
+        print(f"Transpose {get_version()}")
+        parser.exit()
+
+
+def positive_int(value: str) -> int:
+    """
+    argparse type for options such as --jobs which must be at least 1
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: '{value}'")
+    return number
 
 
 def parse_arguments(args=None):
     base_parser = argparse.ArgumentParser(add_help=False)
+    # Accepted before or after the action, so the default is set by parse_arguments
+    base_parser.add_argument(
+        "--output",
+        dest="output",
+        choices=OUTPUT_FORMATS,
+        default=argparse.SUPPRESS,
+        help="The output format, json and ndjson being for scripts (default: table)",
+    )
+
+    jobs_parser = argparse.ArgumentParser(add_help=False)
+    jobs_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=1,
+        help="The number of entries to process concurrently (default: %(default)s)",
+    )
+
+    reflink_parser = argparse.ArgumentParser(add_help=False)
+    reflink_parser.add_argument(
+        "--reflink",
+        dest="reflink",
+        choices=REFLINK_MODES,
+        default="auto",
+        help="Clone files copy-on-write when moving across devices, such as btrfs subvolumes (default: %(default)s)",
+    )
 
     parser = argparse.ArgumentParser(
         parents=[base_parser],
@@ -83,7 +629,7 @@ def parse_arguments(args=None):
         Move and symlink a path for easy, central management
         """,
     )
-    parser.add_argument("--version", action="version", version=f"Transpose {version}")
+    parser.add_argument("--version", action=VersionAction)
     parser.add_argument(
         "-s",
         "--store-path",
@@ -92,6 +638,13 @@ def parse_arguments(args=None):
         default=DEFAULT_STORE_PATH,
         help="The location to store the moved entities (default: %(default)s)",
     )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="verbose",
+        help="Report how each path was moved (rename or copy) and how long it took",
+        action="store_true",
+    )
 
     subparsers = parser.add_subparsers(
         help="Transpose Action", dest="action", required=True
@@ -116,7 +669,7 @@ def parse_arguments(args=None):
     apply_all_parser = subparsers.add_parser(
         "apply-all",
         help="Recreate the symlink for all entities",
-        parents=[base_parser],
+        parents=[base_parser, jobs_parser],
     )
     apply_all_parser.add_argument(
         "--force",
@@ -128,11 +681,12 @@ def parse_arguments(args=None):
     restore_parser = subparsers.add_parser(
         "restore",
         help="Move a transposed directory back to it's original location, based on the cachefile",
-        parents=[base_parser],
+        parents=[base_parser, jobs_parser, reflink_parser],
     )
     restore_parser.add_argument(
         "name",
-        help="The name of the stored entity to restore",
+        nargs="+",
+        help="The name(s) of the stored entities to restore",
     )
     restore_parser.add_argument(
         "--force",
@@ -144,7 +698,7 @@ def parse_arguments(args=None):
     store_parser = subparsers.add_parser(
         "store",
         help="Move target and create symlink in place",
-        parents=[base_parser],
+        parents=[base_parser, jobs_parser, reflink_parser],
     )
     store_parser.add_argument(
         "target_path",
@@ -156,6 +710,205 @@ def parse_arguments(args=None):
         default=None,
         help="The name of the directory that will be created in the store path (default: target_path)",
     )
+    store_parser.add_argument(
+        "--also",
+        dest="also",
+        nargs="+",
+        default=[],
+        metavar="PATH",
+        help="Additional paths to store in the same run, named after their last path component",
+    )
+    store_parser.add_argument(
+        "--dedup",
+        dest="dedup",
+        help="Afterwards, replace identical files in the store with copy-on-write clones (see dedup)",
+        action="store_true",
+    )
+    store_parser.add_argument(
+        "--secondary",
+        dest="stores",
+        action="append",
+        metavar="PATH",
+        help="A secondary store path, such as on another disk, to place the entities in instead (repeatable)",
+    )
+    store_parser.add_argument(
+        "--placement",
+        dest="placement",
+        choices=PLACEMENT_POLICIES,
+        default="free-space",
+        help="How to choose between the store path and secondary ones (default: %(default)s)",
+    )
+
+    dedup_parser = subparsers.add_parser(
+        "dedup",
+        help="Replace identical files across the stored entities with copy-on-write clones of one copy",
+        parents=[base_parser],
+    )
+    dedup_parser.add_argument(
+        "--hardlink",
+        dest="hardlink",
+        action="store_true",
+        help="Use hardlinks instead, which works on any filesystem, but the entities then share "
+        "one inode, so writing to the file in one changes it in the others",
+    )
+    dedup_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=DEFAULT_WORKERS,
+        help="The number of files to hash concurrently (default: %(default)s)",
+    )
+
+    freeze_parser = subparsers.add_parser(
+        "freeze",
+        help="Pack a rarely used entity into a compressed archive in the store path (apply or thaw to unpack it)",
+        parents=[base_parser],
+    )
+    freeze_parser.add_argument(
+        "name",
+        help="The name of the stored entity to freeze",
+    )
+    freeze_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=DEFAULT_WORKERS,
+        help="The number of chunks to compress concurrently (default: %(default)s)",
+    )
+
+    thaw_parser = subparsers.add_parser(
+        "thaw",
+        help="Unpack a frozen entity back into the store path",
+        parents=[base_parser],
+    )
+    thaw_parser.add_argument(
+        "name",
+        help="The name of the frozen entity",
+    )
+
+    hydrate_parser = subparsers.add_parser(
+        "hydrate",
+        help="Extract only the paths matching a glob from a frozen entity, leaving it frozen",
+        parents=[base_parser],
+    )
+    hydrate_parser.add_argument(
+        "name",
+        help="The name of the frozen entity",
+    )
+    hydrate_parser.add_argument(
+        "pattern",
+        help="A glob relative to the stored path, such as '*.conf' (quote it for the shell)",
+    )
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot",
+        help="Snapshot the store path, hardlinking files unchanged since the last snapshot",
+        parents=[base_parser],
+    )
+    snapshot_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=DEFAULT_WORKERS,
+        help="The number of files to copy concurrently (default: %(default)s)",
+    )
+
+    sync_parser = subparsers.add_parser(
+        "sync",
+        help="Mirror the store path to a backup directory, copying only what changed since the last sync",
+        parents=[base_parser],
+    )
+    sync_parser.add_argument(
+        "destination",
+        help="The directory to mirror the store path into",
+    )
+    sync_parser.add_argument(
+        "--checksum",
+        dest="checksum",
+        help="Also compare the contents of files whose size and modification time are unchanged",
+        action="store_true",
+    )
+    sync_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=DEFAULT_WORKERS,
+        help="The number of files to copy concurrently (default: %(default)s)",
+    )
+
+    gc_parser = subparsers.add_parser(
+        "gc",
+        help="Remove paths in the store which have no entity in the config (orphans)",
+        parents=[base_parser],
+    )
+    gc_parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        help="Only list the orphans and their sizes",
+        action="store_true",
+    )
+    gc_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=DEFAULT_WORKERS,
+        help="The number of directories to measure concurrently (default: %(default)s)",
+    )
+
+    subparsers.add_parser(
+        "serve",
+        help="Keep the store loaded and run the commands of other transpose invocations, making each much faster",
+        parents=[base_parser],
+    )
+
+    status_parser = subparsers.add_parser(
+        "status",
+        help="Check the symlink and stored path of every entity and list orphans in the store",
+        parents=[base_parser],
+    )
+    status_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=positive_int,
+        default=DEFAULT_WORKERS,
+        help="The number of entity paths to check concurrently (default: %(default)s)",
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Watch the entity paths and recreate their symlinks as soon as they're removed",
+        parents=[base_parser],
+    )
+    watch_parser.add_argument(
+        "--force",
+        dest="force",
+        help="Also repair paths replaced by a real file or directory, moving it to <path>.backup",
+        action="store_true",
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        dest="debounce",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Wait until paths stop changing for this long before checking them (default: 0.5)",
+    )
+
+    which_parser = subparsers.add_parser(
+        "which",
+        help="Show which entry manages a path (the entry path itself or a parent of it)",
+        parents=[base_parser],
+    )
+    which_parser.add_argument(
+        "path",
+        help="The path to look up",
+    )
 
     config_parser = subparsers.add_parser(
         "config",
@@ -244,7 +997,7 @@ def parse_arguments(args=None):
         help="The value to updated in the config",
     )
 
-    return parser.parse_args(args)
+    return parser.parse_args(args, argparse.Namespace(output="table"))
 
 
 if __name__ == "__main__":
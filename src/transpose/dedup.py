@@ -0,0 +1,330 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import json
+import logging
+import os
+import shutil
+import stat
+
+from .utils import DEFAULT_WORKERS, ReflinkError, copy_file, write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Smaller files would free at most a block or two, not worth reading
+DEDUP_MIN_SIZE = 4096
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class DedupResult:
+    files: int  # Files replaced by a clone of (or hardlink to) an identical file
+    reclaimed: int  # Bytes
+
+
+class HashCache:
+    """
+    Content hashes of files keyed on device, inode, mtime and size, persisted as JSON
+
+    A file is only read again once it has been modified or replaced. Hashes of files
+    which weren't seen during the last run are dropped when saving.
+
+    Files replaced by a clone also record the file the data was cloned from (or its own
+    source), so they aren't cloned again while both are unchanged.
+    """
+
+    path: Path
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._seen = {}
+        self._seen_clones = {}
+
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self._hashes = data["hashes"]
+            self._clones = data["clones"]
+        except (FileNotFoundError, json.decoder.JSONDecodeError, KeyError, TypeError):
+            # A missing or damaged cache only costs rehashing
+            self._hashes = {}
+            self._clones = {}
+
+    def get(self, st: os.stat_result) -> str:
+        key = self._key(st)
+        digest = self._seen.get(key) or self._hashes.get(key)
+        if digest:
+            self._seen[key] = digest
+        return digest
+
+    def set(self, st: os.stat_result, digest: str) -> None:
+        self._seen[self._key(st)] = digest
+
+    def shared(self, st: os.stat_result, other: os.stat_result) -> bool:
+        """
+        Check if two files share their data, cloned from the same file and unchanged since
+        """
+        return self._source(st) == self._source(other)
+
+    def set_clone(self, st: os.stat_result, source: os.stat_result) -> None:
+        self._seen_clones[self._key(st)] = self._source(source)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            self.path, json.dumps({"hashes": self._seen, "clones": self._seen_clones})
+        )
+        self._hashes = dict(self._seen)
+        self._clones = dict(self._seen_clones)
+
+    def _source(self, st: os.stat_result) -> str:
+        """
+        Get the key of the file the data of a file was first cloned from, or its own key
+        """
+        key = self._key(st)
+        source = self._seen_clones.get(key) or self._clones.get(key)
+        if source:
+            self._seen_clones[key] = source
+        return source or key
+
+    @staticmethod
+    def _key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def deduplicate(
+    roots: List[Path],
+    cache: HashCache = None,
+    workers: int = None,
+    hardlink: bool = False,
+) -> DedupResult:
+    """
+    Replace identical files under the roots with copy-on-write clones of a single copy
+
+    Only files sharing a size (and device, mode and owner) with another file are hashed,
+    in a pool of workers. Each duplicate is replaced atomically, and skipped if it changed
+    after being hashed. A clone (a reflink, such as on btrfs or XFS) shares the blocks of
+    the copy until either is written to, so the files stay independent. Filesystems which
+    can't clone files are skipped with a warning.
+
+    With hardlink, duplicates are replaced with hardlinks instead, which works on any
+    filesystem. Since hardlinks share one inode, writing to one of the files in place
+    changes all of them.
+
+    Args:
+        roots: The files or directories to deduplicate between
+        cache: Hashes from previous runs, updated with the files hashed now
+        workers: The number of files to hash concurrently (default: DEFAULT_WORKERS)
+        hardlink: Replace duplicates with hardlinks instead of clones
+
+    Returns:
+        DedupResult with the number of files replaced and the bytes reclaimed
+    """
+    cache = cache or HashCache(os.devnull)
+    inodes = _collect_inodes(roots)
+
+    by_size = {}
+    for key, (paths, st) in inodes.items():
+        by_size.setdefault(_identity(st), []).append(key)
+    candidates = [key for keys in by_size.values() if len(keys) > 1 for key in keys]
+
+    def digest(key: Tuple[int, int]) -> Optional[str]:
+        paths, st = inodes[key]
+        digest = cache.get(st)
+        if digest is None:
+            try:
+                digest = hash_file(paths[0])
+            except OSError as e:  # Such as a file removed or unreadable since the walk
+                logger.warning(f"Unable to hash file, skipping: {e}")
+                return None
+            cache.set(st, digest)
+        return digest
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS) as executor:
+        digests = dict(zip(candidates, executor.map(digest, candidates)))
+
+    groups = {}
+    for key in candidates:
+        if digests[key] is not None:
+            groups.setdefault((_identity(inodes[key][1]), digests[key]), []).append(key)
+
+    result = DedupResult(files=0, reclaimed=0)
+    unsupported = set()  # Devices whose filesystem can't clone files
+    for keys in groups.values():
+        # Keep the inode with the most links, so the fewest paths are replaced
+        keys.sort(key=lambda key: (-len(inodes[key][0]), inodes[key][0][0]))
+        keep, keep_st = inodes[keys[0]][0][0], inodes[keys[0]][1]
+        for key in keys[1:]:
+            paths, st = inodes[key]
+            if hardlink:
+                replaced = [
+                    path for path in paths if _replace_with_link(keep, path, st)
+                ]
+            elif st.st_dev in unsupported or cache.shared(st, keep_st):
+                continue
+            else:
+                try:
+                    replaced = _replace_with_clone(keep, paths, st)
+                except ReflinkError as e:
+                    logger.warning(
+                        f"Unable to clone files on the filesystem of '{keep}', skipping "
+                        f"its duplicates (hardlink them instead to deduplicate): {e}"
+                    )
+                    unsupported.add(st.st_dev)
+                    continue
+                if replaced:
+                    clone_st = os.lstat(replaced[0])
+                    cache.set(clone_st, digests[key])
+                    cache.set_clone(clone_st, keep_st)
+
+            result.files += len(replaced)
+            if replaced and len(replaced) == st.st_nlink:  # No other links remain
+                result.reclaimed += getattr(st, "st_blocks", 0) * 512 or st.st_size
+
+    logger.info(
+        f"Deduplicated {result.files} file(s), reclaiming {result.reclaimed} bytes"
+    )
+    return result
+
+
+def hash_file(path: Path) -> str:
+    """
+    Hash the contents of a file in chunks
+    """
+    import hashlib
+
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+def _collect_inodes(roots: List[Path]) -> Dict[Tuple[int, int], tuple]:
+    """
+    Walk the roots for regular files worth deduplicating, grouping paths by inode
+
+    Returns:
+        (device, inode) mapped to (paths, stat) for each file
+    """
+    inodes = {}
+
+    def add(path: str, st: os.stat_result) -> None:
+        if stat.S_ISREG(st.st_mode) and st.st_size >= DEDUP_MIN_SIZE:
+            inodes.setdefault((st.st_dev, st.st_ino), ([], st))[0].append(path)
+
+    stack = []
+    for root in roots:
+        st = os.lstat(root)
+        if stat.S_ISDIR(st.st_mode):
+            stack.append(str(root))
+        else:
+            add(str(root), st)
+
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    add(entry.path, entry.stat(follow_symlinks=False))
+
+    return inodes
+
+
+def _identity(st: os.stat_result) -> tuple:
+    """
+    Files can only share an inode if these match, besides their contents
+    """
+    return (st.st_dev, st.st_size, stat.S_IMODE(st.st_mode), st.st_uid, st.st_gid)
+
+
+def _replace_with_clone(source: str, paths: List[str], st: os.stat_result) -> List[str]:
+    """
+    Atomically replace the paths of an inode with a clone of source, unless they changed
+    since st
+
+    The clone keeps the metadata of the file it replaces, and the paths stay hardlinked to
+    each other (but not to source).
+
+    Returns:
+        The paths replaced
+
+    Raises:
+        ReflinkError: If the filesystem can't clone files
+    """
+    path = paths[0]
+    try:
+        if not _unchanged(path, st):
+            return []
+
+        temp_path = _temp_path(path)
+        try:
+            copy_file(source, temp_path, reflink="always")
+            temp_st = os.lstat(temp_path)
+            if (temp_st.st_uid, temp_st.st_gid) != (st.st_uid, st.st_gid):
+                os.chown(temp_path, st.st_uid, st.st_gid)
+            shutil.copystat(path, temp_path, follow_symlinks=False)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.lexists(temp_path):
+                os.unlink(temp_path)
+            raise
+    except ReflinkError:
+        raise
+    except OSError as e:  # Such as ENOSPC, or EPERM changing the owner
+        logger.warning(f"Unable to clone '{source}' to '{path}', skipping: {e}")
+        return []
+
+    return [path] + [link for link in paths[1:] if _replace_with_link(path, link, st)]
+
+
+def _replace_with_link(source: str, path: str, st: os.stat_result) -> bool:
+    """
+    Atomically replace path with a hardlink to source, unless path changed since st
+
+    Returns:
+        True if the path was replaced
+    """
+    try:
+        if not _unchanged(path, st):
+            return False
+
+        temp_path = _temp_path(path)
+        os.link(source, temp_path)
+        try:
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError as e:  # Such as EMLINK, too many links to source
+        logger.warning(f"Unable to link '{path}' -> '{source}', skipping: {e}")
+        return False
+
+    return True
+
+
+def _unchanged(path: str, st: os.stat_result) -> bool:
+    """
+    Check that a file is still the one hashed, logging a warning if it isn't
+    """
+    current = os.lstat(path)
+    if (current.st_ino, current.st_mtime_ns, current.st_size) != (
+        st.st_ino,
+        st.st_mtime_ns,
+        st.st_size,
+    ):
+        logger.warning(f"File changed since it was hashed, skipping: '{path}'")
+        return False
+    return True
+
+
+def _temp_path(path: str) -> str:
+    return os.path.join(
+        os.path.dirname(path), f".{os.path.basename(path)}.{os.urandom(4).hex()}"
+    )
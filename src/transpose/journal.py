@@ -0,0 +1,123 @@
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import json
+import os
+import threading
+
+from .exceptions import TransposeError
+from .lock import FileLock, lock_path
+from .utils import read_jsonl, write_atomic
+
+
+@dataclass
+class JournalRecord:
+    id: str
+    op: str  # "store" or "restore"
+    name: str
+    path: str
+    store: Optional[str] = None  # The secondary store path of the entry, see stores
+
+
+class TransposeJournal:
+    """
+    Append-only log of store/restore operations that have started but not completed
+
+    Each operation appends a 'begin' line before touching the filesystem and a 'done'
+    line once the config has been saved, so an interrupted operation can be found on
+    the next startup without scanning the store
+    """
+
+    path: Path
+    # Shared while operations run, exclusive to recover or collect garbage
+    lock: FileLock
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.lock = FileLock(lock_path(self.path))
+        self._lock = threading.Lock()
+
+    def begin(
+        self, op: str, name: str, path: str, store: Optional[str] = None
+    ) -> JournalRecord:
+        """
+        Record the start of an operation, synced to disk before returning
+
+        Args:
+            op: The operation being run ("store" or "restore")
+            name: The name of the entry
+            path: The original path of the entry
+            store: The secondary store path of the entry, if it isn't in the store path
+
+        Returns:
+            JournalRecord
+        """
+        record = JournalRecord(
+            id=os.urandom(16).hex(), op=op, name=name, path=str(path), store=store
+        )
+        self._append({"state": "begin", **asdict(record)})
+        return record
+
+    def commit(self, record: JournalRecord) -> None:
+        """
+        Record that an operation has completed (or was resolved during recovery)
+
+        Args:
+            record: The record returned by begin
+
+        Returns:
+            None
+        """
+        self._append({"state": "done", "id": record.id})
+
+    def pending(self) -> List[JournalRecord]:
+        """
+        Get the operations which were started but never committed, in the order they began
+
+        Returns:
+            List[JournalRecord]
+        """
+        records = {}
+        # A torn line was never fully written, so the state change it records never happened
+        for item in read_jsonl(self.path):
+            try:
+                if item["state"] == "begin":
+                    records[item["id"]] = JournalRecord(
+                        id=item["id"],
+                        op=item["op"],
+                        name=item["name"],
+                        path=item["path"],
+                        store=item.get("store"),
+                    )
+                else:
+                    records.pop(item["id"], None)
+            except (KeyError, TypeError) as e:
+                raise TransposeError(f"Unrecognized Transpose journal format: {e}")
+
+        return list(records.values())
+
+    def reset(self, records: List[JournalRecord] = None) -> None:
+        """
+        Replace the journal with only the given pending records (or empty it)
+
+        Args:
+            records: Records which are still unresolved
+
+        Returns:
+            None
+        """
+        lines = [
+            json.dumps({"state": "begin", **asdict(record)}) + "\n"
+            for record in records or []
+        ]
+        with self._lock:
+            write_atomic(self.path, "".join(lines))
+
+    def _append(self, item: dict) -> None:
+        line = json.dumps(item) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import errno
+import os
+
+# Errors creating the lock file which are fine for readers, see FileLock._acquire
+_UNLOCKABLE_ERRNOS = {errno.ENOENT, errno.EACCES, errno.EROFS}
+
+
+class FileLock:
+    """
+    Advisory lock shared between transpose processes, using flock on a lock file
+
+    Any number of holders can share the lock (such as readers) while an exclusive holder
+    (such as a writer) has it to itself. flock locks belong to the open file, so two
+    FileLock instances within one process also exclude each other.
+    """
+
+    path: Path
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+
+    @contextmanager
+    def shared(self, blocking: bool = True) -> Iterator[bool]:
+        """
+        Hold the lock alongside other shared holders
+
+        Yields:
+            True once acquired, or False if not blocking and it is held exclusively
+        """
+        import fcntl
+
+        with self._acquire(fcntl.LOCK_SH, blocking) as acquired:
+            yield acquired
+
+    @contextmanager
+    def exclusive(self, blocking: bool = True) -> Iterator[bool]:
+        """
+        Hold the lock alone
+
+        Yields:
+            True once acquired, or False if not blocking and it is held by anyone else
+        """
+        import fcntl
+
+        with self._acquire(fcntl.LOCK_EX, blocking) as acquired:
+            yield acquired
+
+    @contextmanager
+    def _acquire(self, operation: int, blocking: bool) -> Iterator[bool]:
+        import fcntl
+
+        try:
+            fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            if operation == fcntl.LOCK_EX or e.errno not in _UNLOCKABLE_ERRNOS:
+                raise
+            # The store doesn't exist yet or is read-only, so there are no writers to wait for
+            yield True
+            return
+
+        try:
+            try:
+                fcntl.flock(fd, operation | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+
+            yield True
+        finally:
+            os.close(fd)  # Releases the lock
+
+
+def lock_path(path: str) -> Path:
+    """
+    Get the path of the lock file that protects a file, such as transpose.json.lock
+    """
+    path = Path(path)
+    return path.with_name(f"{path.name}.lock")
@@ -0,0 +1,174 @@
+from argparse import Namespace
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Callable
+
+import asyncio
+import io
+import json
+import logging
+import signal
+import threading
+
+from .client import is_serving, socket_path
+from .exceptions import TransposeError
+from .transpose import Transpose, TransposeConfig
+
+logger = logging.getLogger(__name__)
+
+
+class TransposeServer:
+    """
+    Daemon which keeps a Transpose instance in memory and runs commands for thin clients
+
+    Clients connect to a Unix socket in the store and send one JSON line per command,
+    {"args": {...}}, with the parsed command line arguments. Each is answered with a JSON
+    line, {"output": "...", "log": "...", "error": None}, holding what the command printed
+    and logged and the error which stopped it. Commands run one at a time, so writes to
+    the config are serialized.
+    """
+
+    config_path: Path
+    socket_path: Path
+    ready: threading.Event  # Set once accepting connections
+
+    def __init__(
+        self, config_path: str, handler: Callable[[Transpose, Namespace], None]
+    ) -> None:
+        """
+        Args:
+            config_path: The path of the config of the store to serve
+            handler: Runs a command with the Transpose instance, printing its output
+        """
+        self.config_path = Path(config_path)
+        self.socket_path = socket_path(config_path)
+        self.handler = handler
+        self.ready = threading.Event()
+        self._loop = None
+        self._stopped = None
+        self._transpose = None
+
+    def run(self) -> None:
+        """
+        Serve until interrupted or terminated
+        """
+
+        async def main() -> None:
+            loop = asyncio.get_running_loop()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, self.stop)
+            await self.serve()
+
+        asyncio.run(main())
+
+    async def serve(self) -> None:
+        """
+        Load the store and serve commands until stop is called
+        """
+        if is_serving(self.config_path):
+            raise TransposeError(f"Transpose is already serving '{self.socket_path}'")
+
+        self._transpose = Transpose(self.config_path)
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        lock = asyncio.Lock()
+
+        async def handle(reader, writer) -> None:
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+
+                    async with lock:
+                        response = await self._loop.run_in_executor(
+                            None, self._execute, line
+                        )
+                    writer.write((json.dumps(response) + "\n").encode())
+                    await writer.drain()
+            except ConnectionError:
+                pass  # The client went away
+            finally:
+                writer.close()
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():  # Left behind by a daemon that was killed
+            self.socket_path.unlink()
+
+        try:
+            server = await asyncio.start_unix_server(handle, path=str(self.socket_path))
+        except OSError as e:
+            raise TransposeError(f"Unable to listen on '{self.socket_path}': {e}")
+
+        try:
+            async with server:
+                logger.info(f"Serving '{self.config_path}' on '{self.socket_path}'")
+                self.ready.set()
+                await self._stopped.wait()
+        finally:
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+
+    def stop(self) -> None:
+        """
+        Stop serving, safe to call from any thread
+        """
+        self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def _execute(self, line: bytes) -> dict:
+        """
+        Run a command from a client, capturing what it prints
+        """
+        try:
+            args = Namespace(**json.loads(line)["args"])
+        except (json.decoder.JSONDecodeError, KeyError, TypeError) as e:
+            return {"output": "", "log": "", "error": f"Invalid request: {e}"}
+
+        t = self._transpose
+        output, log = io.StringIO(), io.StringIO()
+        level = logging.INFO if getattr(args, "verbose", False) else logging.WARNING
+        error = None
+        try:
+            if t.config.backend.is_stale(t.config_path):
+                # Saved by a transpose command that didn't go through the daemon
+                self._reload()
+
+            # stderr is captured too, so progress isn't drawn on the daemon's terminal
+            with redirect_stdout(output), redirect_stderr(io.StringIO()):
+                with capture_logs(log, level):
+                    self.handler(t, args)
+        except Exception as e:
+            error = str(e)
+            if not isinstance(e, TransposeError):
+                logger.exception(f"Unexpected error running {vars(args)}")
+                error = f"Unexpected error: {e}"
+            # A failed command may leave changes in memory which were never saved
+            self._reload()
+
+        return {"output": output.getvalue(), "log": log.getvalue(), "error": error}
+
+    def _reload(self) -> None:
+        t = self._transpose
+        t.config = TransposeConfig.load(t.config_path, t.config.backend.name)
+
+
+@contextmanager
+def capture_logs(stream, level: int):
+    """
+    Write what transpose logs to a stream rather than the daemon's handlers, for the
+    client that ran the command
+    """
+    package = logging.getLogger(__package__)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    saved = package.level, package.propagate
+
+    package.addHandler(handler)
+    package.setLevel(level)
+    package.propagate = False
+    try:
+        yield
+    finally:
+        package.removeHandler(handler)
+        package.setLevel(saved[0])
+        package.propagate = saved[1]
@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import stat
+
+from .exceptions import TransposeError
+from .utils import DEFAULT_WORKERS, copy_file, fsync_directory, write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are named by when they were taken, so they sort in order
+SNAPSHOT_NAME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+
+@dataclass
+class SnapshotResult:
+    name: str  # Of the snapshot's directory
+    path: Path
+    files: int
+    linked: int  # Files unchanged since the previous snapshot, hardlinked to it
+    copied: int  # Files new or changed since the previous snapshot
+    copied_bytes: int
+
+
+def take_snapshot(
+    source: Path,
+    names: List[str],
+    snapshots_path: Path,
+    workers: int = None,
+    now: datetime.datetime = None,
+) -> SnapshotResult:
+    """
+    Snapshot paths in a directory, hardlinking files unchanged since the previous snapshot
+
+    Like rsync's --link-dest: a file whose size and mtime match the manifest of the
+    previous snapshot is hardlinked to its copy there, and only new or changed files are
+    copied (as reflinks where supported), in a pool of workers. Files hardlinked to each
+    other in the source are hardlinked in the snapshot too.
+
+    The snapshot is built in a temporary directory and its manifest written before it's
+    renamed into place, so an interrupted snapshot is never used as the previous one.
+
+    Args:
+        source: The directory holding the paths
+        names: The files and directories in source to snapshot
+        snapshots_path: The directory of the snapshots, created if missing
+        workers: The number of files to copy concurrently (default: DEFAULT_WORKERS)
+        now: When the snapshot is taken, which names it (default: the current time)
+
+    Returns:
+        SnapshotResult
+    """
+    snapshots_path.mkdir(parents=True, exist_ok=True)
+    for name in os.listdir(snapshots_path):  # Left by an interrupted snapshot
+        if name.startswith(".") and name.endswith(".partial"):
+            shutil.rmtree(snapshots_path.joinpath(name))
+
+    snapshots = list_snapshots(snapshots_path)
+    previous = snapshots[-1] if snapshots else None
+    manifest = _load_manifest(snapshots_path, previous) if previous else {}
+
+    name = (now or datetime.datetime.now(datetime.timezone.utc)).strftime(
+        SNAPSHOT_NAME_FORMAT
+    )
+    if snapshots and name <= snapshots[-1]:
+        raise TransposeError(
+            f"A snapshot was already taken at or after '{name}': '{snapshots[-1]}'"
+        )
+
+    temp_path = snapshots_path.joinpath(f".{name}.partial")
+    temp_path.mkdir()
+    result = SnapshotResult(
+        name=name,
+        path=snapshots_path.joinpath(name),
+        files=0,
+        linked=0,
+        copied=0,
+        copied_bytes=0,
+    )
+
+    directories, files = _walk(source, names, temp_path)
+    new_manifest = {}
+    inodes = {}  # (device, inode) of files with several links mapped to their copy
+    copies = []
+    links = []  # Files sharing an inode with one before them, linked once it's copied
+    for relpath, st in files:
+        destination = temp_path.joinpath(relpath)
+        if stat.S_ISLNK(st.st_mode):
+            os.symlink(os.readlink(source.joinpath(relpath)), destination)
+            continue
+
+        result.files += 1
+        new_manifest[relpath] = [st.st_size, st.st_mtime_ns]
+        if st.st_nlink > 1:
+            linked_copy = inodes.setdefault((st.st_dev, st.st_ino), destination)
+            if linked_copy != destination:
+                links.append((linked_copy, destination))
+                continue
+
+        if manifest.get(relpath) == new_manifest[relpath] and _link(
+            snapshots_path.joinpath(previous, relpath), destination
+        ):
+            result.linked += 1
+        else:
+            copies.append((source.joinpath(relpath), destination, st))
+
+    _copy(copies, workers or DEFAULT_WORKERS)
+    result.copied = len(copies)
+    result.copied_bytes = sum(st.st_size for _, _, st in copies)
+    for linked_copy, destination in links:
+        os.link(linked_copy, destination)
+    result.linked += len(links)
+
+    # Last, since creating the files updated the directories' mtimes
+    for relpath in reversed(directories):
+        shutil.copystat(
+            source.joinpath(relpath), temp_path.joinpath(relpath), follow_symlinks=False
+        )
+
+    write_atomic(_manifest_path(snapshots_path, name), json.dumps(new_manifest))
+    os.rename(temp_path, result.path)
+    fsync_directory(snapshots_path)
+
+    logger.info(
+        f"Snapshot {name}: {result.copied} file(s) copied, {result.linked} linked"
+    )
+    return result
+
+
+def list_snapshots(snapshots_path: Path) -> List[str]:
+    """
+    Get the names of the complete snapshots in a directory, oldest first
+    """
+    try:
+        names = os.listdir(snapshots_path)
+    except FileNotFoundError:
+        return []
+
+    return sorted(
+        name
+        for name in names
+        if not name.startswith(".")
+        and snapshots_path.joinpath(name).is_dir()
+        and _manifest_path(snapshots_path, name).exists()
+    )
+
+
+def _walk(
+    source: Path, names: List[str], destination: Path
+) -> Tuple[List[str], List[Tuple[str, os.stat_result]]]:
+    """
+    Walk the named paths in source, creating their directories in destination
+
+    Returns:
+        The relative paths of the directories, parents first, and of everything else with
+        its stat
+    """
+    directories = []
+    files = []
+
+    def add(relpath: str, st: os.stat_result) -> None:
+        if stat.S_ISDIR(st.st_mode):
+            destination.joinpath(relpath).mkdir()
+            directories.append(relpath)
+            stack.append(relpath)
+        elif stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+            files.append((relpath, st))
+        else:
+            logger.warning(f"Not a file, directory or symlink, skipping: '{relpath}'")
+
+    stack = []
+    for name in sorted(names):
+        add(name, os.lstat(source.joinpath(name)))
+
+    while stack:
+        relpath = stack.pop()
+        with os.scandir(source.joinpath(relpath)) as it:
+            for entry in sorted(it, key=lambda entry: entry.name):
+                add(
+                    os.path.join(relpath, entry.name), entry.stat(follow_symlinks=False)
+                )
+
+    return directories, files
+
+
+def _link(previous: Path, destination: Path) -> bool:
+    """
+    Hardlink a file to its copy in the previous snapshot
+
+    Returns:
+        False if it can't be linked, such as a copy removed from the previous snapshot or
+        one with too many links already, so it's copied instead
+    """
+    try:
+        os.link(previous, destination)
+    except OSError as e:
+        logger.debug(f"Unable to link '{previous}', copying instead: {e}")
+        return False
+    return True
+
+
+def _copy(copies: List[Tuple[Path, Path, os.stat_result]], workers: int) -> None:
+    """
+    Copy the files in a pool of workers, as reflinks where supported
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def copy(item: Tuple[Path, Path, os.stat_result]) -> None:
+        source, destination, _ = item
+        copy_file(source, destination)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(copy, copies))
+
+
+def _load_manifest(snapshots_path: Path, name: str) -> Dict[str, list]:
+    try:
+        with open(_manifest_path(snapshots_path, name), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        return {}  # A missing or damaged manifest only costs copying everything again
+
+
+def _manifest_path(snapshots_path: Path, name: str) -> Path:
+    return snapshots_path.joinpath(f"{name}.json")
@@ -0,0 +1,179 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import os
+import shutil
+
+from .exceptions import TransposeError
+from .utils import CopyManifest, MoveProgress, MoveResult, move
+
+# Entries at least this large are placed on secondary stores by the size-class policy
+LARGE_ENTRY_SIZE = 1024 * 1024 * 1024
+# Other volumes are often slower disks, where many concurrent copies only cause seeking
+MOUNT_COPY_WORKERS = 4
+
+PLACEMENT_POLICIES = ("free-space", "size-class")
+
+
+class Store:
+    """
+    A directory holding stored entries, each at '{path}/{name}'
+
+    Moves in and out of the store go through move, so each kind of store can choose how
+    its entries are copied
+    """
+
+    path: Path
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+
+    def entry_path(self, name: str) -> Path:
+        return self.path.joinpath(name)
+
+    def free_space(self) -> int:
+        """
+        Get the bytes available on the volume of the store, even before it's created
+        """
+        path = self.path.absolute()
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return shutil.disk_usage(path).free
+
+    def move(
+        self,
+        source: Path,
+        destination: Path,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+        manifest: CopyManifest = None,
+    ) -> MoveResult:
+        raise NotImplementedError
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Store) and (
+            os.path.realpath(self.path) == os.path.realpath(other.path)
+        )
+
+    def __hash__(self) -> int:
+        return hash(os.path.realpath(self.path))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}('{self.path}')"
+
+
+class LocalStore(Store):
+    """
+    The store path holding the config, entries are renamed into it on the same device
+    and copied with the default pool of workers otherwise
+    """
+
+    def move(
+        self,
+        source: Path,
+        destination: Path,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+        manifest: CopyManifest = None,
+    ) -> MoveResult:
+        return move(
+            source=source,
+            destination=destination,
+            reflink=reflink,
+            progress=progress,
+            manifest=manifest,
+        )
+
+
+class MountStore(Store):
+    """
+    A secondary store path on another volume, such as a second disk
+
+    Copies to and from it use fewer workers (MOUNT_COPY_WORKERS), since it's rarely on the
+    same filesystem as the paths being stored. The store directory is created when an
+    entry is moved into it, but moving out of a missing one fails rather than acting on
+    the empty mount point of an unmounted volume.
+    """
+
+    def __init__(self, path: str, workers: int = MOUNT_COPY_WORKERS) -> None:
+        """
+        Args:
+            path: The directory of the store
+            workers: The number of files to copy concurrently
+        """
+        super().__init__(path)
+        self.workers = workers
+
+    def move(
+        self,
+        source: Path,
+        destination: Path,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+        manifest: CopyManifest = None,
+    ) -> MoveResult:
+        if self.path.absolute() in Path(destination).absolute().parents:
+            self.path.mkdir(parents=True, exist_ok=True)
+        elif not self.path.is_dir():
+            raise TransposeError(
+                f"Secondary store does not exist, is its volume mounted?: '{self.path}'"
+            )
+
+        return move(
+            source=source,
+            destination=destination,
+            workers=self.workers,
+            reflink=reflink,
+            progress=progress,
+            manifest=manifest,
+        )
+
+
+def select_store(
+    stores: List[Store],
+    size: int,
+    policy: str = "free-space",
+    reserved: Dict[Path, int] = None,
+) -> Store:
+    """
+    Choose where to place a new entry
+
+    Args:
+        stores: The candidates, the store path holding the config first
+        size: The size of the entry in bytes
+        policy: One of PLACEMENT_POLICIES, "free-space" places the entry on the store with
+            the most free space, "size-class" keeps entries smaller than LARGE_ENTRY_SIZE
+            in the first store and places larger ones by free space on the others
+        reserved: Bytes already placed on each store path but not moved yet, updated
+            with this entry
+
+    Returns:
+        Store
+    """
+    if policy not in PLACEMENT_POLICIES:
+        raise TransposeError(f"Unknown placement policy: '{policy}'")
+
+    candidates = stores
+    if policy == "size-class" and len(stores) > 1:
+        candidates = stores[:1] if size < LARGE_ENTRY_SIZE else stores[1:]
+
+    reserved = reserved if reserved is not None else {}
+    free = {
+        id(store): store.free_space() - reserved.get(store.path, 0)
+        for store in candidates
+    }
+    store = max(candidates, key=lambda store: free[id(store)])
+    if free[id(store)] < size:
+        raise TransposeError(
+            f"No store has {size} bytes free, the most is {free[id(store)]} on '{store.path}'"
+        )
+
+    reserved[store.path] = reserved.get(store.path, 0) + size
+    return store
+
+
+def get_store(path: Optional[str], primary: Store) -> Store:
+    """
+    Get the store of an entry by the path recorded in it (None for the primary store)
+    """
+    return primary if path is None else MountStore(path)
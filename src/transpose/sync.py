@@ -0,0 +1,274 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import json
+import logging
+import os
+import shutil
+import stat
+import time
+
+from .dedup import hash_file
+from .exceptions import TransposeError
+from .utils import DEFAULT_WORKERS, copy_file, write_atomic
+
+logger = logging.getLogger(__name__)
+
+SYNC_MANIFEST_VERSION = 1
+# Paths modified this close to the start of a sync may be modified again without their
+# mtime changing (filesystems only update it every tick), so they're compared again
+RACY_NANOSECONDS = 2 * 1000 * 1000 * 1000
+
+
+@dataclass
+class SyncResult:
+    copied: int  # Files and symlinks new or changed since the last sync
+    copied_bytes: int
+    removed: int  # Paths removed from the destination since they left the source
+    unchanged: int
+    listed: int  # Directories listed, the others were unchanged since the last sync
+
+
+class SyncManifest:
+    """
+    What the last sync copied to a destination, persisted as JSON
+
+    Files are recorded with their size, mtime and (when compared by checksum) content
+    hash, directories with their mtime and the names in them. A directory's mtime only
+    changes when names are added to or removed from it, so an unchanged directory isn't
+    listed again, and only its files are checked.
+    """
+
+    path: Path
+    files: Dict[str, list]  # Relative path mapped to [size, mtime_ns, digest or target]
+    dirs: Dict[str, list]  # Relative path mapped to [mtime_ns, [names]]
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") != SYNC_MANIFEST_VERSION:
+                raise ValueError(data.get("version"))
+            self.files = data["files"]
+            self.dirs = data["dirs"]
+        except (FileNotFoundError, ValueError, KeyError, AttributeError):
+            # A missing or damaged manifest only costs comparing everything again
+            self.files = {}
+            self.dirs = {}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            self.path,
+            json.dumps(
+                {
+                    "version": SYNC_MANIFEST_VERSION,
+                    "files": self.files,
+                    "dirs": self.dirs,
+                }
+            ),
+        )
+
+
+def sync_tree(
+    source: Path,
+    names: List[str],
+    destination: Path,
+    manifest: SyncManifest,
+    workers: int = None,
+    checksum: bool = False,
+) -> SyncResult:
+    """
+    Mirror paths in a directory to another directory, copying only what changed
+
+    Files are compared with the manifest of the last sync by size and mtime (and content
+    hash with checksum), and new or changed ones are copied in a pool of workers, each
+    replacing its old copy atomically. Paths the last sync copied which have since left
+    the source are removed from the destination, anything else there is left alone.
+    Changes made in the destination itself aren't noticed.
+
+    Args:
+        source: The directory holding the paths
+        names: The files and directories in source to mirror
+        destination: The directory to mirror them into, created if missing
+        manifest: What the last sync copied to destination, updated to this one
+        workers: The number of files to copy concurrently (default: DEFAULT_WORKERS)
+        checksum: Also hash files whose size and mtime are unchanged
+
+    Returns:
+        SyncResult
+    """
+    destination.mkdir(parents=True, exist_ok=True)
+    racy = time.time_ns() - RACY_NANOSECONDS
+    result = SyncResult(copied=0, copied_bytes=0, removed=0, unchanged=0, listed=0)
+    files = {}
+    dirs = {}
+    copies = []  # Relative paths with their stat
+
+    stack = [("", sorted(names))]
+    while stack:
+        directory, children = stack.pop()
+        for name in children:
+            relpath = os.path.join(directory, name)
+            try:
+                st = os.lstat(source.joinpath(relpath))
+            except FileNotFoundError:
+                continue  # Removed since the directory was listed (or recorded)
+
+            if stat.S_ISDIR(st.st_mode):
+                _prepare_directory(destination.joinpath(relpath), manifest, relpath)
+                children = _list(manifest, relpath, st)
+                if children is None:
+                    result.listed += 1
+                    with os.scandir(source.joinpath(relpath)) as it:
+                        children = sorted(entry.name for entry in it)
+                mtime = st.st_mtime_ns if st.st_mtime_ns < racy else None
+                dirs[relpath] = [mtime, children]
+                stack.append((relpath, children))
+            elif stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+                record = _record(source.joinpath(relpath), st, checksum)
+                if _unchanged(manifest.files.get(relpath), record, st, checksum):
+                    result.unchanged += 1
+                else:
+                    copies.append((relpath, st))
+                if st.st_mtime_ns >= racy:
+                    record[1] = None
+                files[relpath] = record
+            else:
+                logger.warning(
+                    f"Not a file, directory or symlink, skipping: '{relpath}'"
+                )
+
+    _copy(source, destination, copies, workers or DEFAULT_WORKERS)
+    result.copied = len(copies)
+    result.copied_bytes = sum(
+        st.st_size for _, st in copies if not stat.S_ISLNK(st.st_mode)
+    )
+
+    # Deepest first, so directories are empty by the time they're removed
+    removed = (set(manifest.files) - set(files) - set(dirs)) | (
+        set(manifest.dirs) - set(dirs) - set(files)
+    )
+    for relpath in sorted(removed, reverse=True):
+        if _remove(destination.joinpath(relpath), is_dir=relpath in manifest.dirs):
+            result.removed += 1
+
+    # Last, since creating and removing files updated the directories' mtimes
+    for relpath in sorted(dirs, reverse=True):
+        shutil.copystat(
+            source.joinpath(relpath),
+            destination.joinpath(relpath),
+            follow_symlinks=False,
+        )
+
+    manifest.files = files
+    manifest.dirs = dirs
+    manifest.save()
+
+    logger.info(
+        f"Synced {result.copied} file(s) ({result.copied_bytes} bytes), "
+        f"removed {result.removed}, {result.unchanged} unchanged"
+    )
+    return result
+
+
+def _list(
+    manifest: SyncManifest, relpath: str, st: os.stat_result
+) -> Optional[List[str]]:
+    """
+    Get the names in a directory from the manifest, if it hasn't changed since the last sync
+    """
+    recorded = manifest.dirs.get(relpath)
+    if recorded is not None and recorded[0] == st.st_mtime_ns:
+        return recorded[1]
+    return None
+
+
+def _prepare_directory(path: Path, manifest: SyncManifest, relpath: str) -> None:
+    """
+    Create a directory in the destination, replacing a file the last sync left there
+    """
+    if os.path.lexists(path) and (path.is_symlink() or not path.is_dir()):
+        if relpath not in manifest.files:
+            raise TransposeError(
+                f"Path in the destination was not created by sync, not replacing: '{path}'"
+            )
+        path.unlink()
+    path.mkdir(exist_ok=True)
+
+
+def _record(path: Path, st: os.stat_result, checksum: bool) -> list:
+    """
+    Get what the manifest records for a file, hashing it only if checksum is enabled
+    """
+    if stat.S_ISLNK(st.st_mode):
+        return [st.st_size, st.st_mtime_ns, os.readlink(path)]
+    return [st.st_size, st.st_mtime_ns, hash_file(path) if checksum else None]
+
+
+def _unchanged(
+    recorded: Optional[list], record: list, st: os.stat_result, checksum: bool
+) -> bool:
+    """
+    Check if a file matches what the last sync copied
+    """
+    if recorded is None:
+        return False
+    if checksum or stat.S_ISLNK(st.st_mode):  # Compare the hash, or the link's target
+        return recorded == record
+    return recorded[:2] == record[:2]
+
+
+def _remove(path: Path, is_dir: bool) -> bool:
+    """
+    Remove a path the last sync copied, leaving directories holding anything else
+
+    Returns:
+        True if it was removed
+    """
+    try:
+        if is_dir:
+            if path.is_symlink() or not path.is_dir():
+                return False
+            path.rmdir()
+        elif os.path.lexists(path) and (path.is_symlink() or not path.is_dir()):
+            path.unlink()
+        else:
+            return False
+    except OSError as e:  # Such as a directory with files the sync didn't create
+        logger.warning(f"Unable to remove '{path}' from the destination: {e}")
+        return False
+    return True
+
+
+def _copy(
+    source: Path,
+    destination: Path,
+    copies: List[Tuple[str, os.stat_result]],
+    workers: int,
+) -> None:
+    """
+    Copy files and symlinks in a pool of workers, replacing their old copies atomically
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def copy(item: Tuple[str, os.stat_result]) -> None:
+        relpath, st = item
+        target = destination.joinpath(relpath)
+        temp_path = target.with_name(f".{target.name}.sync")
+        if os.path.lexists(temp_path):  # Left by an interrupted sync
+            temp_path.unlink()
+
+        if stat.S_ISLNK(st.st_mode):
+            os.symlink(os.readlink(source.joinpath(relpath)), temp_path)
+        else:
+            copy_file(source.joinpath(relpath), temp_path)
+
+        if target.is_dir() and not target.is_symlink():
+            shutil.rmtree(target)  # Was a directory when last synced
+        os.replace(temp_path, target)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(copy, copies))
@@ -1,15 +1,41 @@
-from dataclasses import asdict, dataclass, field
+from collections.abc import Mapping, MutableMapping
+from dataclasses import asdict, dataclass, field, fields
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 # from typing import Self
 
 import datetime
 import json
+import logging
+import os
+import shutil
 
-from . import version as transpose_version
+from . import DEFAULT_CONFIG_BACKEND, get_version
+from .archive import MEMBER_DIRECTORY, extract, get_codec, match_members, pack, unpack
+from .backends import ConfigBackend, JsonBackend, apply_change, get_backend
+from .dedup import DedupResult, HashCache, deduplicate
 from .exceptions import TransposeError
-from .utils import move, symlink
+from .journal import JournalRecord, TransposeJournal
+from .lock import FileLock, lock_path
+from .snapshot import SnapshotResult, take_snapshot
+from .stores import LocalStore, MountStore, Store, get_store, select_store
+from .sync import SyncManifest, SyncResult, sync_tree
+from .utils import (
+    DEFAULT_WORKERS,
+    CopyManifest,
+    MoveProgress,
+    ReflinkError,
+    disk_usage,
+    move,
+    symlink,
+    write_atomic,
+)
+
+logger = logging.getLogger(__name__)
+
+# Directory in the store path for transpose's own state, such as caches
+STATE_DIR = ".transpose"
 
 
 @dataclass
@@ -18,12 +44,135 @@ class TransposeEntry:
     path: str
     created: str  # Should be datetime.datetime but not really necessary here
     enabled: bool = True
+    frozen: Optional[str] = None  # The archive in the store path, while frozen
+    store: Optional[str] = None  # A secondary store path holding the entry, see stores
+
+    @staticmethod
+    def from_dict(name: str, data: dict):  # -> Self:
+        """
+        Create an entry from its transpose.json format
+
+        Args:
+            name: The name of the entry
+            data: The fields of the entry, such as {"path": ..., "created": ..., "enabled": ...}
+
+        Returns:
+            TransposeEntry
+        """
+        try:
+            known = {f.name for f in fields(TransposeEntry)}
+            kwargs = {key: value for key, value in data.items() if key in known}
+            kwargs["name"] = name
+            return TransposeEntry(**kwargs)
+        except (AttributeError, TypeError) as e:
+            raise TransposeError(f"Unrecognized Transpose config file format: {e}")
+
+
+class TransposeEntries(MutableMapping):
+    """
+    The entries of a config, created as TransposeEntry objects only when accessed
+
+    Wraps the raw entries read by a backend (a dict for JSON, a lazy mapping for sqlite),
+    keeping added, accessed and removed entries separately so that commands needing a
+    single entry don't build every entry of a large config
+    """
+
+    def __init__(self, raw: Mapping = None) -> None:
+        self._raw = raw if raw is not None else {}
+        self._entries = {}  # Accessed or added entries
+        self._removed = set()  # Names of raw entries which have been removed
+        self._raw_paths = None  # Normalized raw paths to names, built on first lookup
+
+    def __getitem__(self, name: str) -> TransposeEntry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            if name in self._removed:
+                raise
+
+        entry = self._entries[name] = TransposeEntry.from_dict(name, self._raw[name])
+        return entry
+
+    def __setitem__(self, name: str, entry: TransposeEntry) -> None:
+        self._entries[name] = entry
+        self._removed.discard(name)
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+
+        self._entries.pop(name, None)
+        if name in self._raw:
+            self._removed.add(name)
+
+    def __contains__(self, name: object) -> bool:
+        if name in self._entries:
+            return True
+        return name not in self._removed and name in self._raw
+
+    def __iter__(self):
+        for name in self._raw:
+            if name not in self._removed:
+                yield name
+        for name in list(self._entries):
+            if name not in self._raw:
+                yield name
+
+    def __len__(self) -> int:
+        added = sum(1 for name in self._entries if name not in self._raw)
+        # A live raw mapping (sqlite) no longer has the names removed since it was saved
+        removed = sum(1 for name in self._removed if name in self._raw)
+        return len(self._raw) - removed + added
+
+    def __repr__(self) -> str:
+        return f"TransposeEntries({dict(self.items())!r})"
+
+    def raw_names_by_path(self, paths: List[str]) -> List[str]:
+        """
+        Get the names of entries whose path, as loaded, is one of the normalized paths
+
+        Uses the backend's path index when it has one (sqlite), otherwise a dict built from
+        the loaded entries on first use. Entries added or moved since loading aren't included.
+        """
+        if hasattr(self._raw, "names_by_paths"):
+            return self._raw.names_by_paths(paths)
+
+        if self._raw_paths is None:
+            self._raw_paths = {}
+            for name, data in self._raw.items():
+                try:
+                    path = normalize_path(data["path"])
+                except (KeyError, TypeError):
+                    continue  # Reported when the entry is accessed
+                self._raw_paths.setdefault(path, []).append(name)
+
+        return [name for path in paths for name in self._raw_paths.get(path, [])]
+
+    def to_dict(self) -> dict:
+        """
+        Get every entry in the transpose.json format, passing through entries never accessed
+        """
+        return {
+            name: (
+                asdict(self._entries[name])
+                if name in self._entries
+                else self._raw[name]
+            )
+            for name in self
+        }
 
 
 @dataclass
 class TransposeConfig:
-    entries: dict = field(default_factory=dict)
-    version: str = field(default=transpose_version)
+    entries: TransposeEntries = field(default_factory=TransposeEntries)
+    version: str = None  # The installed version when saved
+    backend: ConfigBackend = field(
+        default_factory=lambda: get_backend(DEFAULT_CONFIG_BACKEND),
+        repr=False,
+        compare=False,
+    )
+    _changes: list = field(default_factory=list, init=False, repr=False, compare=False)
+    _moved: set = field(default_factory=set, init=False, repr=False, compare=False)
 
     def add(self, name: str, path: str, created: str = None) -> None:
         """
@@ -37,7 +186,7 @@ class TransposeConfig:
         Returns:
             None
         """
-        if self.entries.get(name):
+        if name in self.entries:
             raise TransposeError(f"'{name}' already exists")
 
         if not created:
@@ -48,6 +197,10 @@ class TransposeConfig:
             path=str(path),
             created=created,
         )
+        self._changes.append(
+            {"op": "add", "name": name, "path": str(path), "created": created}
+        )
+        self._moved.add(name)
 
     def disable(self, name: str) -> None:
         """
@@ -63,6 +216,9 @@ class TransposeConfig:
             self.entries[name].enabled = False
         except KeyError:
             raise TransposeError(f"'{name}' does not exist in Transpose config entries")
+        self._changes.append(
+            {"op": "update", "name": name, "field": "enabled", "value": False}
+        )
 
     def enable(self, name: str) -> None:
         """
@@ -78,6 +234,9 @@ class TransposeConfig:
             self.entries[name].enabled = True
         except KeyError:
             raise TransposeError(f"'{name}' does not exist in Transpose config entries")
+        self._changes.append(
+            {"op": "update", "name": name, "field": "enabled", "value": True}
+        )
 
     def get(self, name: str) -> TransposeEntry:
         """
@@ -94,6 +253,47 @@ class TransposeConfig:
         except KeyError:
             raise TransposeError(f"'{name}' does not exist in Transpose config entries")
 
+    def find_by_path(self, path: str) -> Optional[TransposeEntry]:
+        """
+        Find the entry which manages a path, either as its own path or a parent directory
+
+        Looks up the path and each of its parents in a path index, so the cost depends on
+        the depth of the path rather than the number of entries
+
+        Args:
+            path: The path to look up (does not need to exist)
+
+        Returns:
+            The entry with the closest matching path, or None if the path isn't managed
+        """
+        candidates = []
+        candidate = normalize_path(path)
+        while True:
+            candidates.append(candidate)
+            parent = os.path.dirname(candidate)
+            if parent == candidate:
+                break
+            candidate = parent
+
+        if isinstance(self.entries, TransposeEntries):
+            names = self.entries.raw_names_by_path(candidates) + list(self._moved)
+        else:
+            names = list(self.entries)
+
+        # Index hits may be stale after a remove or update, so check the current path
+        depth = {path: i for i, path in enumerate(candidates)}
+        found = None
+        for name in dict.fromkeys(names):
+            entry = self.entries.get(name)
+            if entry is None:
+                continue
+
+            i = depth.get(normalize_path(entry.path))
+            if i is not None and (found is None or i < found[0]):
+                found = (i, entry)
+
+        return found[1] if found else None
+
     def remove(self, name: str) -> None:
         """
         Remove an entry by name
@@ -108,6 +308,7 @@ class TransposeConfig:
             del self.entries[name]
         except KeyError:
             raise TransposeError(f"'{name}' does not exist in Transpose config entries")
+        self._changes.append({"op": "remove", "name": name})
 
     def update(self, name: str, field_key: str, field_value: Any) -> None:
         """
@@ -128,38 +329,45 @@ class TransposeConfig:
             raise TransposeError(f"'{name}' does not exist in Transpose config entries")
 
         setattr(self.entries[name], field_key, field_value)
+        if field_key == "path":
+            self._moved.add(name)
+        self._changes.append(
+            {"op": "update", "name": name, "field": field_key, "value": field_value}
+        )
 
     @staticmethod
-    def load(config_path: str):  # -> Self:
-        try:
-            in_config = json.load(open(config_path, "r"))
-        except json.decoder.JSONDecodeError as e:
-            raise TransposeError(f"Invalid JSON format for '{config_path}': {e}")
-        except FileNotFoundError:
-            in_config = {"entries": {}}
+    def load(config_path: str, backend: str = None):  # -> Self:
+        """
+        Load the config using a storage backend
 
-        config = TransposeConfig()
-        try:
-            for name in in_config["entries"]:
-                entry = in_config["entries"][name]
-                config.add(
-                    name,
-                    entry["path"],
-                    created=entry["created"],
-                )
-                if not entry["enabled"]:
-                    config.disable(name)
-        except (KeyError, TypeError) as e:
-            raise TransposeError(f"Unrecognized Transpose config file format: {e}")
+        Entries are only parsed into TransposeEntry objects when first accessed
+
+        Args:
+            config_path: The path of the config file
+            backend: One of CONFIG_BACKENDS (default: based on config_path, see default_backend)
+
+        Returns:
+            TransposeConfig
+        """
+        backend = get_backend(backend or default_backend(config_path))
+        with FileLock(lock_path(config_path)).shared():
+            entries = _read_entries(backend, Path(config_path))
 
-        return config
+        return TransposeConfig(entries=TransposeEntries(entries), backend=backend)
 
     def save(self, config_path: str) -> None:
         """
-        Save the Config to a location in JSON format
+        Save the Config to a location using its storage backend
+
+        The JSON file is replaced atomically, so a crash mid-write leaves the previous config
+        intact. The log and sqlite backends only write the changes made since loading.
+
+        Saving holds an exclusive lock on the config. If another process saved it since it
+        was loaded, the changes made here are applied on top of the saved config rather
+        than replacing it.
 
         Args:
-            path: The path to save the json file
+            path: The path to save the config file
 
         Returns:
             None
@@ -167,29 +375,138 @@ class TransposeConfig:
         config_path = Path(config_path)
         config_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(str(config_path), "w") as f:
-            json.dump(self.to_dict(), f, default=str)
+        with FileLock(lock_path(config_path)).exclusive():
+            backend = self.backend
+            if not backend.keeps_other_changes and backend.is_stale(config_path):
+                self._merge(config_path)
+            backend.write(self, config_path)
+
+    def _merge(self, config_path: Path) -> None:
+        """
+        Reload the config saved by another process and apply the unsaved changes on top
+        """
+        entries = dict(_read_entries(self.backend, config_path))
+        try:
+            for change in self._changes:
+                apply_change(entries, change)
+        except (AttributeError, KeyError, TypeError) as e:
+            raise TransposeError(f"Unable to merge Transpose config changes: {e}")
+
+        self.entries = TransposeEntries(entries)
+
+    def pop_changes(self) -> list:
+        """
+        Get and clear the changes recorded since the config was loaded or last saved
+
+        Returns:
+            A list of change records such as {"op": "remove", "name": name}
+        """
+        changes = self._changes
+        self._changes = []
+        return changes
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        if isinstance(self.entries, TransposeEntries):
+            entries = self.entries.to_dict()
+        else:
+            entries = {name: asdict(entry) for name, entry in self.entries.items()}
+
+        return {"entries": entries, "version": self.version or get_version()}
+
+
+def _read_entries(backend: ConfigBackend, config_path: Path) -> Mapping:
+    """
+    Read the entries from a config using a backend, checking the format
+    """
+    in_config = backend.read(config_path)
+
+    try:
+        entries = in_config["entries"]
+    except (KeyError, TypeError) as e:
+        raise TransposeError(f"Unrecognized Transpose config file format: {e}")
+    if not isinstance(entries, Mapping):
+        raise TransposeError(
+            f"Unrecognized Transpose config file format: entries is {type(entries)}"
+        )
+
+    return entries
+
+
+def normalize_path(path: str) -> str:
+    """
+    Make a path absolute and normalized, without resolving symlinks (entry paths are symlinks)
+    """
+    return os.path.normpath(os.path.abspath(os.path.expanduser(str(path))))
+
+
+def default_backend(config_path: str) -> str:
+    """
+    Get the name of the backend for a config path: sqlite for .db files, otherwise
+    DEFAULT_CONFIG_BACKEND (or json, when that's sqlite but the path isn't a .db file)
+    """
+    if Path(config_path).suffix == ".db":
+        return "sqlite"
+    if DEFAULT_CONFIG_BACKEND == "sqlite":
+        return "json"
+    return DEFAULT_CONFIG_BACKEND
+
+
+def default_config_path(store_path: str) -> Path:
+    """
+    Get the path of the config file in a store: transpose.db when using (or migrated to)
+    the sqlite backend, otherwise transpose.json
+    """
+    db_path = Path(store_path).joinpath("transpose.db")
+    if DEFAULT_CONFIG_BACKEND == "sqlite" or db_path.exists():
+        return db_path
+    return Path(store_path).joinpath("transpose.json")
+
+
+@dataclass
+class TransposeStatus:
+    OK = "ok"
+    MISSING_LINK = "missing link"  # Nothing at the entry path
+    NOT_A_LINK = "not a link"  # A real file or directory at the entry path
+    WRONG_TARGET = "wrong target"  # A symlink pointing somewhere other than the store
+    DANGLING = "dangling"  # A symlink to the store, but the stored path is missing
+    FROZEN = "frozen"  # A symlink to the store, the stored path packed by freeze
+    ORPHAN = "orphan"  # A path in the store without an entry in the config
+
+    name: str
+    path: Optional[str]  # None for orphans
+    status: str
+    target: Optional[str] = None  # Where the symlink at path points, if it is one
 
 
 class Transpose:
     config: TransposeConfig
     config_path: Path
+    journal: TransposeJournal
+    # The store path, entries can be placed on secondary stores too
+    primary_store: Store
     store_path: Path
 
     def __init__(self, config_path: str) -> None:
         self.config = TransposeConfig.load(config_path)
         self.config_path = Path(config_path)
         self.store_path = self.config_path.parent
+        self.primary_store = LocalStore(self.store_path)
+        self.journal = TransposeJournal(self.config_path.with_suffix(".journal"))
 
         if not self.store_path.exists():
             self.store_path.mkdir(parents=True)
 
+        if self.journal.path.exists() and self.journal.path.stat().st_size:
+            # Operations still running in other processes would look interrupted
+            with self.journal.lock.exclusive(blocking=False) as idle:
+                if idle:
+                    self.recover()
+                else:
+                    logger.info("Transpose is running elsewhere, not recovering yet")
+
     def apply(self, name: str, force: bool = False) -> None:
         """
-        Create/recreate the symlink to an existing entry
+        Create/recreate the symlink to an existing entry, thawing it if it's frozen
 
         Args:
             name: The name of the entry (must exist)
@@ -205,31 +522,656 @@ class Transpose:
         if not entry.enabled and not force:
             raise TransposeError(f"Entry '{name}' is not enabled in the config")
 
-        entry_path = Path(entry.path)
-        if entry_path.exists():
-            if force:  # Backup the existing path
-                move(entry_path, entry_path.with_suffix(".backup"))
+        if entry.frozen:
+            self.thaw(name)
+
+        self._link(name, force=force)
+
+    def check(
+        self, jobs: int = DEFAULT_WORKERS, names: List[str] = None
+    ) -> List[TransposeStatus]:
+        """
+        Check the symlink and stored path of every entry, and look for orphans in the store
+
+        The store is listed with a single scandir and the entry paths are checked in a pool
+        of jobs workers, since each check is a round trip on network filesystems
+
+        Args:
+            jobs: The number of entry paths to check concurrently
+            names: Only check these entries, without looking for orphans
+
+        Returns:
+            The status of each entry, sorted by name, followed by any orphans
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        stored = set(self._scan_store())
+        store_path = os.path.realpath(self.store_path)
+
+        def exists(entry: TransposeEntry, name: Optional[str]) -> bool:
+            if entry.store is None:
+                return name in stored
+            return name is not None and os.path.lexists(os.path.join(entry.store, name))
+
+        def check(name: str) -> TransposeStatus:
+            entry = self.config.entries[name]
+            path = entry.path
+            link_path = os.path.abspath(os.path.expanduser(path))
+            try:
+                target = os.readlink(link_path)
+            except FileNotFoundError:
+                return TransposeStatus(name, path, TransposeStatus.MISSING_LINK)
+            except OSError:  # Exists, but not a symlink
+                return TransposeStatus(name, path, TransposeStatus.NOT_A_LINK)
+
+            resolved = os.path.join(os.path.dirname(link_path), target)
+            expected = os.path.realpath(entry.store) if entry.store else store_path
+            if os.path.realpath(os.path.dirname(resolved)) != expected or (
+                os.path.basename(resolved) != name
+            ):
+                status = TransposeStatus.WRONG_TARGET
+            elif exists(entry, entry.frozen):
+                status = TransposeStatus.FROZEN  # Even with some paths hydrated
+            elif not exists(entry, name):
+                status = TransposeStatus.DANGLING
             else:
+                status = TransposeStatus.OK
+            return TransposeStatus(name, path, status, target=target)
+
+        all_entries = names is None
+        names = sorted(self.config.entries if all_entries else names)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            statuses = list(executor.map(check, names))
+
+        if all_entries:
+            statuses += [
+                TransposeStatus(name, None, TransposeStatus.ORPHAN)
+                for name in self._orphans(stored)
+            ]
+        return statuses
+
+    def dedup(self, jobs: int = DEFAULT_WORKERS, hardlink: bool = False) -> DedupResult:
+        """
+        Replace identical files across the stored entries with copy-on-write clones of one
+        copy (see deduplicate)
+
+        File hashes are cached in the store path, so only new or modified files are read
+
+        Args:
+            jobs: The number of files to hash concurrently
+            hardlink: Replace them with hardlinks instead, so the entries share one inode
+                and writing to the file in one changes it in the others
+
+        Returns:
+            DedupResult with the number of files replaced and the bytes reclaimed
+        """
+        with self.journal.lock.shared():
+            roots = [self._stored_path(name) for name in self.config.entries]
+            cache = HashCache(self.store_path.joinpath(STATE_DIR, "hashes.json"))
+
+            result = deduplicate(
+                [root for root in roots if os.path.lexists(root)],
+                cache=cache,
+                workers=jobs,
+                hardlink=hardlink,
+            )
+            cache.save()
+            return result
+
+    def freeze(self, name: str, jobs: int = DEFAULT_WORKERS) -> int:
+        """
+        Pack a stored entry into a compressed archive in the store path, for entries which
+        are rarely used
+
+        The entry path stays a symlink to the stored path, which is missing until the entry
+        is thawed (apply thaws it too). The archive is complete and synced before the config
+        is saved and the stored path removed, so an interruption never loses data.
+
+        Args:
+            name: The name of the entry (must exist and not be frozen)
+            jobs: The number of chunks to compress concurrently
+
+        Returns:
+            The size of the archive in bytes
+        """
+        with self.journal.lock.shared():
+            entry = self.config.get(name)
+            if entry.frozen:
+                raise TransposeError(f"Entry is already frozen: '{name}'")
+
+            store = self._store_of(name)
+            stored_path = store.entry_path(name)
+            if not os.path.lexists(stored_path):
+                raise TransposeError(f"Stored path does not exist: '{stored_path}'")
+
+            codec = get_codec()
+            archive = f"{name}{codec.suffix}"
+            temp_path = store.path.joinpath(f".{archive}.tmp")
+            try:
+                index = pack(stored_path, temp_path, codec, workers=jobs)
+            except BaseException:
+                if temp_path.exists():
+                    temp_path.unlink()
+                raise
+            os.rename(temp_path, store.path.joinpath(archive))
+
+            index_path = self._index_path(archive)
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(index_path, json.dumps(index))
+
+            self.config.update(name, "frozen", archive)
+            self.config.save(self.config_path)
+
+            if stored_path.is_dir() and not stored_path.is_symlink():
+                shutil.rmtree(stored_path)
+            else:
+                stored_path.unlink()
+
+            return store.path.joinpath(archive).stat().st_size
+
+    def hydrate(self, name: str, pattern: str) -> List[str]:
+        """
+        Extract only the paths matching a glob from a frozen entry, leaving it frozen
+
+        Uses the index of the archive written by freeze, so only the compressed chunks
+        holding the matching paths are read. Paths already hydrated are left as they are,
+        and are kept (with any changes) when the entry is thawed.
+
+        Args:
+            name: The name of the entry (must exist and be frozen)
+            pattern: A glob relative to the stored path, such as "*.conf" or "saves/*",
+                matching a directory hydrates everything in it
+
+        Returns:
+            The paths which were extracted, relative to the stored path
+        """
+        with self.journal.lock.shared():
+            entry = self.config.get(name)
+            if not entry.frozen:
+                raise TransposeError(f"Entry is not frozen: '{name}'")
+
+            archive = entry.frozen
+            try:
+                with open(self._index_path(archive), "r") as f:
+                    index = json.load(f)
+            except FileNotFoundError:
                 raise TransposeError(
-                    f"Entry path already exists, cannot apply (force required): '{entry_path}'"
+                    f"Archive has no index, thaw the entry instead: '{archive}'"
                 )
+            except json.decoder.JSONDecodeError as e:
+                raise TransposeError(f"Unable to read the index of '{archive}': {e}")
 
-        symlink(
-            target_path=self.store_path.joinpath(name),
-            symlink_path=entry_path,
-        )
+            root = index["members"].get("")
+            if root is None or root[0] != MEMBER_DIRECTORY:
+                raise TransposeError(f"Only directories can be hydrated: '{name}'")
+
+            names = match_members(index, pattern)
+            if not names:
+                raise TransposeError(f"No paths in '{name}' match '{pattern}'")
 
-    def restore(self, name: str, force: bool = False) -> None:
+            store = self._store_of(name)
+            stored_path = store.entry_path(name)
+            if not stored_path.is_dir():
+                stored_path.mkdir()
+                os.chmod(stored_path, root[3])
+
+            try:
+                return extract(
+                    store.path.joinpath(archive),
+                    index,
+                    names,
+                    stored_path,
+                    get_codec(archive),
+                )
+            except (OSError, EOFError) as e:  # Such as a truncated archive
+                raise TransposeError(
+                    f"Unable to hydrate '{name}' from '{archive}': {e}"
+                )
+
+    def snapshot(self, jobs: int = DEFAULT_WORKERS) -> SnapshotResult:
+        """
+        Take a snapshot of the store path in '{store_path}/.transpose/snapshots/{timestamp}'
+
+        Files unchanged since the previous snapshot are hardlinked to it rather than copied,
+        see snapshot.take_snapshot. Waits for operations running in other processes to
+        finish, so the snapshot matches the config.
+
+        Args:
+            jobs: The number of files to copy concurrently
+
+        Returns:
+            SnapshotResult
+        """
+        with self.journal.lock.exclusive():
+            with FileLock(lock_path(self.config_path)).shared():
+                return take_snapshot(
+                    self.store_path,
+                    self._backup_names(),
+                    self.store_path.joinpath(STATE_DIR, "snapshots"),
+                    workers=jobs,
+                )
+
+    def sync(
+        self, destination: str, jobs: int = DEFAULT_WORKERS, checksum: bool = False
+    ) -> SyncResult:
+        """
+        Mirror the store path to a backup directory, copying only what changed since the
+        last sync to it
+
+        What was copied is recorded in '{destination}/.transpose/sync.json', so directories
+        unchanged since the last sync aren't listed again, see sync.sync_tree. Waits for
+        operations running in other processes to finish, so the mirror matches the config.
+
+        Args:
+            destination: The directory to mirror the store path into, outside of it
+            jobs: The number of files to copy concurrently
+            checksum: Also compare the contents of files whose size and mtime are unchanged
+
+        Returns:
+            SyncResult
+        """
+        destination = Path(os.path.abspath(os.path.expanduser(destination)))
+        store_path = Path(os.path.realpath(self.store_path))
+        real_destination = Path(os.path.realpath(destination))
+        if real_destination == store_path or store_path in real_destination.parents:
+            raise TransposeError(
+                f"Sync destination cannot be inside the store path: '{destination}'"
+            )
+
+        with self.journal.lock.exclusive():
+            with FileLock(lock_path(self.config_path)).shared():
+                manifest = SyncManifest(destination.joinpath(STATE_DIR, "sync.json"))
+                return sync_tree(
+                    self.store_path,
+                    self._backup_names(),
+                    destination,
+                    manifest,
+                    workers=jobs,
+                    checksum=checksum,
+                )
+
+    def thaw(self, name: str) -> None:
+        """
+        Extract a frozen entry back to its stored path and remove the archive
+
+        Args:
+            name: The name of the entry (must exist and be frozen)
+
+        Returns:
+            None
+        """
+        with self.journal.lock.shared():
+            entry = self.config.get(name)
+            if not entry.frozen:
+                raise TransposeError(f"Entry is not frozen: '{name}'")
+
+            archive = entry.frozen
+            self._unpack(name, archive)
+
+            self.config.update(name, "frozen", None)
+            self.config.save(self.config_path)
+            self._remove_archive(self._store_of(name), archive)
+
+    def gc(self, dry_run: bool = False, jobs: int = DEFAULT_WORKERS) -> Dict[str, int]:
+        """
+        Find, and unless dry_run remove, paths in the store which have no entry in the config
+
+        Paths of interrupted operations still pending in the journal are never treated as
+        orphans, since they may be the only complete copy of the data. Waits for operations
+        running in other processes to finish, and checks the config as they saved it, so
+        the archive of an entry frozen since this config was loaded is kept too. Secondary
+        stores aren't scanned, so nothing is removed from them.
+
+        Args:
+            dry_run: Only report the orphans and their sizes
+            jobs: The number of directories to measure concurrently
+
+        Returns:
+            The name of each orphan mapped to its size in bytes
+        """
+        with self.journal.lock.exclusive():
+            pending = {record.name for record in self.journal.pending()}
+            saved = TransposeConfig.load(self.config_path, self.config.backend.name)
+            orphans = [
+                name
+                for name in self._orphans(self._scan_store(), saved)
+                if name not in pending
+            ]
+
+            paths = [self.store_path.joinpath(name) for name in orphans]
+            sizes = disk_usage(paths, workers=jobs)
+
+            if not dry_run:
+                for path in paths:
+                    if path.is_dir() and not path.is_symlink():
+                        shutil.rmtree(path)
+                    else:
+                        path.unlink()
+
+            return {path.name: sizes[path] for path in paths}
+
+    def restore(
+        self,
+        name: str,
+        force: bool = False,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+    ) -> None:
         """
         Remove the symlink and move the stored entry back to it's original path
 
         Args:
             name: The name of the entry (must exist)
             force: If enabled and path already exists, move the path to '{path}.backup' first
+            reflink: One of REFLINK_MODES, whether a cross-device move clones files
+            progress: Called with a MoveProgress while a cross-device move is copying
 
         Returns:
             None
         """
+        with self.journal.lock.shared():
+            record = self._restore(
+                name, force=force, reflink=reflink, progress=progress
+            )
+
+            store, archive = self._store_of(name), self.config.entries[name].frozen
+            self.config.remove(name)
+            self.config.save(self.config_path)
+            self.journal.commit(record)
+            self._remove_archive(store, archive)
+
+    def restore_many(
+        self,
+        names: List[str],
+        force: bool = False,
+        jobs: int = 1,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+    ) -> Dict[str, Optional[TransposeError]]:
+        """
+        Restore several entries, moving them concurrently and saving the config once
+
+        Args:
+            names: The names of the entries (must exist)
+            force: If enabled and path already exists, move the path to '{path}.backup' first
+            jobs: The number of entries to move concurrently
+            reflink: One of REFLINK_MODES, whether a cross-device move clones files
+            progress: Called with a MoveProgress while a cross-device move is copying,
+                concurrently for each entry being moved
+
+        Returns:
+            The entry names mapped to None on success or the error that prevented the restore
+        """
+        with self.journal.lock.shared():
+            records = {}
+
+            def restore(name: str) -> None:
+                records[name] = self._restore(
+                    name, force=force, reflink=reflink, progress=progress
+                )
+
+            results = self._run_many(restore, names, jobs=jobs)
+
+            restored = [name for name in names if results[name] is None]
+            archives = [
+                (self._store_of(name), self.config.entries[name].frozen)
+                for name in restored
+            ]
+            for name in restored:
+                self.config.remove(name)
+            if restored:
+                self.config.save(self.config_path)
+            for name in restored:
+                self.journal.commit(records[name])
+            for store, archive in archives:
+                self._remove_archive(store, archive)
+
+            return results
+
+    def store(
+        self,
+        name: str,
+        source_path: str,
+        dedup: bool = False,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+        stores: List[str] = None,
+        placement: str = "free-space",
+    ) -> Optional[DedupResult]:
+        """
+        Move the source path to the store path, create a symlink, and update the config
+
+        Args:
+            name: The name of the entry
+            source_path: The directory or file to be stored
+            dedup: Deduplicate the store afterwards (see dedup)
+            reflink: One of REFLINK_MODES, whether a cross-device move clones files
+            progress: Called with a MoveProgress while a cross-device move is copying
+            stores: Secondary store paths, such as on other disks, the entry may be placed
+                in instead of the store path
+            placement: One of PLACEMENT_POLICIES, choosing between the store path and stores
+
+        Returns:
+            DedupResult if dedup is enabled, otherwise None
+        """
+        with self.journal.lock.shared():
+            store = self._place(source_path, stores, placement, reserved={})
+            record = self._store(
+                name, source_path, reflink=reflink, progress=progress, store=store
+            )
+
+            self._add_entry(name, Path(source_path), record.store)
+            self.config.save(self.config_path)
+            self.journal.commit(record)
+
+            return self.dedup() if dedup else None
+
+    def store_many(
+        self,
+        targets: Dict[str, str],
+        jobs: int = 1,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+        stores: List[str] = None,
+        placement: str = "free-space",
+    ) -> Dict[str, Optional[TransposeError]]:
+        """
+        Store several paths, moving them concurrently and saving the config once
+
+        Args:
+            targets: The entry names mapped to the directory or file to be stored
+            jobs: The number of targets to move concurrently
+            reflink: One of REFLINK_MODES, whether a cross-device move clones files
+            progress: Called with a MoveProgress while a cross-device move is copying,
+                concurrently for each target being moved
+            stores: Secondary store paths the entries may be placed in (see store)
+            placement: One of PLACEMENT_POLICIES, choosing between the store path and stores
+
+        Returns:
+            The entry names mapped to None on success or the error that prevented the store
+        """
+        with self.journal.lock.shared():
+            records = {}
+            reserved = {}  # Bytes placed on each store by the targets placed before
+            placements = {}
+
+            def place(name: str) -> None:
+                placements[name] = self._place(
+                    targets[name], stores, placement, reserved
+                )
+
+            placed = self._run_many(place, targets, jobs=1)
+
+            def store(name: str) -> None:
+                if placed[name] is not None:
+                    raise placed[name]
+                records[name] = self._store(
+                    name,
+                    targets[name],
+                    reflink=reflink,
+                    progress=progress,
+                    store=placements[name],
+                )
+
+            results = self._run_many(store, targets, jobs=jobs)
+
+            stored = [name for name in targets if results[name] is None]
+            for name in stored:
+                self._add_entry(name, Path(targets[name]), records[name].store)
+            if stored:
+                self.config.save(self.config_path)
+            for name in stored:
+                self.journal.commit(records[name])
+
+            return results
+
+    def repair(
+        self, names: List[str] = None, force: bool = False
+    ) -> List[Tuple[TransposeStatus, str]]:
+        """
+        Check entries and recreate their symlinks where they're missing
+
+        A real file or directory (or another symlink) at the entry path is drift: the
+        data there has diverged from the store. It's only reported, unless forced, in which
+        case it's moved to '{path}.backup' like apply does.
+
+        Frozen entries only get their symlink back and stay frozen, since thawing takes the
+        journal lock, which watch already holds while repairing.
+
+        Args:
+            names: The entries to check (default: every enabled entry)
+            force: Also repair entries whose path was replaced
+
+        Returns:
+            The status of each entry which wasn't ok, with "repaired", "drift" or the error
+            which prevented repairing it
+        """
+        if names is None:
+            names = [
+                name for name, entry in self.config.entries.items() if entry.enabled
+            ]
+
+        fixable = {TransposeStatus.MISSING_LINK}
+        if force:
+            fixable |= {TransposeStatus.NOT_A_LINK, TransposeStatus.WRONG_TARGET}
+
+        results = []
+        for status in self.check(names=names):
+            if status.status in (TransposeStatus.OK, TransposeStatus.FROZEN):
+                continue
+
+            outcome = "drift"
+            if status.status in fixable:
+                try:
+                    if self.config.entries[status.name].frozen:
+                        self._link(status.name, force=force)
+                    else:
+                        self.apply(status.name, force=force)
+                    outcome = "repaired"
+                except (OSError, TransposeError) as e:
+                    outcome = str(e)
+            results.append((status, outcome))
+
+        return results
+
+    def recover(self) -> List[Tuple[JournalRecord, str]]:
+        """
+        Resolve store/restore operations left pending in the journal by an interruption
+
+        Each operation is rolled forward (the move finished, so the symlink and config are
+        completed) or rolled back (nothing was moved) by checking only the paths of that
+        entry. Operations where both the source and destination exist are left pending,
+        since a cross-device copy may have been interrupted part way. If the copy recorded
+        its progress in a manifest it is "resumable" by running the operation again.
+
+        Returns:
+            The pending records with their outcome: "completed", "rolled forward",
+            "rolled back", "resumable" or "unresolved"
+        """
+        outcomes = []
+        for record in self.journal.pending():
+            if record.op == "store":
+                outcome = self._recover_store(record)
+            elif record.op == "restore":
+                outcome = self._recover_restore(record)
+            else:
+                outcome = "unresolved"
+
+            if outcome == "resumable":
+                logger.warning(
+                    f"Interrupted {record.op} of '{record.name}' can be resumed by "
+                    f"running the {record.op} again"
+                )
+            elif outcome == "unresolved":
+                logger.warning(
+                    f"Interrupted {record.op} of '{record.name}' needs attention: "
+                    f"both '{record.path}' and "
+                    f"'{get_store(record.store, self.primary_store).entry_path(record.name)}' exist"
+                )
+            elif outcome != "completed":
+                logger.warning(f"Interrupted {record.op} of '{record.name}' {outcome}")
+            outcomes.append((record, outcome))
+
+        if any(outcome == "rolled forward" for _, outcome in outcomes):
+            self.config.save(self.config_path)
+
+        pending = [
+            record
+            for record, outcome in outcomes
+            if outcome in ("resumable", "unresolved")
+        ]
+        self.journal.reset(pending)
+        for record, _ in outcomes:
+            if record not in pending:
+                self._manifest(record).remove()
+
+        return outcomes
+
+    def _recover_store(self, record: JournalRecord) -> str:
+        storage_path = get_store(record.store, self.primary_store).entry_path(
+            record.name
+        )
+        source_path = Path(record.path)
+
+        if self.config.entries.get(record.name):
+            return "completed"
+        if not os.path.lexists(storage_path):
+            return "rolled back"
+        if source_path.is_symlink() or not os.path.lexists(source_path):
+            if not source_path.is_symlink():
+                symlink(target_path=storage_path, symlink_path=source_path)
+            self._add_entry(record.name, source_path, record.store)
+            return "rolled forward"
+        return "resumable" if self._manifest(record).exists() else "unresolved"
+
+    def _recover_restore(self, record: JournalRecord) -> str:
+        storage_path = get_store(record.store, self.primary_store).entry_path(
+            record.name
+        )
+        entry_path = Path(record.path)
+
+        if not self.config.entries.get(record.name):
+            return "completed"
+        if not os.path.lexists(storage_path):
+            self.config.remove(record.name)
+            return "rolled forward"
+        if entry_path.is_symlink() or not os.path.lexists(entry_path):
+            return "rolled back"
+        return "resumable" if self._manifest(record).exists() else "unresolved"
+
+    def _restore(
+        self,
+        name: str,
+        force: bool = False,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+    ) -> JournalRecord:
+        """
+        Move the stored entry back to it's original path without updating the config
+
+        Returns:
+            The journal record to commit once the config is saved
+        """
         if not self.config.entries.get(name):
             raise TransposeError(f"Could not locate entry by name: '{name}'")
 
@@ -238,7 +1180,14 @@ class Transpose:
             raise TransposeError(f"Entry '{name}' is not enabled in the config")
 
         entry_path = Path(entry.path)
-        if entry_path.exists():
+        store = self._store_of(name)
+        stored_path = store.entry_path(name)
+        record = self._resumable("restore", name, entry.path)
+        # Our own symlink, which dangles while the entry is frozen, is replaced
+        own_link = entry_path.is_symlink() and (
+            os.path.realpath(entry_path) == os.path.realpath(stored_path)
+        )
+        if os.path.lexists(entry_path) and not own_link and record is None:
             if force:  # Backup the existing path
                 move(entry_path, entry_path.with_suffix(".backup"))
             else:
@@ -246,37 +1195,328 @@ class Transpose:
                     f"Entry path already exists, cannot restore (force required): '{entry_path}'"
                 )
 
-        move(self.store_path.joinpath(name), entry_path)
+        if entry.frozen:
+            self._unpack(name, entry.frozen)
 
-        self.config.remove(name)
-        self.config.save(self.config_path)
+        if own_link and record is None:
+            entry_path.unlink()
+        record = record or self.journal.begin(
+            "restore", name, entry.path, store=entry.store
+        )
+        self._move(record, store, stored_path, entry_path, reflink, progress)
 
-    def store(self, name: str, source_path: str) -> None:
-        """
-        Move the source path to the store path, create a symlink, and update the config
+        return record
 
-        Args:
-            name: The name of the entry
-            source_path: The directory or file to be stored
+    def _store(
+        self,
+        name: str,
+        source_path: str,
+        reflink: str = "auto",
+        progress: Callable[[MoveProgress], None] = None,
+        store: Store = None,
+    ) -> JournalRecord:
+        """
+        Move the source path to the store path (or another store) and create a symlink
+        without updating the config
 
         Returns:
-            None
+            The journal record to commit once the config is saved, with the store used
         """
         if self.config.entries.get(name):
             raise TransposeError(
                 f"Entry already exists: {name} -> {self.config.entries[name].path}"
             )
 
-        storage_path = self.store_path.joinpath(name)
-        if storage_path.exists():
+        record = self._resumable("store", name, source_path)
+        if record is not None:  # Resumed in the store it was placed in
+            store = get_store(record.store, self.primary_store)
+        store = store or self.primary_store
+        storage_path = store.entry_path(name)
+        if storage_path.exists() and record is None:
             raise TransposeError(f"Store path already exists: '{storage_path}'")
 
         source_path = Path(source_path)
         if not source_path.exists():
             raise TransposeError(f"Source path does not exist: '{source_path}'")
 
-        move(source=source_path, destination=storage_path)
+        record = record or self.journal.begin(
+            "store",
+            name,
+            source_path,
+            store=None if store == self.primary_store else str(store.path),
+        )
+        self._move(record, store, source_path, storage_path, reflink, progress)
         symlink(target_path=storage_path, symlink_path=source_path)
 
-        self.config.add(name, source_path)
-        self.config.save(self.config_path)
+        return record
+
+    def _move(
+        self,
+        record: JournalRecord,
+        store: Store,
+        source: Path,
+        destination: Path,
+        reflink: str,
+        progress: Optional[Callable[[MoveProgress], None]],
+    ) -> None:
+        """
+        Move the path of a journaled operation, failing cleanly if a reflink isn't possible
+
+        Cross-device copies record their progress in a manifest, so an interrupted move is
+        resumed when the same store or restore is run again (see _resumable). The store
+        moving the entry in or out chooses how it's copied.
+        """
+        manifest = self._manifest(record)
+        try:
+            store.move(
+                source=source,
+                destination=destination,
+                reflink=reflink,
+                progress=progress,
+                manifest=manifest,
+            )
+        except (ReflinkError, shutil.SpecialFileError) as e:
+            # Nothing can be moved this way, so don't keep the partial copy to resume
+            if destination.is_dir() and not destination.is_symlink():
+                shutil.rmtree(destination)
+            elif os.path.lexists(destination):
+                destination.unlink()
+            manifest.remove()
+            self.journal.commit(record)
+            if isinstance(e, ReflinkError):
+                raise TransposeError(f"{e}, use --reflink=auto to copy instead")
+            raise TransposeError(str(e))
+
+    def _manifest(self, record: JournalRecord) -> CopyManifest:
+        """
+        Get the manifest of the files copied so far by the move of a journaled operation
+        """
+        return CopyManifest(
+            self.store_path.joinpath(
+                STATE_DIR, "moves", f"{record.op}-{record.name}.manifest"
+            )
+        )
+
+    def _resumable(self, op: str, name: str, path: str) -> Optional[JournalRecord]:
+        """
+        Find the interrupted operation to resume for an entry, if a copy was in progress
+        """
+        for record in self.journal.pending():
+            if (
+                (record.op, record.name) == (op, name)
+                and normalize_path(record.path) == normalize_path(path)
+                and self._manifest(record).exists()
+            ):
+                return record
+        return None
+
+    def _backup_names(self) -> List[str]:
+        """
+        Get the names in the store path to back up: everything but transpose's own state
+        and locks, except for the config
+        """
+        config_files = {
+            self.config_path.name,
+            JsonBackend.log_path(self.config_path).name,
+        }
+        return self._scan_store() + [
+            name for name in config_files if self.store_path.joinpath(name).exists()
+        ]
+
+    def _is_metadata(self, name: str) -> bool:
+        """
+        Check if a name in the store path belongs to transpose itself rather than an entry
+        """
+        files = {
+            self.config_path.name,
+            self.journal.path.name,
+            JsonBackend.log_path(self.config_path).name,
+        }
+        files |= {f"{file}-journal" for file in files}  # SQLite's rollback journal
+        files |= {lock_path(file).name for file in files}
+        if name in files or name == STATE_DIR:
+            return True
+        # Temporary files from write_atomic
+        return any(name.startswith(f".{file}.") for file in files)
+
+    def _orphans(
+        self, names: Iterable[str], config: TransposeConfig = None
+    ) -> List[str]:
+        """
+        Get the names from the store path which have no entry in the config, sorted
+
+        Args:
+            names: The names in the store path
+            config: The config to check them against (default: the loaded config)
+        """
+        config = config or self.config
+        names = [name for name in names if name not in config.entries]
+        # Archives of frozen entries, in any store, only looked up when needed
+        if names:
+            archives = {entry.frozen for entry in config.entries.values()}
+            names = [name for name in names if name not in archives]
+        return sorted(names)
+
+    def _remove_archive(self, store: Store, archive: Optional[str]) -> None:
+        """
+        Remove the archive of a frozen entry once it's been thawed or restored
+        """
+        if archive:
+            store.path.joinpath(archive).unlink()
+            index_path = self._index_path(archive)
+            if index_path.exists():
+                index_path.unlink()
+
+    def _add_entry(self, name: str, path: Path, store: Optional[str]) -> None:
+        """
+        Add an entry to the config, recording the secondary store it was placed in
+        """
+        self.config.add(name, path)
+        if store is not None:
+            self.config.update(name, "store", store)
+
+    def _place(
+        self,
+        source_path: str,
+        stores: Optional[List[str]],
+        placement: str,
+        reserved: Dict[Path, int],
+    ) -> Store:
+        """
+        Choose the store for a path being stored, see stores.select_store
+        """
+        if not stores:
+            return self.primary_store
+
+        source_path = Path(source_path)
+        size = 0
+        if os.path.lexists(source_path):
+            size = disk_usage([source_path])[source_path]
+        candidates = [self.primary_store] + [
+            MountStore(os.path.abspath(path)) for path in stores
+        ]
+        return select_store(candidates, size, policy=placement, reserved=reserved)
+
+    def _link(self, name: str, force: bool = False) -> None:
+        """
+        Create/recreate the symlink to an entry without thawing it, see apply
+        """
+        entry = self.config.entries[name]
+        if self._resumable("restore", name, entry.path) is not None:
+            # The entry path holds a partial copy, which only the restore can complete
+            raise TransposeError(
+                f"Restore of '{name}' was interrupted, run 'transpose restore {name}' to finish it"
+            )
+
+        entry_path = Path(entry.path)
+        target_path = self._stored_path(name)
+        if entry_path.is_symlink() and entry_path.resolve() == target_path.resolve():
+            return  # Already applied, such as while frozen
+
+        if entry_path.exists():
+            if force:  # Backup the existing path
+                move(entry_path, entry_path.with_suffix(".backup"))
+            else:
+                raise TransposeError(
+                    f"Entry path already exists, cannot apply (force required): '{entry_path}'"
+                )
+
+        symlink(target_path=target_path, symlink_path=entry_path)
+
+    def _store_of(self, name: str) -> Store:
+        """
+        Get the store holding an entry, the store path unless it was placed elsewhere
+        """
+        entry = self.config.entries.get(name)
+        return get_store(entry.store if entry else None, self.primary_store)
+
+    def _stored_path(self, name: str) -> Path:
+        return self._store_of(name).entry_path(name)
+
+    def _index_path(self, archive: str) -> Path:
+        """
+        Get the path of the index of an archive, see archive.pack
+        """
+        return self.store_path.joinpath(STATE_DIR, "index", f"{archive}.json")
+
+    def _unpack(self, name: str, archive: str) -> None:
+        """
+        Extract the archive of a frozen entry to its stored path
+
+        The archive is extracted to a temporary directory in the store path first, so the
+        stored path only appears once complete. Paths already at the stored path, hydrated
+        or left by an interrupted freeze, replace their archived copies.
+        """
+        store = self._store_of(name)
+        stored_path = store.entry_path(name)
+        temp_path = store.path.joinpath(f".{name}.thaw")
+        if temp_path.is_dir():  # Left by an interrupted thaw
+            shutil.rmtree(temp_path)
+
+        temp_path.mkdir()
+        try:
+            unpack(store.path.joinpath(archive), temp_path, get_codec(archive))
+        except (OSError, EOFError) as e:  # Such as a truncated archive
+            raise TransposeError(f"Unable to thaw '{name}' from '{archive}': {e}")
+
+        if stored_path.is_dir() and not stored_path.is_symlink():
+            self._overlay(stored_path, temp_path.joinpath(name))
+            shutil.rmtree(stored_path)
+        elif os.path.lexists(stored_path):
+            stored_path.unlink()
+        os.rename(temp_path.joinpath(name), stored_path)
+        temp_path.rmdir()
+
+    @staticmethod
+    def _overlay(source: Path, destination: Path) -> None:
+        """
+        Move every file and symlink in source to the same relative path in destination
+        """
+        for root, dirs, files in os.walk(source):
+            target_root = destination.joinpath(os.path.relpath(root, source))
+            if not target_root.is_dir() or target_root.is_symlink():
+                if os.path.lexists(target_root):
+                    target_root.unlink()
+                target_root.mkdir(parents=True)
+
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    continue
+                target = target_root.joinpath(name)
+                if target.is_dir() and not target.is_symlink():
+                    shutil.rmtree(target)
+                os.replace(path, target)
+
+    def _scan_store(self) -> List[str]:
+        """
+        List the names in the store path which aren't transpose's own files, in one scandir
+        """
+        with os.scandir(self.store_path) as it:
+            return [entry.name for entry in it if not self._is_metadata(entry.name)]
+
+    @staticmethod
+    def _run_many(
+        func: Callable[[str], None], names: Iterable[str], jobs: int = 1
+    ) -> Dict[str, Optional[TransposeError]]:
+        """
+        Call func for each name in a pool of jobs workers, collecting errors instead of raising
+
+        Filesystem errors are converted to TransposeError so one failure doesn't prevent
+        recording the names that succeeded
+        """
+
+        def run(name: str) -> Optional[TransposeError]:
+            try:
+                func(name)
+            except TransposeError as e:
+                return e
+            except OSError as e:
+                return TransposeError(str(e))
+            return None
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        names = list(names)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return dict(zip(names, executor.map(run, names)))
@@ -1,13 +1,757 @@
+import errno
+import json
+import logging
+import os
 import shutil
+import stat
+import threading
+import time
 
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Dict, List, Optional
 
+logger = logging.getLogger(__name__)
 
-def move(source: Path, destination: Path) -> None:
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Files this size or larger are copied in-kernel on their own, smaller ones in batches
+LARGE_FILE_SIZE = 8 * 1024 * 1024
+SMALL_FILE_BATCH = 64
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# Seconds between progress callbacks during a copy
+PROGRESS_INTERVAL = 0.2
+
+# Errors meaning an in-kernel copy isn't supported here and a slower method should be used
+_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EBADF,
+    errno.EOPNOTSUPP,
+}
+# Errors from FICLONE meaning the filesystem (or the pair of them) can't share extents
+_REFLINK_ERRNOS = _FALLBACK_ERRNOS | {errno.ENOTTY, errno.EPERM}
+
+# ioctl number of FICLONE from linux/fs.h, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# "auto" clones files where supported, "always" fails where it isn't, "never" copies bytes
+REFLINK_MODES = ("auto", "always", "never")
+
+
+class ReflinkError(OSError):
+    """
+    A copy-on-write clone was required (reflink="always") but the filesystem can't make one
+    """
+
+
+class CopyManifest:
+    """
+    Append-only record of the files fully copied by copy_tree, so an interrupted copy
+    can resume without copying them again
+
+    Each line holds a path relative to the source with the size and mtime it had when
+    copied. A file is only skipped when resuming if the source is unchanged and the copy
+    still has the same size.
+    """
+
+    path: Path
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._copied = {}
+
+        for record in read_jsonl(self.path):
+            try:
+                relative, size, mtime_ns = record
+            except (TypeError, ValueError):
+                continue  # Not a copied file record, only costs copying it again
+            self._copied[relative] = (size, mtime_ns)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def create(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch()
+
+    def remove(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+        self._copied = {}
+
+    def is_copied(self, relative: str, st: os.stat_result, destination: str) -> bool:
+        """
+        Check if a file was recorded as copied, is unchanged since, and its copy is intact
+        """
+        if self._copied.get(relative) != (st.st_size, st.st_mtime_ns):
+            return False
+
+        try:
+            copied = os.lstat(destination)
+        except FileNotFoundError:
+            return False
+        return stat.S_ISLNK(st.st_mode) or copied.st_size == st.st_size
+
+    def record(self, files: List[tuple]) -> None:
+        """
+        Record (relative path, stat) pairs of source files which have been fully copied
+        """
+        lines = "".join(
+            json.dumps([relative, st.st_size, st.st_mtime_ns]) + "\n"
+            for relative, st in files
+        )
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(lines)
+
+
+@dataclass
+class MoveProgress:
+    source: Path
+    destination: Path
+    total_bytes: int
+    total_files: int
+    bytes_copied: int = 0
+    files_copied: int = 0
+    elapsed: float = 0.0  # Seconds
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_copied / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_copied / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+        Estimated seconds remaining at the throughput so far, None until something is copied
+        """
+        if not self.bytes_per_second:
+            return None
+        return (self.total_bytes - self.bytes_copied) / self.bytes_per_second
+
+
+@dataclass
+class MoveResult:
+    source: Path
+    destination: Path
+    strategy: str  # One of MOVE_STRATEGIES
+    duration: float  # Seconds
+
+
+def move(
+    source: Path,
+    destination: Path,
+    workers: int = None,
+    reflink: str = "auto",
+    progress: Callable[[MoveProgress], None] = None,
+    manifest: CopyManifest = None,
+) -> MoveResult:
+    """
+    Move a file or directory, choosing the cheapest strategy available
+
+    Paths on the same device are renamed atomically without walking the tree. Otherwise
+    (or if the kernel refuses the rename with EXDEV, such as across bind mounts) the tree
+    is copied with a pool of workers and the source is removed afterwards. Copied files
+    are reflinked where the filesystem supports it, such as across btrfs subvolumes.
+
+    With a manifest, an interrupted copy can be resumed by moving again with the same
+    manifest. The destination is then always the exact path to create or resume.
+
+    Args:
+        source: The path to move
+        destination: The new path, or an existing directory to move the source into
+        workers: The number of copy workers for cross-device moves (default: DEFAULT_WORKERS)
+        reflink: One of REFLINK_MODES, whether copied files are cloned copy-on-write
+        progress: Called with a MoveProgress every PROGRESS_INTERVAL while copying, and
+            once the copy completes (renames are instant and aren't reported)
+        manifest: Records the files copied so far, removed once the move completes
+
+    Returns:
+        MoveResult describing the strategy used and how long it took
+    """
+    if reflink not in REFLINK_MODES:
+        raise ValueError(f"Unknown reflink mode: '{reflink}'")
+
+    source = Path(source).expanduser()
+    destination = Path(destination).expanduser()
+
+    if manifest is None and destination.is_dir() and not destination.is_symlink():
+        destination = destination.joinpath(source.name)
+
+    options = {
+        "workers": workers,
+        "reflink": reflink,
+        "progress": progress,
+        "manifest": manifest,
+    }
+    strategy = select_move_strategy(source, destination)
+    start = time.perf_counter()
+    try:
+        MOVE_STRATEGIES[strategy](source, destination, **options)
+    except OSError as e:
+        if strategy != "rename" or e.errno != errno.EXDEV:
+            raise
+        logger.warning(f"Rename refused across devices, copying instead: '{source}'")
+        strategy = "copy"
+        MOVE_STRATEGIES[strategy](source, destination, **options)
+
+    result = MoveResult(
+        source=source,
+        destination=destination,
+        strategy=strategy,
+        duration=time.perf_counter() - start,
+    )
+    logger.info(
+        f"Moved '{source}' -> '{destination}' using {strategy} in {result.duration:.3f}s"
+    )
+    return result
+
+
+def select_move_strategy(source: Path, destination: Path) -> str:
+    """
+    Pick the name of the move strategy to use for source and destination
+    """
+    return "rename" if is_same_device(source, destination) else "copy"
+
+
+def rename_move(
+    source: Path,
+    destination: Path,
+    workers: int = None,
+    reflink: str = "auto",
+    progress: Callable[[MoveProgress], None] = None,
+    manifest: CopyManifest = None,
+) -> None:
+    """
+    Move by a single atomic rename (same device only)
+    """
+    os.rename(source, destination)
+
+
+def copy_move(
+    source: Path,
+    destination: Path,
+    workers: int = None,
+    reflink: str = "auto",
+    progress: Callable[[MoveProgress], None] = None,
+    manifest: CopyManifest = None,
+) -> None:
+    """
+    Move by copying the tree with a pool of workers, then removing the source
+    """
+    copy_tree(
+        source,
+        destination,
+        workers=workers,
+        reflink=reflink,
+        progress=progress,
+        manifest=manifest,
+    )
+    if source.is_dir() and not source.is_symlink():
+        shutil.rmtree(source)
+    else:
+        source.unlink()
+
+    if manifest:  # Only once the source is gone, an interrupted removal can resume too
+        manifest.remove()
+
+
+MOVE_STRATEGIES = {
+    "rename": rename_move,
+    "copy": copy_move,
+}
+
+
+def is_same_device(source: Path, destination: Path) -> bool:
+    """
+    Check if source and destination (or its nearest existing parent) are on the same device
     """
-    Move a file using pathlib
+    destination = Path(destination).absolute()
+    while not destination.exists() and destination != destination.parent:
+        destination = destination.parent
+
+    return os.lstat(source).st_dev == os.stat(destination).st_dev
+
+
+def copy_tree(
+    source: Path,
+    destination: Path,
+    workers: int = None,
+    reflink: str = "auto",
+    progress: Callable[[MoveProgress], None] = None,
+    manifest: CopyManifest = None,
+) -> None:
+    """
+    Copy a file, symlink or directory tree using a pool of workers
+
+    Directories are created up front, large files are copied individually in-kernel and
+    small files and symlinks are copied in batches. A partially copied destination is
+    removed if the copy fails, leaving the source untouched.
+
+    With a manifest, each file is recorded once copied and a partial destination is kept
+    if the copy fails or is interrupted. Copying again with the same manifest resumes,
+    skipping the recorded files which are unchanged.
+
+    Args:
+        source: The path to copy
+        destination: The path to create (must not exist, unless resuming)
+        workers: The number of copy workers (default: DEFAULT_WORKERS)
+        reflink: One of REFLINK_MODES, whether files are cloned copy-on-write
+        progress: Called with a MoveProgress every PROGRESS_INTERVAL, and once complete
+        manifest: Records the files copied so far, to resume from
+
+    Returns:
+        None
     """
-    shutil.move(source.expanduser(), destination.expanduser())
+    source = Path(source)
+    destination = Path(destination)
+    resume = manifest is not None and manifest.exists()
+
+    if source.is_symlink() or not source.is_dir():
+        st = os.lstat(source)
+        tracker = _ProgressTracker(progress, source, destination, st.st_size, 1)
+        existed = os.path.lexists(destination)
+        if manifest is not None:
+            manifest.create()
+        try:
+            if resume and existed:  # Single files are copied again from the start
+                os.unlink(destination)
+            _copy_entry(source, destination, reflink=reflink, tracker=tracker)
+        except BaseException:
+            if manifest is None and not existed and os.path.lexists(destination):
+                os.unlink(destination)
+            raise
+        tracker.finish()
+        return
+
+    if destination.exists() and not resume:
+        raise FileExistsError(
+            errno.EEXIST, "Destination already exists", str(destination)
+        )
+    if manifest is not None:
+        manifest.create()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        directories, large_files, small_files = _prepare_tree(
+            source, destination, manifest=manifest if resume else None
+        )
+        tracker = _ProgressTracker(
+            progress,
+            source,
+            destination,
+            total_bytes=sum(_copied_size(st) for _, _, st in large_files + small_files),
+            total_files=len(large_files) + len(small_files),
+        )
+
+        batches = [
+            small_files[i : i + SMALL_FILE_BATCH]
+            for i in range(0, len(small_files), SMALL_FILE_BATCH)
+        ]
+        with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS) as executor:
+            futures = [
+                executor.submit(_copy_batch, [file], reflink, tracker, manifest, source)
+                for file in large_files
+            ]
+            futures += [
+                executor.submit(_copy_batch, batch, reflink, tracker, manifest, source)
+                for batch in batches
+            ]
+            for future in futures:
+                future.result()
+
+        # Children first, so copying metadata doesn't get undone by later writes
+        for src_dir, dst_dir in reversed(directories):
+            shutil.copystat(src_dir, dst_dir, follow_symlinks=False)
+    except BaseException:
+        if manifest is None:
+            shutil.rmtree(destination, ignore_errors=True)
+        raise
+
+    tracker.finish()
+
+
+def copy_file(
+    source: Path,
+    destination: Path,
+    reflink: str = "auto",
+    on_copied: Callable[[int], None] = None,
+) -> None:
+    """
+    Copy the contents and metadata of a single file, as a reflink or in-kernel where supported
+
+    on_copied is called with the number of bytes each time a chunk has been copied
+    """
+    on_copied = on_copied or (lambda count: None)
+
+    with open(source, "rb") as fsrc, open(destination, "wb") as fdst:
+        if reflink != "never" and _reflink(fsrc, fdst, always=reflink == "always"):
+            on_copied(os.fstat(fsrc.fileno()).st_size)
+        else:
+            _copy_fd(fsrc, fdst, on_copied)
+
+    shutil.copystat(source, destination, follow_symlinks=False)
+
+
+def clone_file(fsrc, fdst) -> None:
+    """
+    Make fdst share the data of fsrc copy-on-write (a reflink), such as on btrfs or XFS
+    """
+    import fcntl
+
+    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _reflink(fsrc, fdst, always: bool = False) -> bool:
+    """
+    Try to clone fsrc into fdst
+
+    Returns:
+        True if cloned, False if the filesystem doesn't support it (unless always)
+    """
+    try:
+        clone_file(fsrc, fdst)
+    except OSError as e:
+        if e.errno not in _REFLINK_ERRNOS:
+            raise
+        if always:
+            raise ReflinkError(
+                e.errno, f"Unable to reflink, {e.strerror.lower()}", fsrc.name
+            )
+        return False
+
+    return True
+
+
+def _copy_batch(
+    files: List[tuple], reflink: str, tracker, manifest: CopyManifest, root: Path
+) -> None:
+    for source, destination, _ in files:
+        _copy_entry(source, destination, reflink=reflink, tracker=tracker)
+
+    if manifest is not None:
+        manifest.record([(os.path.relpath(src, root), st) for src, _, st in files])
+
+
+def _copied_size(st: os.stat_result) -> int:
+    """
+    The number of bytes copying a file involves, symlinks are only recreated
+    """
+    return 0 if stat.S_ISLNK(st.st_mode) else st.st_size
+
+
+def _copy_entry(source: Path, destination: Path, reflink: str, tracker) -> None:
+    st = os.lstat(source)
+    if stat.S_ISLNK(st.st_mode):
+        os.symlink(os.readlink(source), destination)
+    elif stat.S_ISFIFO(st.st_mode):  # Opening it would block until something writes
+        os.mkfifo(destination, stat.S_IMODE(st.st_mode))
+        shutil.copystat(source, destination, follow_symlinks=False)
+    else:
+        _check_copyable(source, st)
+        copy_file(source, destination, reflink=reflink, on_copied=tracker.add_bytes)
+    tracker.add_file()
+
+
+def _check_copyable(path: str, st: os.stat_result) -> None:
+    """
+    Raise for sockets and device nodes, whose contents can't be copied like a file's
+    """
+    if not (
+        stat.S_ISREG(st.st_mode)
+        or stat.S_ISLNK(st.st_mode)
+        or stat.S_ISFIFO(st.st_mode)
+    ):
+        raise shutil.SpecialFileError(
+            f"Not a file, directory, symlink or named pipe, unable to copy: '{path}'"
+        )
+
+
+def _copy_fd(fsrc, fdst, on_copied: Callable[[int], None]) -> None:
+    """
+    Copy between two open files using copy_file_range, then sendfile, then userspace
+    """
+    fd_in, fd_out = fsrc.fileno(), fdst.fileno()
+    copied = 0
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            while True:
+                count = os.copy_file_range(fd_in, fd_out, COPY_CHUNK_SIZE)
+                if count == 0:
+                    return
+                copied += count
+                on_copied(count)
+        except OSError as e:
+            # Unsupported by the kernel or filesystem pair, nothing written yet
+            if copied or e.errno not in _FALLBACK_ERRNOS:
+                raise
+
+    if hasattr(os, "sendfile"):
+        try:
+            while True:
+                count = os.sendfile(fd_out, fd_in, copied, COPY_CHUNK_SIZE)
+                if count == 0:
+                    return
+                copied += count
+                on_copied(count)
+        except OSError as e:
+            if copied or e.errno not in _FALLBACK_ERRNOS:
+                raise
+
+    fsrc.seek(copied)
+    fdst.seek(copied)
+    while True:
+        chunk = fsrc.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            return
+        fdst.write(chunk)
+        on_copied(len(chunk))
+
+
+def _prepare_tree(
+    source: Path, destination: Path, manifest: CopyManifest = None
+) -> tuple:
+    """
+    Walk the source tree once, creating directories and sorting files by size
+
+    Named pipes are recreated with the small files, sockets and device nodes raise
+    shutil.SpecialFileError before anything is copied.
+
+    When resuming from a manifest, existing directories are reused and files which were
+    already copied are left out. Partial copies of the other files are removed.
+
+    Returns:
+        (directories, large_files, small_files) as lists of (source, destination) pairs,
+        with the stat of each source file as a third item
+    """
+    directories = []
+    large_files = []
+    small_files = []
+
+    stack = [(str(source), str(destination))]
+    while stack:
+        src_dir, dst_dir = stack.pop()
+        try:
+            os.mkdir(dst_dir)
+        except FileExistsError:
+            if manifest is None or not os.path.isdir(dst_dir):
+                raise
+        directories.append((src_dir, dst_dir))
+
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                dst = os.path.join(dst_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, dst))
+                    continue
+
+                st = entry.stat(follow_symlinks=False)
+                _check_copyable(entry.path, st)  # Before any file is copied
+                if manifest is not None:
+                    relative = os.path.relpath(entry.path, source)
+                    if manifest.is_copied(relative, st, dst):
+                        continue
+                    if os.path.lexists(dst):
+                        os.unlink(dst)
+
+                large = _copied_size(st) >= LARGE_FILE_SIZE
+                (large_files if large else small_files).append((entry.path, dst, st))
+
+    return directories, large_files, small_files
+
+
+class _ProgressTracker:
+    """
+    Totals the bytes and files copied by the workers of a copy, reporting a MoveProgress
+    at most every PROGRESS_INTERVAL
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[MoveProgress], None]],
+        source: Path,
+        destination: Path,
+        total_bytes: int,
+        total_files: int,
+    ) -> None:
+        self.callback = callback
+        self.progress = MoveProgress(
+            source=Path(source),
+            destination=Path(destination),
+            total_bytes=total_bytes,
+            total_files=total_files,
+        )
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._reported = self._start
+
+    def add_bytes(self, count: int) -> None:
+        self._add(count, 0)
+
+    def add_file(self) -> None:
+        self._add(0, 1)
+
+    def finish(self) -> None:
+        self._add(0, 0, force=True)
+
+    def _add(self, count: int, files: int, force: bool = False) -> None:
+        if self.callback is None:
+            return
+
+        with self._lock:
+            self.progress.bytes_copied += count
+            self.progress.files_copied += files
+            now = time.perf_counter()
+            if not force and now - self._reported < PROGRESS_INTERVAL:
+                return
+            self._reported = now
+            self.progress.elapsed = now - self._start
+            snapshot = MoveProgress(**vars(self.progress))
+
+        self.callback(snapshot)
+
+
+def disk_usage(paths: List[Path], workers: int = None) -> Dict[Path, int]:
+    """
+    Measure the disk usage of several files or directory trees, like `du -s`
+
+    Every directory found is listed as a separate task in a pool of workers, so large
+    trees are walked in parallel too. Hardlinked files are only counted once.
+
+    Args:
+        paths: The paths to measure
+        workers: The number of directories to list concurrently (default: DEFAULT_WORKERS)
+
+    Returns:
+        Each path mapped to its size in bytes
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    totals = dict.fromkeys(paths, 0)
+    inodes = set()
+    lock = threading.Lock()
+
+    def usage(st: os.stat_result) -> int:
+        if st.st_nlink > 1 and not stat.S_ISDIR(st.st_mode):
+            with lock:
+                if (st.st_dev, st.st_ino) in inodes:
+                    return 0
+                inodes.add((st.st_dev, st.st_ino))
+        return getattr(st, "st_blocks", 0) * 512 or st.st_size
+
+    def walk(root: Path, directory: str) -> tuple:
+        size = 0
+        subdirectories = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                size += usage(entry.stat(follow_symlinks=False))
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+
+        with lock:
+            totals[root] += size
+        return root, subdirectories
+
+    for path in paths:
+        totals[path] = usage(os.lstat(path))
+
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS) as executor:
+        futures = {
+            executor.submit(walk, path, str(path))
+            for path in paths
+            if Path(path).is_dir() and not Path(path).is_symlink()
+        }
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                root, subdirectories = future.result()
+                futures |= {executor.submit(walk, root, d) for d in subdirectories}
+
+    return totals
+
+
+def write_atomic(path: Path, data: str) -> None:
+    """
+    Replace the contents of a file so readers only ever see the old or new contents
+
+    The data is written to a temporary file in the same directory, synced to disk,
+    and renamed over the original
+
+    Args:
+        path: The file to write
+        data: The new contents of the file
+
+    Returns:
+        None
+    """
+    import tempfile
+
+    path = Path(path)
+    fd, temp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates files only readable by the owner, keep the usual permissions instead
+        os.chmod(temp_path, path.stat().st_mode if path.exists() else 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+    fsync_directory(path.parent)
+
+
+def read_jsonl(path: Path) -> list:
+    """
+    Read the records of an append-only file of JSON lines, such as the journal
+
+    A line torn by a crash mid-append isn't valid JSON and is skipped. Later appends can
+    follow it, so it isn't always the last line.
+
+    Args:
+        path: The file to read, which may not exist yet
+
+    Returns:
+        The decoded records in the order they were appended
+    """
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.decoder.JSONDecodeError:
+            continue
+    return records
+
+
+def fsync_directory(path: Path) -> None:
+    """
+    Sync a directory so renames and new files within it survive a crash
+    """
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:  # Not supported by every filesystem
+        pass
+    finally:
+        os.close(fd)
 
 
 def remove(path: Path) -> None:
@@ -0,0 +1,311 @@
+from pathlib import Path
+from typing import Callable, List, Set, Tuple
+
+import logging
+import os
+import struct
+import threading
+
+from .backends import JsonBackend
+from .exceptions import TransposeError
+from .transpose import Transpose, TransposeConfig, TransposeStatus
+
+logger = logging.getLogger(__name__)
+
+# Wait this long after the last event before checking, so a burst of changes (such as a
+# package manager replacing a directory) is handled once, after it's done
+DEBOUNCE_SECONDS = 0.5
+# How often to retry watching missing parent directories, and check for stop
+POLL_INTERVAL = 1.0
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Changes to the names in a directory, and to the directory itself
+WATCH_MASK = (
+    IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+# The log backend appends to the config rather than replacing it
+STORE_MASK = WATCH_MASK | IN_CLOSE_WRITE
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Inotify:
+    """
+    Minimal binding of inotify(7) using ctypes, so watching needs no extra dependencies
+    """
+
+    fd: int
+
+    def __init__(self) -> None:
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            init = libc.inotify_init1
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+        except AttributeError:
+            raise TransposeError("Watching requires inotify, which is only on Linux")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._get_errno = ctypes.get_errno
+
+        self.fd = self._check(init(IN_NONBLOCK | IN_CLOEXEC))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """
+        Watch a path for events in the mask, raising OSError if it can't be watched
+
+        Returns:
+            The watch descriptor, which is the same for every watch on the same inode
+        """
+        return self._check(self._add_watch(self.fd, os.fsencode(path), mask), path)
+
+    def remove_watch(self, wd: int) -> None:
+        self._rm_watch(self.fd, wd)  # Fails harmlessly if the path was already removed
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        """
+        Read the pending events without blocking
+
+        Returns:
+            (watch descriptor, mask, name) of each event, name being empty for events on
+            the watched directory itself
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def __enter__(self) -> "Inotify":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _check(self, result: int, path: str = None) -> int:
+        if result < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return result
+
+
+class EntryWatcher:
+    """
+    Repairs entries as soon as their symlinks change, instead of periodic apply-all runs
+
+    The parent directory of every enabled entry path is watched with inotify, along with
+    the store path for changes to the config and stored paths. After a burst of events,
+    the entries named by them are checked and repaired with Transpose.repair.
+    """
+
+    transpose: Transpose
+    force: bool
+    debounce: float
+
+    def __init__(
+        self, t: Transpose, force: bool = False, debounce: float = DEBOUNCE_SECONDS
+    ) -> None:
+        """
+        Args:
+            t: An instance of Transpose
+            force: Also repair entries whose path was replaced, see Transpose.repair
+            debounce: The seconds without events to wait before checking
+        """
+        self.transpose = t
+        self.force = force
+        self.debounce = debounce
+        self._inotify = None
+        self._watches = {}  # Directory mapped to its watch descriptor
+        self._dirs = {}  # Watch descriptor mapped to the directories it watches
+        self._names = {}  # Directory mapped to the entries named by each name in it
+        self._missing = set()  # Parent directories which don't exist yet
+
+    def run(
+        self,
+        on_repair: Callable[[TransposeStatus, str], None],
+        stop: threading.Event = None,
+    ) -> None:
+        """
+        Check every entry, then watch them until stopped
+
+        Args:
+            on_repair: Called with the status and outcome of each entry which wasn't ok,
+                see Transpose.repair
+            stop: Set to stop watching (within POLL_INTERVAL)
+
+        Returns:
+            None
+        """
+        import select
+
+        stop = stop or threading.Event()
+        with Inotify() as inotify:
+            self._inotify = inotify
+            self._sync()
+            pending = set(self.transpose.config.entries)
+
+            while not stop.is_set():
+                if pending:
+                    pending = self._repair(pending, on_repair)
+
+                ready, _, _ = select.select([inotify], [], [], POLL_INTERVAL)
+                if not ready:
+                    if self._missing:
+                        pending |= self._sync()
+                    continue
+
+                # Keep collecting until the burst is over
+                while ready:
+                    pending |= self._handle(inotify.read_events())
+                    ready, _, _ = select.select([inotify], [], [], self.debounce)
+
+    def _repair(
+        self, names: Set[str], on_repair: Callable[[TransposeStatus, str], None]
+    ) -> Set[str]:
+        """
+        Repair the entries unless operations are running, which move entry paths on purpose
+
+        Returns:
+            The names to try again later
+        """
+        t = self.transpose
+        with t.journal.lock.exclusive(blocking=False) as idle:
+            if not idle:
+                logger.info("Transpose is running elsewhere, checking again later")
+                return names
+
+            if t.config.backend.is_stale(t.config_path):
+                # Entries may have been stored or restored since loading
+                t.config = TransposeConfig.load(t.config_path, t.config.backend.name)
+                names |= self._sync()
+
+            names = [
+                name
+                for name in names
+                if name in t.config.entries and t.config.entries[name].enabled
+            ]
+            for status, outcome in t.repair(names, force=self.force):
+                on_repair(status, outcome)
+
+        return set()
+
+    def _handle(self, events: List[Tuple[int, int, str]]) -> Set[str]:
+        """
+        Get the names of the entries affected by inotify events
+        """
+        t = self.transpose
+        names = set()
+        for wd, mask, name in events:
+            # Events were dropped, so anything may have changed
+            if mask & IN_Q_OVERFLOW:
+                names |= set(t.config.entries)
+                continue
+
+            for directory in list(self._dirs.get(wd, ())):
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    # The directory is gone, and so are the entry paths in it
+                    self._unwatch(directory)
+                    self._missing.add(directory)
+                    names |= self._entries_in(directory)
+                    continue
+
+                names |= self._names[directory].get(name, set())
+                # A stored path, or the config (reloaded by _repair, then ignored)
+                if directory == str(t.store_path) and (
+                    name in t.config.entries or name in self._config_files()
+                ):
+                    names.add(name)
+
+        return names
+
+    def _sync(self) -> Set[str]:
+        """
+        Watch the parent directories of the enabled entries and the store path, and stop
+        watching directories without entries
+
+        Returns:
+            The names of the entries in directories which weren't watched before
+        """
+        t = self.transpose
+        names = {str(t.store_path): {}}
+        for name, entry in t.config.entries.items():
+            if entry.enabled:
+                path = Path(os.path.abspath(os.path.expanduser(entry.path)))
+                names.setdefault(str(path.parent), {}).setdefault(path.name, set()).add(
+                    name
+                )
+        self._names = names
+
+        for directory in set(self._watches) - set(names):
+            self._unwatch(directory)
+
+        added = set()
+        self._missing = set()
+        for directory in set(names) - set(self._watches):
+            try:
+                mask = STORE_MASK if directory == str(t.store_path) else WATCH_MASK
+                wd = self._inotify.add_watch(directory, mask)
+            except (FileNotFoundError, NotADirectoryError):
+                self._missing.add(directory)
+                continue
+            except OSError as e:
+                # Such as running out of watches (fs.inotify.max_user_watches)
+                logger.warning(f"Unable to watch '{directory}': {e}")
+                continue
+
+            self._watches[directory] = wd
+            self._dirs.setdefault(wd, set()).add(directory)
+            added |= self._entries_in(directory)
+
+        return added
+
+    def _entries_in(self, directory: str) -> Set[str]:
+        return set().union(*self._names[directory].values())
+
+    def _unwatch(self, directory: str) -> None:
+        wd = self._watches.pop(directory, None)
+        if wd is None:
+            return
+
+        self._dirs[wd].discard(directory)
+        if not self._dirs[wd]:  # Not also watched under another path
+            del self._dirs[wd]
+            self._inotify.remove_watch(wd)
+
+    def _config_files(self) -> Set[str]:
+        config_path = self.transpose.config_path
+        return {config_path.name, JsonBackend.log_path(config_path).name}
@@ -0,0 +1,99 @@
+import os
+import pytest
+
+from transpose import archive
+from transpose.archive import (
+    extract,
+    get_codec,
+    get_codecs,
+    match_members,
+    pack,
+    unpack,
+)
+from transpose.exceptions import TransposeError
+
+from .utils import STORE_PATH, setup_store
+
+SOURCE_PATH = STORE_PATH.joinpath("Source")
+
+
+@setup_store()
+@pytest.mark.parametrize("codec", get_codecs(), ids=lambda codec: codec.suffix)
+def test_pack_unpack(monkeypatch, codec):
+    monkeypatch.setattr(archive, "ARCHIVE_CHUNK_SIZE", 4096)  # Many chunks
+
+    SOURCE_PATH.joinpath("nested").mkdir(parents=True)
+    data = os.urandom(20000) * 2
+    SOURCE_PATH.joinpath("nested", "file.bin").write_bytes(data)
+    os.link(
+        SOURCE_PATH.joinpath("nested", "file.bin"), SOURCE_PATH.joinpath("hardlink")
+    )
+    SOURCE_PATH.joinpath("absolute").symlink_to("/nonexistent/target")
+
+    archive_path = STORE_PATH.joinpath(f"Source{codec.suffix}")
+    pack(SOURCE_PATH, archive_path, codec, workers=3)
+    assert get_codec(archive_path.name).suffix == codec.suffix
+
+    destination = STORE_PATH.joinpath("thawed")
+    destination.mkdir()
+    unpack(archive_path, destination, codec)
+
+    thawed = destination.joinpath("Source")
+    assert thawed.joinpath("nested", "file.bin").read_bytes() == data
+    assert thawed.joinpath("hardlink").stat().st_ino == (
+        thawed.joinpath("nested", "file.bin").stat().st_ino
+    )
+    assert os.readlink(thawed.joinpath("absolute")) == "/nonexistent/target"
+
+
+@setup_store()
+@pytest.mark.parametrize("codec", get_codecs(), ids=lambda codec: codec.suffix)
+def test_extract(monkeypatch, codec):
+    monkeypatch.setattr(archive, "ARCHIVE_CHUNK_SIZE", 4096)
+
+    SOURCE_PATH.joinpath("nested", "deeper").mkdir(parents=True)
+    data = os.urandom(10000)
+    SOURCE_PATH.joinpath("nested", "deeper", "file.bin").write_bytes(data)
+    SOURCE_PATH.joinpath("nested", "small.conf").write_text("small")
+    SOURCE_PATH.joinpath("other.conf").write_text("other")
+    os.link(SOURCE_PATH.joinpath("other.conf"), SOURCE_PATH.joinpath("zlink"))
+    SOURCE_PATH.joinpath("link").symlink_to("nested")
+
+    archive_path = STORE_PATH.joinpath(f"Source{codec.suffix}")
+    index = pack(SOURCE_PATH, archive_path, codec)
+    assert len(index["chunks"]) > 2
+
+    assert match_members(index, "*.conf") == ["nested/small.conf", "other.conf"]
+    assert match_members(index, "nested/deeper") == [
+        "nested/deeper",
+        "nested/deeper/file.bin",
+    ]
+
+    destination = STORE_PATH.joinpath("hydrated")
+    destination.mkdir()
+    names = match_members(index, "nested/deeper") + ["link", "zlink"]
+    assert extract(archive_path, index, names, destination, codec) == [
+        "link",
+        "nested/deeper",
+        "nested/deeper/file.bin",
+        "other.conf",  # The target of the hardlink
+        "zlink",
+    ]
+    assert destination.joinpath("nested", "deeper", "file.bin").read_bytes() == data
+    assert os.readlink(destination.joinpath("link")) == "nested"
+    assert destination.joinpath("zlink").read_text() == "other"
+    assert not destination.joinpath("nested", "small.conf").exists()
+
+    # Paths which already exist are skipped
+    destination.joinpath("other.conf").unlink()
+    destination.joinpath("zlink").write_text("changed")
+    assert extract(archive_path, index, ["zlink"], destination, codec) == []
+    assert destination.joinpath("zlink").read_text() == "changed"
+
+
+def test_get_codec():
+    assert get_codec().suffix == get_codecs()[0].suffix
+    assert get_codec("Name.tar.gz").suffix == ".tar.gz"
+
+    with pytest.raises(TransposeError, match="Unsupported archive format"):
+        get_codec("Name.tar.bz2")
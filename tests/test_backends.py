@@ -0,0 +1,172 @@
+import sqlite3
+import pytest
+
+from transpose import Transpose, TransposeConfig
+from transpose.backends import SqliteBackend, SqliteEntries, get_backend
+from transpose.exceptions import TransposeError
+from transpose.transpose import TransposeStatus, default_config_path
+
+from .utils import (
+    ENTRY_NAME,
+    SECOND_ENTRY_NAME,
+    STORE_PATH,
+    TARGET_PATH,
+    TRANSPOSE_CONFIG_PATH,
+    setup_store,
+)
+
+DB_PATH = STORE_PATH.joinpath("transpose.db")
+
+
+def _rows() -> dict:
+    with sqlite3.connect(str(DB_PATH)) as db:
+        return {
+            name: path for name, path in db.execute("SELECT name, path FROM entries")
+        }
+
+
+@setup_store()
+def test_get_backend():
+    assert isinstance(get_backend("sqlite"), SqliteBackend)
+
+    with pytest.raises(TransposeError, match="Unknown Transpose config backend"):
+        get_backend("xml")
+
+
+@setup_store()
+def test_sqlite_migrate():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.backend = get_backend("sqlite")
+    config.save(DB_PATH)
+
+    assert _rows() == {
+        ENTRY_NAME: config.entries[ENTRY_NAME].path,
+        SECOND_ENTRY_NAME: config.entries[SECOND_ENTRY_NAME].path,
+    }
+
+    loaded = TransposeConfig.load(DB_PATH)
+    assert isinstance(loaded.backend, SqliteBackend)
+    assert loaded.entries == config.entries
+
+
+@setup_store()
+def test_sqlite_incremental():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.backend = get_backend("sqlite")
+    config.save(DB_PATH)
+
+    config = TransposeConfig.load(DB_PATH)
+    config.add("NewEntry", TARGET_PATH)
+    config.disable(ENTRY_NAME)
+    config.remove(SECOND_ENTRY_NAME)
+    config.update("NewEntry", "path", "/some/new/path")
+    config.save(DB_PATH)
+
+    assert _rows() == {
+        ENTRY_NAME: str(TARGET_PATH),
+        "NewEntry": "/some/new/path",
+    }
+
+    config = TransposeConfig.load(DB_PATH)
+    assert config.entries[ENTRY_NAME].enabled is False
+    assert config.entries["NewEntry"].path == "/some/new/path"
+
+    with sqlite3.connect(str(DB_PATH)) as db:
+        indexes = [row[0] for row in db.execute("SELECT name FROM sqlite_master")]
+    assert "entries_path" in indexes
+
+
+@setup_store()
+def test_sqlite_remove_saved():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.backend = get_backend("sqlite")
+    config.save(DB_PATH)
+
+    # The rows are gone from the live entries once saved, so aren't subtracted again
+    t = Transpose(config_path=DB_PATH)
+    t.config.remove(ENTRY_NAME)
+    t.config.save(DB_PATH)
+    assert len(t.config.entries) == 1
+    assert list(t.config.entries) == [SECOND_ENTRY_NAME]
+
+    t.config.remove(SECOND_ENTRY_NAME)
+    t.config.save(DB_PATH)
+    assert len(t.config.entries) == 0
+    assert sorted(t.config.entries) == []
+    assert {status.status for status in t.check()} <= {TransposeStatus.ORPHAN}
+
+
+@setup_store()
+def test_sqlite_stale():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.backend = get_backend("sqlite")
+    config.save(DB_PATH)
+    assert not config.backend.is_stale(DB_PATH)
+
+    loaded = TransposeConfig.load(DB_PATH)
+    other = TransposeConfig.load(DB_PATH)
+    other.remove(ENTRY_NAME)
+    other.save(DB_PATH)
+    assert loaded.backend.is_stale(DB_PATH)
+    assert not other.backend.is_stale(DB_PATH)
+
+    # Saving keeps the other process's rows, but stays stale until reloaded
+    loaded.disable(SECOND_ENTRY_NAME)
+    loaded.save(DB_PATH)
+    assert loaded.backend.is_stale(DB_PATH)
+    assert _rows() == {SECOND_ENTRY_NAME: config.entries[SECOND_ENTRY_NAME].path}
+    assert not TransposeConfig.load(DB_PATH).entries[SECOND_ENTRY_NAME].enabled
+
+
+@setup_store()
+def test_sqlite_lazy_entries():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.backend = get_backend("sqlite")
+    config.save(DB_PATH)
+
+    config = TransposeConfig.load(DB_PATH)
+    raw = config.entries._raw
+    assert isinstance(raw, SqliteEntries)
+    assert len(raw) == 2
+    assert list(raw) == [ENTRY_NAME, SECOND_ENTRY_NAME]
+    assert ENTRY_NAME in raw
+    assert "UnknownEntry" not in raw
+    assert raw[ENTRY_NAME]["path"] == str(TARGET_PATH)
+
+    assert config.get(SECOND_ENTRY_NAME).name == SECOND_ENTRY_NAME
+    with pytest.raises(TransposeError, match="does not exist"):
+        config.get("UnknownEntry")
+
+
+@setup_store()
+def test_sqlite_find_by_path():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.update(ENTRY_NAME, "path", str(TARGET_PATH.absolute()))
+    config.backend = get_backend("sqlite")
+    config.save(DB_PATH)
+
+    config = TransposeConfig.load(DB_PATH)
+    assert config.find_by_path(TARGET_PATH.joinpath("file")).name == ENTRY_NAME
+
+    config.remove(ENTRY_NAME)
+    assert config.find_by_path(TARGET_PATH.joinpath("file")) is None
+
+
+@setup_store()
+def test_sqlite_invalid():
+    DB_PATH.write_text("not a database")
+
+    with pytest.raises(TransposeError, match="Invalid SQLite config"):
+        TransposeConfig.load(DB_PATH)
+
+
+@setup_store()
+def test_sqlite_transpose():
+    assert default_config_path(STORE_PATH) == TRANSPOSE_CONFIG_PATH
+
+    t = Transpose(config_path=DB_PATH)
+    t.store("TestEntry", TARGET_PATH)
+
+    assert default_config_path(STORE_PATH) == DB_PATH
+    assert _rows() == {"TestEntry": str(TARGET_PATH)}
+    assert t.journal.pending() == []
@@ -1,13 +1,25 @@
+import io
+import json
 import pytest
 
 from pathlib import Path
 
-from transpose import TransposeConfig
-from transpose.console import parse_arguments, run as run_console
+from transpose import TransposeConfig, utils
+from transpose.exceptions import TransposeError
+from transpose.console import (
+    format_duration,
+    format_progress,
+    format_size,
+    parse_arguments,
+    progress_line,
+    run as run_console,
+)
+from transpose.utils import MoveProgress
 
 from .utils import (
     setup_restore,
     setup_apply,
+    setup_store,
     ENTRY_NAME,
     SECOND_ENTRY_NAME,
     STORE_PATH,
@@ -22,6 +34,12 @@ class RunActionArgs:
     path: str = str(TARGET_PATH)
     action: str
     force: bool
+    jobs: int = 1
+    dedup: bool = False
+    reflink: str = "auto"
+    stores: list = None
+    placement: str = "free-space"
+    output: str = "table"
 
     def __init__(self, action: str, force: bool = False) -> None:
         self.action = action
@@ -33,6 +51,7 @@ class RunConfigArgs:
     action: str = "config"
     force: bool = False
     path: str = str(TARGET_PATH)
+    output: str = "table"
     config_action: str
 
     def __init__(self, config_action: str) -> None:
@@ -53,6 +72,10 @@ def test_parse_arguments():
         ]
     )
     assert args.store_path == "/mnt/store"
+    assert args.verbose is False
+
+    args = parse_arguments(["-v", "restore", "SomeName"])
+    assert args.verbose is True
 
 
 def test_parse_arguments_apply():
@@ -68,6 +91,18 @@ def test_parse_arguments_apply():
     assert args.force is True
 
 
+def test_parse_arguments_apply_all():
+    args = parse_arguments(["apply-all"])
+    assert args.action == "apply-all"
+    assert args.jobs == 1
+
+    args = parse_arguments(["apply-all", "--jobs", "8"])
+    assert args.jobs == 8
+
+    with pytest.raises(SystemExit):  # Invalid jobs
+        parse_arguments(["apply-all", "--jobs", "0"])
+
+
 def test_parse_arguments_config():
     with pytest.raises(SystemExit):  # Missing required args: config_action
         parse_arguments(["config"])
@@ -120,6 +155,43 @@ def test_parse_arguments_store():
     assert args.action == "store"
     assert args.name == "My Name"
     assert args.target_path == "/tmp/some/path"
+    assert args.also == []
+
+    args = parse_arguments(["store", "/tmp/a", "--also", "/tmp/b", "/tmp/c", "-j", "4"])
+    assert args.target_path == "/tmp/a"
+    assert args.name is None
+    assert args.also == ["/tmp/b", "/tmp/c"]
+    assert args.jobs == 4
+    assert args.dedup is False
+
+    args = parse_arguments(["store", "/tmp/a", "--dedup"])
+    assert args.dedup is True
+    assert args.reflink == "auto"
+
+    args = parse_arguments(["store", "/tmp/a", "--reflink=always"])
+    assert args.reflink == "always"
+    assert args.stores is None
+    assert args.placement == "free-space"
+
+    args = parse_arguments(
+        ["store", "/tmp/a", "--secondary", "/mnt/a", "--secondary", "/mnt/b"]
+        + ["--placement", "size-class"]
+    )
+    assert args.stores == ["/mnt/a", "/mnt/b"]
+    assert args.placement == "size-class"
+
+    with pytest.raises(SystemExit):  # Invalid reflink mode
+        parse_arguments(["store", "/tmp/a", "--reflink=sometimes"])
+
+
+def test_parse_arguments_dedup():
+    args = parse_arguments(["dedup", "-j", "2"])
+    assert args.action == "dedup"
+    assert args.jobs == 2
+    assert args.hardlink is False
+
+    args = parse_arguments(["dedup", "--hardlink"])
+    assert args.hardlink is True
 
 
 def test_parse_arguments_restore():
@@ -128,11 +200,19 @@ def test_parse_arguments_restore():
 
     args = parse_arguments(["restore", "SomeName"])
     assert args.action == "restore"
-    assert args.name == "SomeName"
+    assert args.name == ["SomeName"]
+    assert args.jobs == 1
 
     args = parse_arguments(["restore", "SomeName", "--force"])
     assert args.force is True
 
+    args = parse_arguments(["restore", "SomeName", "OtherName", "--jobs", "2"])
+    assert args.name == ["SomeName", "OtherName"]
+    assert args.jobs == 2
+
+    args = parse_arguments(["restore", "SomeName", "--reflink", "never"])
+    assert args.reflink == "never"
+
 
 @setup_apply()
 def test_run_apply():
@@ -165,14 +245,298 @@ def test_run_apply_all(capsys):
     assert SECOND_TARGET_PATH.with_suffix(".backup").is_dir()
 
 
+@setup_apply()
+def test_run_apply_all_jobs(capsys):
+    args = RunActionArgs("apply-all", True)
+    args.jobs = 4
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    captured = capsys.readouterr()
+
+    assert captured.out.splitlines() == [
+        f"\t{ENTRY_NAME:<30}: success",
+        f"\t{SECOND_ENTRY_NAME:<30}: success",
+    ]
+    assert TARGET_PATH.is_symlink()
+    assert SECOND_TARGET_PATH.is_symlink()
+
+
+def test_parse_arguments_status():
+    args = parse_arguments(["status"])
+    assert args.action == "status"
+    assert args.output == "table"
+
+    args = parse_arguments(["status", "--output", "json", "-j", "2"])
+    assert args.output == "json"
+    assert args.jobs == 2
+
+
+@setup_apply()
+def test_run_status(capsys):
+    args = RunActionArgs("status")
+    args.output = "table"
+    args.jobs = 2
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    captured = capsys.readouterr()
+    assert f"\t{ENTRY_NAME:<30} {'missing link':<14} {TARGET_PATH}" in captured.out
+
+    args.output = "json"
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    statuses = json.loads(capsys.readouterr().out)
+    assert statuses[1] == {
+        "name": SECOND_ENTRY_NAME,
+        "path": str(SECOND_TARGET_PATH),
+        "status": "not a link",
+        "target": None,
+    }
+
+
+def test_parse_arguments_output():
+    assert parse_arguments(["config", "list"]).output == "table"
+    assert parse_arguments(["--output", "ndjson", "config", "list"]).output == "ndjson"
+    assert parse_arguments(["apply-all", "--output", "json"]).output == "json"
+
+    with pytest.raises(SystemExit):  # Invalid output
+        parse_arguments(["--output", "xml", "apply-all"])
+
+
+@setup_apply()
+def test_run_apply_all_output(capsys):
+    args = RunActionArgs("apply-all")
+    args.output = "ndjson"
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert records[0] == {"name": ENTRY_NAME, "error": None}
+    assert records[1]["name"] == SECOND_ENTRY_NAME
+    assert records[1]["error"].startswith("Entry path already exists")
+
+    args.output = "json"
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    assert len(json.loads(capsys.readouterr().out)) == 2
+
+
+@setup_store()
+def test_run_output_empty(capsys):
+    TRANSPOSE_CONFIG_PATH.unlink()
+    args = RunConfigArgs("list")
+    args.output = "json"
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    assert json.loads(capsys.readouterr().out) == []
+
+
+@setup_restore()
+def test_run_freeze(capsys):
+    STORE_PATH.joinpath(ENTRY_NAME, "file.txt").write_text("frozen")
+    args = RunActionArgs("freeze")
+    args.output = "json"
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    result = json.loads(capsys.readouterr().out)
+    assert result["name"] == ENTRY_NAME
+    assert STORE_PATH.joinpath(result["archive"]).stat().st_size == result["size"]
+
+    args.action = "hydrate"
+    args.pattern = "*.txt"
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    assert json.loads(capsys.readouterr().out) == [
+        {"name": ENTRY_NAME, "path": "file.txt"}
+    ]
+
+    args.action = "thaw"
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    assert json.loads(capsys.readouterr().out) == {"name": ENTRY_NAME, "error": None}
+    assert STORE_PATH.joinpath(ENTRY_NAME).is_dir()
+
+
+@setup_restore()
+def test_run_snapshot(capsys):
+    run_console(RunActionArgs("snapshot"), TRANSPOSE_CONFIG_PATH)
+    assert capsys.readouterr().out.startswith("Snapshot ")
+
+    args = parse_arguments(["snapshot", "-j", "2"])
+    assert args.action == "snapshot"
+    assert args.jobs == 2
+
+
+def test_parse_arguments_sync():
+    args = parse_arguments(["sync", "/mnt/backup", "--checksum", "-j", "2"])
+    assert args.action == "sync"
+    assert args.destination == "/mnt/backup"
+    assert args.checksum is True
+    assert args.jobs == 2
+
+
+def test_parse_arguments_gc():
+    args = parse_arguments(["gc"])
+    assert args.action == "gc"
+    assert args.dry_run is False
+
+    args = parse_arguments(["gc", "--dry-run", "-j", "2"])
+    assert args.dry_run is True
+    assert args.jobs == 2
+
+
+@setup_store()
+def test_run_gc(capsys):
+    STORE_PATH.joinpath("orphan.txt").write_text("orphaned")
+    args = RunActionArgs("gc")
+    args.dry_run = True
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    captured = capsys.readouterr()
+    assert f"\t{'orphan.txt':<30} " in captured.out
+    assert "Would reclaim" in captured.out
+    assert "from 3 orphan(s)" in captured.out  # Plus the invalid config fixtures
+    assert STORE_PATH.joinpath("orphan.txt").exists()
+
+    args.dry_run = False
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    assert "Reclaimed" in capsys.readouterr().out
+    assert not STORE_PATH.joinpath("orphan.txt").exists()
+
+
+def test_format_size():
+    assert format_size(512) == "512 B"
+    assert format_size(1536) == "1.5 KiB"
+    assert format_size(3 * 1024**3) == "3.0 GiB"
+
+
+def test_format_progress():
+    progress = MoveProgress(
+        source=Path("/tmp/zsh"),
+        destination=STORE_PATH.joinpath("zsh"),
+        total_bytes=4 * 1024**3,
+        total_files=100,
+        bytes_copied=1024**3,
+        files_copied=25,
+        elapsed=10,
+    )
+    assert format_progress(progress) == (
+        "zsh: 1.0 GiB / 4.0 GiB (25%), 102.4 MiB/s, 2 files/s, ETA 30s"
+    )
+
+    progress.bytes_copied = progress.files_copied = 0
+    assert format_progress(progress).endswith("0 files/s, ETA --")
+
+
+def test_format_duration():
+    assert format_duration(None) == "--"
+    assert format_duration(12.5) == "12s"
+    assert format_duration(410) == "6m 50s"
+    assert format_duration(3720) == "1h 02m"
+
+
+def test_progress_line():
+    class Terminal(io.StringIO):
+        def isatty(self):
+            return True
+
+    with progress_line(io.StringIO()) as progress:
+        assert progress is None
+
+    stream = Terminal()
+    with progress_line(stream) as progress:
+        progress(MoveProgress(Path("/tmp/zsh"), STORE_PATH, 10, 1, 5, 0, 1.0))
+        progress(MoveProgress(Path("/tmp/zsh"), STORE_PATH, 10, 1, 10, 1, 2.0))
+    assert stream.getvalue().count("\r") == 2
+    assert stream.getvalue().endswith("ETA 0s\x1b[K\n")
+
+
+def test_parse_arguments_which():
+    with pytest.raises(SystemExit):  # Missing required args: path
+        parse_arguments(["which"])
+
+    args = parse_arguments(["which", "/tmp/some/path"])
+    assert args.action == "which"
+    assert args.path == "/tmp/some/path"
+
+
+@setup_restore()
+def test_run_which(capsys):
+    args = RunActionArgs("which")
+    args.path = str(TARGET_PATH.joinpath("some/file"))
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    captured = capsys.readouterr()
+
+    assert captured.out == f"{ENTRY_NAME} -> {TARGET_PATH}\n"
+
+    args.path = "/"
+    with pytest.raises(TransposeError, match="Path is not managed by any entry"):
+        run_console(args, TRANSPOSE_CONFIG_PATH)
+
+
 def test_run_restore():
     pass
 
 
+@setup_apply()
+def test_run_restore_many(capsys):
+    args = RunActionArgs("restore", False)
+    args.name = [ENTRY_NAME, SECOND_ENTRY_NAME]
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    captured = capsys.readouterr()
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+
+    assert f"\t{ENTRY_NAME:<30}: success" in captured.out
+    assert f"\t{SECOND_ENTRY_NAME:<30}: Entry path already exists" in captured.out
+    assert TARGET_PATH.is_dir()
+    assert not config.entries.get(ENTRY_NAME)
+    assert config.entries.get(SECOND_ENTRY_NAME)
+
+
 def test_run_store():
     pass
 
 
+@setup_store()
+def test_run_store_dedup(capsys, monkeypatch):
+    monkeypatch.setattr(utils, "clone_file", lambda fsrc, fdst: fdst.write(fsrc.read()))
+    STORE_PATH.joinpath("Existing").mkdir()
+    STORE_PATH.joinpath("Existing", "file.bin").write_bytes(b"x" * 8192)
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.add("Existing", str(TARGET_PATH.with_name("existing")))
+    config.save(TRANSPOSE_CONFIG_PATH)
+    TARGET_PATH.joinpath("file.bin").write_bytes(b"x" * 8192)
+
+    args = RunActionArgs("store", False)
+    args.name = None
+    args.target_path = str(TARGET_PATH)
+    args.also = []
+    args.dedup = True
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    assert "Deduplicated 1 file(s), reclaimed" in capsys.readouterr().out
+    assert TARGET_PATH.joinpath("file.bin").stat().st_nlink == 1  # A clone
+
+
+@setup_store()
+def test_run_store_many(capsys):
+    other_path = TARGET_PATH.with_name("other")
+    other_path.mkdir()
+
+    args = RunActionArgs("store", False)
+    args.name = None
+    args.target_path = str(TARGET_PATH)
+    args.also = [str(other_path), "UnknownPath"]
+
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    captured = capsys.readouterr()
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+
+    assert f"\t{'other':<30}: success" in captured.out
+    assert f"\t{'UnknownPath':<30}: Source path does not exist" in captured.out
+    assert TARGET_PATH.is_symlink()
+    assert other_path.is_symlink()
+    assert config.entries[TARGET_PATH.name].path == str(TARGET_PATH)
+    assert config.entries["other"].path == str(other_path)
+    assert not config.entries.get("UnknownPath")
+
+
 @setup_restore()
 def test_run_config_add():
     args = RunConfigArgs("add")
@@ -224,6 +588,30 @@ def test_run_config_list(capsys):
     assert f"-> {TARGET_PATH}" in captured.out
 
 
+@setup_apply()
+def test_run_config_list_output(capsys):
+    args = RunConfigArgs("list")
+
+    args.output = "ndjson"
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)["name"] for line in lines] == [
+        ENTRY_NAME,
+        SECOND_ENTRY_NAME,
+    ]
+    assert json.loads(lines[0])["path"] == str(TARGET_PATH)
+
+    args.output = "json"
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    entries = json.loads(capsys.readouterr().out)
+    assert [entry["name"] for entry in entries] == [ENTRY_NAME, SECOND_ENTRY_NAME]
+
+    args = RunConfigArgs("get")
+    args.output = "json"
+    run_console(args, TRANSPOSE_CONFIG_PATH)
+    assert json.loads(capsys.readouterr().out)["enabled"] is True
+
+
 @setup_restore()
 def test_run_config_remove():
     args = RunConfigArgs("remove")
@@ -0,0 +1,147 @@
+import errno
+import os
+
+from transpose import Transpose, dedup, utils
+from transpose.dedup import HashCache, deduplicate
+
+from .utils import (
+    ENTRY_STORE_PATH,
+    SECOND_ENTRY_NAME,
+    STORE_PATH,
+    TRANSPOSE_CONFIG_PATH,
+    setup_apply,
+    setup_store,
+)
+
+CONTENTS = b"duplicate" * 1024
+
+
+def fake_clone_file(cloned):
+    def clone_file(fsrc, fdst):
+        cloned.append(fsrc.name)
+        fdst.write(fsrc.read())
+
+    return clone_file
+
+
+@setup_apply()
+def test_dedup(monkeypatch):
+    cloned = []
+    monkeypatch.setattr(utils, "clone_file", fake_clone_file(cloned))
+    first = ENTRY_STORE_PATH.joinpath("first.bin")
+    second = STORE_PATH.joinpath(SECOND_ENTRY_NAME, "second.bin")
+    linked = STORE_PATH.joinpath(SECOND_ENTRY_NAME, "linked.bin")
+    first.write_bytes(CONTENTS)
+    second.write_bytes(CONTENTS)
+    os.link(second, linked)  # Kept, since it has the most links
+    os.utime(first, ns=(0, 0))
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    result = t.dedup(jobs=2)
+
+    assert result.files == 1
+    assert result.reclaimed >= len(CONTENTS)
+    assert len(cloned) == 1
+    # A separate inode, so writing to one entry doesn't change the other
+    assert not os.path.samefile(first, second)
+    assert first.read_bytes() == CONTENTS
+    assert first.stat().st_mtime_ns == 0  # Its own metadata
+    with open(first, "r+b") as f:
+        f.write(b"changed")
+    assert second.read_bytes() == CONTENTS
+
+    # Changed since, so cloned again
+    first.write_bytes(CONTENTS)
+    cloned.clear()
+    assert t.dedup().files == 1
+
+    # The clones are recorded, so they aren't cloned again
+    cloned.clear()
+    assert t.dedup().files == 0
+    assert cloned == []
+
+
+@setup_store()
+def test_dedup_clone_unsupported(monkeypatch, caplog):
+    def clone_file(fsrc, fdst):
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+    monkeypatch.setattr(utils, "clone_file", clone_file)
+    paths = [STORE_PATH.joinpath(f"{i}.bin") for i in range(3)]
+    for path in paths:
+        path.write_bytes(CONTENTS)
+
+    assert deduplicate(paths).files == 0
+    assert caplog.text.count("Unable to clone files") == 1
+    assert not [name for name in os.listdir(STORE_PATH) if ".bin." in name]
+
+
+@setup_apply()
+def test_dedup_hardlink():
+    first = ENTRY_STORE_PATH.joinpath("first.bin")
+    second = STORE_PATH.joinpath(SECOND_ENTRY_NAME, "second.bin")
+    different = ENTRY_STORE_PATH.joinpath("different.bin")
+    small = ENTRY_STORE_PATH.joinpath("small.txt")
+    first.write_bytes(CONTENTS)
+    second.write_bytes(CONTENTS)
+    different.write_bytes(CONTENTS[:-1] + b"!")
+    small.write_text("small")
+    STORE_PATH.joinpath(SECOND_ENTRY_NAME, "small.txt").write_text("small")
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    result = t.dedup(jobs=2, hardlink=True)
+
+    assert result.files == 1
+    assert result.reclaimed >= len(CONTENTS)
+    assert os.path.samefile(first, second)
+    assert second.read_bytes() == CONTENTS
+    assert not os.path.samefile(first, different)
+    assert first.stat().st_nlink == 2
+    assert small.stat().st_nlink == 1  # Below DEDUP_MIN_SIZE
+    assert STORE_PATH.joinpath(".transpose", "hashes.json").exists()
+    assert ".transpose" not in t._scan_store()
+
+    # Nothing left to do, and cached hashes aren't read again
+    assert t.dedup(hardlink=True).files == 0
+
+
+@setup_store()
+def test_dedup_hash_cache(monkeypatch):
+    first = STORE_PATH.joinpath("first.bin")
+    second = STORE_PATH.joinpath("second.bin")
+    first.write_bytes(CONTENTS)
+    second.write_bytes(CONTENTS[:-1] + b"!")
+
+    cache = HashCache(STORE_PATH.joinpath("hashes.json"))
+    assert deduplicate([first, second], cache=cache).files == 0
+    cache.save()
+
+    def hash_file(path):
+        raise AssertionError(f"Hashed again: {path}")
+
+    monkeypatch.setattr(dedup, "hash_file", hash_file)
+    cache = HashCache(STORE_PATH.joinpath("hashes.json"))
+    assert cache.get(first.stat()) is not None
+    assert deduplicate([first, second], cache=cache).files == 0
+
+
+@setup_store()
+def test_dedup_skips_changed_files(monkeypatch):
+    first = STORE_PATH.joinpath("first.bin")
+    second = STORE_PATH.joinpath("second.bin")
+    first.write_bytes(CONTENTS)
+    second.write_bytes(CONTENTS)
+
+    hash_file = dedup.hash_file
+
+    def hash_and_modify(path):
+        digest = hash_file(path)
+        if path == str(second):  # Modified after hashing, before being replaced
+            os.utime(second, ns=(0, 0))
+        return digest
+
+    monkeypatch.setattr(dedup, "hash_file", hash_and_modify)
+    result = deduplicate([first, second], workers=1, hardlink=True)
+
+    assert result.files == 0
+    assert not os.path.samefile(first, second)
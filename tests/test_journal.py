@@ -0,0 +1,63 @@
+import pytest
+
+from transpose.exceptions import TransposeError
+from transpose.journal import TransposeJournal
+
+from .utils import STORE_PATH, TARGET_PATH, setup_store
+
+JOURNAL_PATH = STORE_PATH.joinpath("transpose.journal")
+
+
+@setup_store()
+def test_journal_pending():
+    journal = TransposeJournal(JOURNAL_PATH)
+    assert journal.pending() == []
+
+    first = journal.begin("store", "First", TARGET_PATH)
+    second = journal.begin("restore", "Second", "/tmp/second")
+    assert journal.pending() == [first, second]
+    assert first.path == str(TARGET_PATH)
+
+    journal.commit(first)
+    assert TransposeJournal(JOURNAL_PATH).pending() == [second]
+
+
+@setup_store()
+def test_journal_store():
+    journal = TransposeJournal(JOURNAL_PATH)
+    record = journal.begin("store", "Entry", TARGET_PATH, store="/mnt/secondary")
+    assert TransposeJournal(JOURNAL_PATH).pending() == [record]
+    assert TransposeJournal(JOURNAL_PATH).pending()[0].store == "/mnt/secondary"
+
+
+@setup_store()
+def test_journal_torn_line():
+    journal = TransposeJournal(JOURNAL_PATH)
+    record = journal.begin("store", "First", TARGET_PATH)
+    with open(JOURNAL_PATH, "a") as f:
+        f.write('{"state": "done", "i')
+
+    assert journal.pending() == [record]
+
+
+@setup_store()
+def test_journal_invalid():
+    with open(JOURNAL_PATH, "w") as f:
+        f.write('{"state": "begin"}\n')
+
+    with pytest.raises(TransposeError, match="Unrecognized Transpose journal format"):
+        TransposeJournal(JOURNAL_PATH).pending()
+
+
+@setup_store()
+def test_journal_reset():
+    journal = TransposeJournal(JOURNAL_PATH)
+    first = journal.begin("store", "First", TARGET_PATH)
+    journal.begin("store", "Second", TARGET_PATH)
+
+    journal.reset([first])
+    assert journal.pending() == [first]
+
+    journal.reset()
+    assert journal.pending() == []
+    assert JOURNAL_PATH.read_text() == ""
@@ -0,0 +1,41 @@
+from transpose.lock import FileLock, lock_path
+
+from .utils import STORE_PATH, TRANSPOSE_CONFIG_PATH, setup_store
+
+LOCK_PATH = STORE_PATH.joinpath("test.lock")
+
+
+@setup_store()
+def test_lock_shared():
+    with FileLock(LOCK_PATH).shared() as first:
+        with FileLock(LOCK_PATH).shared(blocking=False) as second:
+            assert first and second
+
+        with FileLock(LOCK_PATH).exclusive(blocking=False) as exclusive:
+            assert not exclusive
+
+    with FileLock(LOCK_PATH).exclusive(blocking=False) as exclusive:
+        assert exclusive
+
+
+@setup_store()
+def test_lock_exclusive():
+    with FileLock(LOCK_PATH).exclusive() as exclusive:
+        assert exclusive
+        with FileLock(LOCK_PATH).shared(blocking=False) as shared:
+            assert not shared
+        with FileLock(LOCK_PATH).exclusive(blocking=False) as second:
+            assert not second
+
+
+@setup_store()
+def test_lock_shared_missing_directory():
+    # Nothing can be writing to a store which doesn't exist yet
+    with FileLock(STORE_PATH.joinpath("missing", "test.lock")).shared() as shared:
+        assert shared
+
+
+def test_lock_path():
+    assert lock_path(TRANSPOSE_CONFIG_PATH) == TRANSPOSE_CONFIG_PATH.with_name(
+        "transpose.json.lock"
+    )
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import pytest
+import threading
+
+from contextlib import contextmanager
+
+from transpose import TransposeConfig, console
+from transpose.client import is_serving, request, socket_path
+from transpose.console import parse_arguments, run_command, run_remote
+from transpose.exceptions import TransposeError
+from transpose.server import TransposeServer
+
+from .utils import (
+    ENTRY_NAME,
+    TARGET_PATH,
+    TRANSPOSE_CONFIG_PATH,
+    setup_apply,
+)
+
+
+@contextmanager
+def serving():
+    server = TransposeServer(
+        TRANSPOSE_CONFIG_PATH,
+        lambda t, args: run_command(t, args, TRANSPOSE_CONFIG_PATH),
+    )
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(),))
+    thread.start()
+    assert server.ready.wait(timeout=10)
+
+    try:
+        yield server
+    finally:
+        server.stop()
+        thread.join()
+
+
+@setup_apply()
+def test_serve(capsys):
+    assert not run_remote(parse_arguments(["apply", ENTRY_NAME]), TRANSPOSE_CONFIG_PATH)
+
+    with serving():
+        assert is_serving(TRANSPOSE_CONFIG_PATH)
+
+        assert run_remote(parse_arguments(["apply", ENTRY_NAME]), TRANSPOSE_CONFIG_PATH)
+        assert TARGET_PATH.is_symlink()
+
+        args = parse_arguments(["which", str(TARGET_PATH)])
+        assert run_remote(args, TRANSPOSE_CONFIG_PATH)
+        assert capsys.readouterr().out == f"{ENTRY_NAME} -> {TARGET_PATH}\n"
+
+        args = parse_arguments(["config", "add", "NewEntry", "relative/path"])
+        assert run_remote(args, TRANSPOSE_CONFIG_PATH)
+        config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+        assert config.entries["NewEntry"].path == os.path.abspath("relative/path")
+
+        # What the command logs is sent back with its output
+        args = parse_arguments(["-v", "dedup"])
+        assert run_remote(args, TRANSPOSE_CONFIG_PATH)
+        assert "Deduplicated 0 file(s)" in capsys.readouterr().err
+
+        # The daemon sees changes saved without it
+        config.add("OtherEntry", TARGET_PATH)
+        config.save(TRANSPOSE_CONFIG_PATH)
+        args = parse_arguments(["config", "list"])
+        assert run_remote(args, TRANSPOSE_CONFIG_PATH)
+        assert "OtherEntry" in capsys.readouterr().out
+
+        with pytest.raises(TransposeError, match="Entry does not exist"):
+            run_remote(parse_arguments(["apply", "BadName"]), TRANSPOSE_CONFIG_PATH)
+
+        with pytest.raises(TransposeError, match="already serving"):
+            asyncio.run(TransposeServer(TRANSPOSE_CONFIG_PATH, None).serve())
+
+    assert not socket_path(TRANSPOSE_CONFIG_PATH).exists()
+
+
+@setup_apply()
+def test_remote_paths(monkeypatch):
+    requests = []
+    monkeypatch.setattr(
+        console,
+        "request",
+        lambda config_path, args: requests.append(args)
+        or {"output": "", "error": None},
+    )
+    cwd = os.getcwd()
+
+    for argv in (
+        ["config", "add", "NewEntry", "relative/path"],
+        ["config", "update", ENTRY_NAME, "path", "relative/path"],
+        ["store", "relative/path", "--also", "other", "--secondary", "mnt"],
+        ["sync", "relative/path"],
+    ):
+        assert run_remote(parse_arguments(argv), TRANSPOSE_CONFIG_PATH)
+
+    # Resolved against the client's working directory, not the daemon's
+    assert requests[0]["path"] == os.path.join(cwd, "relative/path")
+    assert requests[1]["field_value"] == os.path.join(cwd, "relative/path")
+    assert requests[2]["target_path"] == os.path.join(cwd, "relative/path")
+    assert requests[2]["also"] == [os.path.join(cwd, "other")]
+    assert requests[2]["stores"] == [os.path.join(cwd, "mnt")]
+    assert requests[3]["destination"] == os.path.join(cwd, "relative/path")
+
+
+@setup_apply()
+def test_serve_invalid_request():
+    with serving():
+        assert request(TRANSPOSE_CONFIG_PATH, None)["error"].startswith(
+            "Invalid request"
+        )
+
+
+@setup_apply()
+def test_serve_stale_socket():
+    socket_path(TRANSPOSE_CONFIG_PATH).parent.mkdir(parents=True)
+    socket_path(TRANSPOSE_CONFIG_PATH).touch()  # Left behind by a killed daemon
+
+    assert not is_serving(TRANSPOSE_CONFIG_PATH)
+    with serving():
+        assert is_serving(TRANSPOSE_CONFIG_PATH)
@@ -0,0 +1,90 @@
+import datetime
+import os
+import pytest
+
+from transpose import Transpose
+from transpose.exceptions import TransposeError
+from transpose.snapshot import list_snapshots, take_snapshot
+
+from .utils import (
+    ENTRY_NAME,
+    ENTRY_STORE_PATH,
+    STORE_PATH,
+    TRANSPOSE_CONFIG_PATH,
+    setup_restore,
+    setup_store,
+)
+
+SOURCE_PATH = STORE_PATH.joinpath("Source")
+SNAPSHOTS_PATH = STORE_PATH.joinpath("snapshots")
+FIRST = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+SECOND = FIRST + datetime.timedelta(days=1)
+
+
+@setup_store()
+def test_take_snapshot():
+    SOURCE_PATH.joinpath("nested").mkdir(parents=True)
+    unchanged = SOURCE_PATH.joinpath("nested", "unchanged.txt")
+    unchanged.write_text("unchanged")
+    changed = SOURCE_PATH.joinpath("changed.txt")
+    changed.write_text("before")
+    os.link(changed, SOURCE_PATH.joinpath("hardlink"))
+    SOURCE_PATH.joinpath("link").symlink_to("nested")
+
+    first = take_snapshot(STORE_PATH, ["Source"], SNAPSHOTS_PATH, now=FIRST)
+    assert (first.name, first.files, first.copied, first.linked) == (
+        "20240101T000000Z",
+        3,
+        2,
+        1,  # The hardlink
+    )
+    first_copy = first.path.joinpath("Source")
+    assert first_copy.joinpath("nested", "unchanged.txt").read_text() == "unchanged"
+    assert os.path.samefile(
+        first_copy.joinpath("changed.txt"), first_copy.joinpath("hardlink")
+    )
+    assert os.readlink(first_copy.joinpath("link")) == "nested"
+
+    changed.write_text("after, longer")
+    with pytest.raises(TransposeError, match="already taken"):
+        take_snapshot(STORE_PATH, ["Source"], SNAPSHOTS_PATH, now=FIRST)
+
+    second = take_snapshot(STORE_PATH, ["Source"], SNAPSHOTS_PATH, now=SECOND)
+    assert (second.copied, second.linked) == (1, 2)
+    second_copy = second.path.joinpath("Source")
+    assert os.path.samefile(
+        first_copy.joinpath("nested", "unchanged.txt"),
+        second_copy.joinpath("nested", "unchanged.txt"),
+    )
+    assert first_copy.joinpath("changed.txt").read_text() == "before"
+    assert second_copy.joinpath("hardlink").read_text() == "after, longer"
+    assert list_snapshots(SNAPSHOTS_PATH) == [first.name, second.name]
+
+
+@setup_store()
+def test_take_snapshot_interrupted():
+    SOURCE_PATH.mkdir()
+    SOURCE_PATH.joinpath("file.txt").write_text("file")
+    take_snapshot(STORE_PATH, ["Source"], SNAPSHOTS_PATH, now=FIRST)
+
+    # Incomplete snapshots are removed, and never linked to
+    SNAPSHOTS_PATH.joinpath(".20240101T120000Z.partial").mkdir()
+    SNAPSHOTS_PATH.joinpath("20240101T000000Z.json").unlink()
+    assert list_snapshots(SNAPSHOTS_PATH) == []
+
+    result = take_snapshot(STORE_PATH, ["Source"], SNAPSHOTS_PATH, now=SECOND)
+    assert (result.copied, result.linked) == (1, 0)
+    assert not SNAPSHOTS_PATH.joinpath(".20240101T120000Z.partial").exists()
+
+
+@setup_restore()
+def test_snapshot():
+    ENTRY_STORE_PATH.joinpath("file.txt").write_text("stored")
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+
+    result = t.snapshot(jobs=2)
+    assert result.path.parent == STORE_PATH.joinpath(".transpose", "snapshots")
+    assert result.path.joinpath(ENTRY_NAME, "file.txt").read_text() == "stored"
+    assert result.path.joinpath(TRANSPOSE_CONFIG_PATH.name).exists()
+    assert not result.path.joinpath(".transpose").exists()
+    assert t.gc(dry_run=True) == {}
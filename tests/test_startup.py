@@ -0,0 +1,59 @@
+import subprocess
+import sys
+import pytest
+
+from transpose import get_version
+from transpose.console import parse_arguments
+
+# Slow to import and only needed by some commands, so must not be imported on startup
+DEFERRED_MODULES = [
+    "asyncio",
+    "concurrent.futures",
+    "importlib.metadata",
+    "sqlite3",
+    "tempfile",
+    "uuid",
+]
+# Microseconds, generous to avoid flaky failures on slow machines
+MAX_IMPORT_TIME = 500_000
+
+
+def import_times(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter with `python -X importtime`
+
+    Returns:
+        The cumulative import time in microseconds of every module imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def test_startup_imports():
+    times = import_times("transpose.console")
+
+    for module in DEFERRED_MODULES:
+        assert module not in times, f"{module} should only be imported when used"
+
+    assert times["transpose.console"] < MAX_IMPORT_TIME
+
+
+def test_version(capsys):
+    with pytest.raises(SystemExit):
+        parse_arguments(["--version"])
+    captured = capsys.readouterr()
+
+    assert captured.out == f"Transpose {get_version()}\n"
@@ -0,0 +1,84 @@
+import pytest
+
+from transpose import stores
+from transpose.exceptions import TransposeError
+from transpose.stores import LocalStore, MountStore, get_store, select_store
+
+from .utils import STORE_PATH, TARGET_PATH, TESTS_PATH, setup_store
+
+SECONDARY_PATH = TESTS_PATH.joinpath("secondary")
+
+
+def free_space(sizes):
+    return lambda store: sizes[store.path.name]
+
+
+@setup_store()
+def test_select_store(monkeypatch):
+    monkeypatch.setattr(
+        stores.Store, "free_space", free_space({"store": 10, "a": 30, "b": 20})
+    )
+    primary = LocalStore(STORE_PATH)
+    a, b = MountStore(TESTS_PATH.joinpath("a")), MountStore(TESTS_PATH.joinpath("b"))
+
+    assert select_store([primary], 5) is primary
+    assert select_store([primary, a, b], 5) is a
+
+    # Targets placed before, but not moved yet, count against the free space
+    reserved = {}
+    assert select_store([primary, a, b], 15, reserved=reserved) is a
+    assert select_store([primary, a, b], 15, reserved=reserved) is b
+    assert reserved == {a.path: 15, b.path: 15}
+
+    with pytest.raises(TransposeError, match="No store has 40 bytes free"):
+        select_store([primary, a, b], 40)
+    with pytest.raises(TransposeError, match="Unknown placement policy"):
+        select_store([primary, a], 5, policy="random")
+
+
+@setup_store()
+def test_select_store_size_class(monkeypatch):
+    monkeypatch.setattr(
+        stores.Store, "free_space", free_space({"store": 10, "a": 30, "b": 20})
+    )
+    monkeypatch.setattr(stores, "LARGE_ENTRY_SIZE", 8)
+    primary = LocalStore(STORE_PATH)
+    a, b = MountStore(TESTS_PATH.joinpath("a")), MountStore(TESTS_PATH.joinpath("b"))
+
+    assert select_store([primary, a, b], 5, policy="size-class") is primary
+    assert select_store([primary, a, b], 8, policy="size-class") is a
+    assert select_store([primary], 8, policy="size-class") is primary
+
+
+@setup_store()
+def test_mount_store_move():
+    TARGET_PATH.joinpath("file.txt").write_text("contents")
+    store = MountStore(SECONDARY_PATH, workers=1)
+    assert not SECONDARY_PATH.exists()
+    assert store.free_space() > 0  # Measured on its nearest existing parent
+
+    store.move(TARGET_PATH, store.entry_path("Entry"))
+    assert SECONDARY_PATH.joinpath("Entry", "file.txt").read_text() == "contents"
+    assert not TARGET_PATH.exists()
+
+    store.move(store.entry_path("Entry"), TARGET_PATH)
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "contents"
+    assert SECONDARY_PATH.is_dir()
+
+
+@setup_store()
+def test_mount_store_missing():
+    store = MountStore(SECONDARY_PATH)
+
+    # An unmounted volume, moving out must not create the store in its place
+    with pytest.raises(TransposeError, match="is its volume mounted"):
+        store.move(store.entry_path("Entry"), TARGET_PATH.with_name("Restored"))
+    assert not SECONDARY_PATH.exists()
+
+
+def test_get_store():
+    primary = LocalStore(STORE_PATH)
+    assert get_store(None, primary) is primary
+    assert get_store(str(SECONDARY_PATH), primary) == MountStore(SECONDARY_PATH)
+    assert get_store(str(SECONDARY_PATH), primary) != primary
+    assert len({primary, LocalStore(STORE_PATH), MountStore(SECONDARY_PATH)}) == 2
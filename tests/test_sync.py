@@ -0,0 +1,92 @@
+import os
+import pytest
+
+from transpose import Transpose, sync
+from transpose.exceptions import TransposeError
+from transpose.sync import SyncManifest, sync_tree
+
+from .utils import (
+    ENTRY_NAME,
+    ENTRY_STORE_PATH,
+    STORE_PATH,
+    TESTS_PATH,
+    TRANSPOSE_CONFIG_PATH,
+    setup_restore,
+    setup_store,
+)
+
+SOURCE_PATH = STORE_PATH.joinpath("Source")
+BACKUP_PATH = TESTS_PATH.joinpath("backup")
+
+
+@setup_store()
+def test_sync_tree(monkeypatch):
+    monkeypatch.setattr(sync, "RACY_NANOSECONDS", 0)
+
+    SOURCE_PATH.joinpath("nested").mkdir(parents=True)
+    SOURCE_PATH.joinpath("nested", "unchanged.txt").write_text("unchanged")
+    SOURCE_PATH.joinpath("nested", "removed.txt").write_text("removed")
+    changed = SOURCE_PATH.joinpath("changed.txt")
+    changed.write_text("before")
+    SOURCE_PATH.joinpath("link").symlink_to("nested")
+    mirror = BACKUP_PATH.joinpath("Source")
+    manifest_path = BACKUP_PATH.joinpath("sync.json")
+
+    result = sync_tree(STORE_PATH, ["Source"], BACKUP_PATH, SyncManifest(manifest_path))
+    assert (result.copied, result.unchanged, result.listed) == (4, 0, 2)
+    assert mirror.joinpath("nested", "unchanged.txt").read_text() == "unchanged"
+    assert os.readlink(mirror.joinpath("link")) == "nested"
+
+    # Nothing changed, so no directory is listed again
+    result = sync_tree(STORE_PATH, ["Source"], BACKUP_PATH, SyncManifest(manifest_path))
+    assert (result.copied, result.unchanged, result.listed) == (0, 4, 0)
+
+    changed.write_text("after, longer")
+    SOURCE_PATH.joinpath("nested", "removed.txt").unlink()
+    SOURCE_PATH.joinpath("nested", "added").mkdir()
+    mirror.joinpath("untracked.txt").write_text("untracked")
+
+    result = sync_tree(STORE_PATH, ["Source"], BACKUP_PATH, SyncManifest(manifest_path))
+    assert (result.copied, result.removed, result.unchanged) == (1, 1, 2)
+    assert result.listed == 2  # nested and the new directory, not Source
+    assert mirror.joinpath("changed.txt").read_text() == "after, longer"
+    assert not mirror.joinpath("nested", "removed.txt").exists()
+    assert mirror.joinpath("nested", "added").is_dir()
+    assert mirror.joinpath("untracked.txt").exists()
+
+    # Same size and mtime, only noticed by checksum
+    stat = changed.stat()
+    changed.write_text("AFTER, LONGER")
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    manifest = SyncManifest(manifest_path)
+    assert sync_tree(STORE_PATH, ["Source"], BACKUP_PATH, manifest).copied == 0
+    result = sync_tree(STORE_PATH, ["Source"], BACKUP_PATH, manifest, checksum=True)
+    assert result.copied == 2  # No hashes were recorded yet
+    assert mirror.joinpath("changed.txt").read_text() == "AFTER, LONGER"
+
+
+@setup_store()
+def test_sync_tree_racy():
+    SOURCE_PATH.mkdir()
+    SOURCE_PATH.joinpath("file.txt").write_text("file")
+    manifest = SyncManifest(BACKUP_PATH.joinpath("sync.json"))
+
+    sync_tree(STORE_PATH, ["Source"], BACKUP_PATH, manifest)
+    # Modified too recently to trust its mtime
+    result = sync_tree(STORE_PATH, ["Source"], BACKUP_PATH, manifest)
+    assert (result.copied, result.listed) == (1, 1)
+
+
+@setup_restore()
+def test_sync():
+    ENTRY_STORE_PATH.joinpath("file.txt").write_text("stored")
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+
+    with pytest.raises(TransposeError, match="inside the store path"):
+        t.sync(str(STORE_PATH.joinpath("backup")))
+
+    result = t.sync(str(BACKUP_PATH), jobs=2)
+    assert result.copied == 2
+    assert BACKUP_PATH.joinpath(ENTRY_NAME, "file.txt").read_text() == "stored"
+    assert BACKUP_PATH.joinpath(TRANSPOSE_CONFIG_PATH.name).exists()
+    assert BACKUP_PATH.joinpath(".transpose", "sync.json").exists()
@@ -1,15 +1,25 @@
+import errno
 import json
+import os
 import pathlib
 import pytest
+import socket
 
-from transpose import Transpose, TransposeConfig, TransposeEntry
+from transpose import Transpose, TransposeConfig, TransposeEntry, stores, utils
+from transpose.transpose import STATE_DIR, TransposeEntries, TransposeStatus
+from transpose.backends import JsonBackend
 from transpose.exceptions import TransposeError
+from transpose.journal import TransposeJournal
 
 from .utils import (
     ENTRY_NAME,
     ENTRY_STORE_PATH,
+    SECOND_ENTRY_NAME,
+    SECOND_TARGET_PATH,
     STORE_PATH,
+    SYMLINK_TEST_PATH,
     TARGET_PATH,
+    TESTS_PATH,
     TRANSPOSE_CONFIG,
     TRANSPOSE_CONFIG_PATH,
     setup_restore,
@@ -17,6 +27,8 @@ from .utils import (
     setup_apply,
 )
 
+SECONDARY_STORE_PATH = TESTS_PATH.joinpath("secondary")
+
 
 @setup_store()
 def test_init():
@@ -60,6 +72,185 @@ def test_apply():
         t.apply(ENTRY_NAME)
 
 
+@setup_apply()
+def test_check():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.apply(ENTRY_NAME)
+
+    # symlink_test/ -> source/ (not the store)
+    t.config.add("WrongTarget", SYMLINK_TEST_PATH)
+    # Linked to the store, but the stored path is gone
+    dangling_path = TARGET_PATH.with_name("dangling")
+    dangling_path.symlink_to(STORE_PATH.joinpath("Dangling").resolve())
+    t.config.add("Dangling", dangling_path)
+    STORE_PATH.joinpath("Orphan").mkdir()
+    t.config.save(TRANSPOSE_CONFIG_PATH)
+
+    statuses = {status.name: status for status in t.check(jobs=2)}
+    assert statuses[ENTRY_NAME].status == TransposeStatus.OK
+    assert statuses[SECOND_ENTRY_NAME].status == TransposeStatus.NOT_A_LINK
+    assert statuses["WrongTarget"].status == TransposeStatus.WRONG_TARGET
+    assert statuses["Dangling"].status == TransposeStatus.DANGLING
+    assert statuses["Orphan"] == TransposeStatus("Orphan", None, TransposeStatus.ORPHAN)
+    assert "transpose.json" not in statuses
+    assert len(statuses) == 5
+
+    SECOND_TARGET_PATH.rmdir()
+    statuses = {status.name: status for status in t.check()}
+    assert statuses[SECOND_ENTRY_NAME].status == TransposeStatus.MISSING_LINK
+
+
+@setup_apply()
+def test_gc():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    STORE_PATH.joinpath("Orphan").mkdir()
+    STORE_PATH.joinpath("Orphan", "file.txt").write_text("orphaned")
+    STORE_PATH.joinpath("orphan.txt").write_text("orphaned")
+
+    orphans = t.gc(dry_run=True, jobs=2)
+    assert list(orphans) == ["Orphan", "orphan.txt"]
+    assert orphans["Orphan"] > orphans["orphan.txt"] > 0
+    assert STORE_PATH.joinpath("Orphan").exists()
+
+    # An interrupted store may hold the only complete copy, leave it alone
+    t.journal.begin("store", "Orphan", TARGET_PATH.with_name("orphan"))
+
+    assert list(t.gc()) == ["orphan.txt"]
+    assert not STORE_PATH.joinpath("orphan.txt").exists()
+    assert STORE_PATH.joinpath("Orphan", "file.txt").exists()
+    assert ENTRY_STORE_PATH.exists()
+    assert TRANSPOSE_CONFIG_PATH.exists()
+
+
+@setup_restore()
+def test_gc_frozen_elsewhere():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    other = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    other.freeze(ENTRY_NAME)
+
+    # The archive is only in the config the other instance saved
+    archive = other.config.entries[ENTRY_NAME].frozen
+    assert not t.config.entries[ENTRY_NAME].frozen
+    assert t.gc() == {}
+    assert STORE_PATH.joinpath(archive).exists()
+
+
+@setup_restore()
+def test_freeze():
+    ENTRY_STORE_PATH.joinpath("file.txt").write_text("frozen")
+    TARGET_PATH.symlink_to(ENTRY_STORE_PATH.resolve())
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+
+    size = t.freeze(ENTRY_NAME, jobs=2)
+    archive = t.config.entries[ENTRY_NAME].frozen
+    assert archive.startswith(f"{ENTRY_NAME}.tar.")
+    assert STORE_PATH.joinpath(archive).stat().st_size == size
+    assert not ENTRY_STORE_PATH.exists()
+    assert TransposeConfig.load(TRANSPOSE_CONFIG_PATH).entries[ENTRY_NAME].frozen
+
+    assert t.check(names=[ENTRY_NAME])[0].status == TransposeStatus.FROZEN
+    assert t.gc(dry_run=True) == {}
+    with pytest.raises(TransposeError, match="already frozen"):
+        t.freeze(ENTRY_NAME)
+
+    # Applying thaws it
+    t.apply(ENTRY_NAME)
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "frozen"
+    assert not STORE_PATH.joinpath(archive).exists()
+    assert t.config.entries[ENTRY_NAME].frozen is None
+    with pytest.raises(TransposeError, match="not frozen"):
+        t.thaw(ENTRY_NAME)
+
+
+@setup_restore()
+def test_hydrate():
+    ENTRY_STORE_PATH.joinpath("saves").mkdir()
+    ENTRY_STORE_PATH.joinpath("saves", "slot1").write_text("slot1")
+    ENTRY_STORE_PATH.joinpath("settings.conf").write_text("settings")
+    TARGET_PATH.symlink_to(ENTRY_STORE_PATH.resolve())
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.freeze(ENTRY_NAME)
+    archive = t.config.entries[ENTRY_NAME].frozen
+    assert STORE_PATH.joinpath(STATE_DIR, "index", f"{archive}.json").exists()
+
+    with pytest.raises(TransposeError, match="No paths"):
+        t.hydrate(ENTRY_NAME, "*.missing")
+
+    assert t.hydrate(ENTRY_NAME, "*.conf") == ["settings.conf"]
+    assert ENTRY_STORE_PATH.joinpath("settings.conf").read_text() == "settings"
+    assert not ENTRY_STORE_PATH.joinpath("saves").exists()
+    assert t.hydrate(ENTRY_NAME, "*.conf") == []
+    assert t.check(names=[ENTRY_NAME])[0].status == TransposeStatus.FROZEN
+
+    # Changes to hydrated paths are kept when thawing
+    ENTRY_STORE_PATH.joinpath("settings.conf").write_text("changed")
+    t.thaw(ENTRY_NAME)
+    assert ENTRY_STORE_PATH.joinpath("settings.conf").read_text() == "changed"
+    assert ENTRY_STORE_PATH.joinpath("saves", "slot1").read_text() == "slot1"
+    assert not STORE_PATH.joinpath(STATE_DIR, "index", f"{archive}.json").exists()
+
+    with pytest.raises(TransposeError, match="not frozen"):
+        t.hydrate(ENTRY_NAME, "*")
+
+
+@setup_restore()
+def test_freeze_restore():
+    ENTRY_STORE_PATH.joinpath("file.txt").write_text("frozen")
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.freeze(ENTRY_NAME)
+    archive = STORE_PATH.joinpath(t.config.entries[ENTRY_NAME].frozen)
+
+    # Interrupted thaw
+    STORE_PATH.joinpath(f".{ENTRY_NAME}.thaw").mkdir()
+    ENTRY_STORE_PATH.mkdir()
+
+    t.restore(ENTRY_NAME)
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "frozen"
+    assert not archive.exists()
+    assert not STORE_PATH.joinpath(f".{ENTRY_NAME}.thaw").exists()
+    assert not t.config.entries.get(ENTRY_NAME)
+
+
+@setup_restore()
+def test_restore_frozen_symlink():
+    ENTRY_STORE_PATH.joinpath("file.txt").write_text("frozen")
+    TARGET_PATH.symlink_to(ENTRY_STORE_PATH.resolve())
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.freeze(ENTRY_NAME)
+    archive = STORE_PATH.joinpath(t.config.entries[ENTRY_NAME].frozen)
+
+    # Our own symlink dangles while frozen and is replaced without force
+    assert TARGET_PATH.is_symlink() and not TARGET_PATH.exists()
+    t.restore(ENTRY_NAME)
+    assert not TARGET_PATH.is_symlink()
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "frozen"
+    assert not archive.exists()
+    assert not t.config.entries.get(ENTRY_NAME)
+    assert not t.journal.pending()
+
+
+@setup_restore()
+def test_restore_frozen_foreign_symlink():
+    ENTRY_STORE_PATH.joinpath("file.txt").write_text("frozen")
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.freeze(ENTRY_NAME)
+    archive = STORE_PATH.joinpath(t.config.entries[ENTRY_NAME].frozen)
+    TARGET_PATH.symlink_to(TESTS_PATH.joinpath("elsewhere").resolve())
+
+    # Nothing is unpacked or journaled before the existing path is checked
+    with pytest.raises(TransposeError, match="force required"):
+        t.restore(ENTRY_NAME)
+    assert archive.exists()
+    assert t.config.entries[ENTRY_NAME].frozen
+    assert not t.journal.pending()
+
+    t.restore(ENTRY_NAME, force=True)
+    assert TARGET_PATH.with_suffix(".backup").is_symlink()
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "frozen"
+    assert not archive.exists()
+    assert not t.config.entries.get(ENTRY_NAME)
+
+
 @setup_restore()
 def test_restore():
     t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
@@ -101,6 +292,24 @@ def test_restore_path_conflicts():
     assert not t.config.entries.get(ENTRY_NAME)
 
 
+@setup_apply()
+def test_restore_many(monkeypatch):
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    saves = []
+    monkeypatch.setattr(t.config, "save", saves.append)
+
+    results = t.restore_many([ENTRY_NAME, SECOND_ENTRY_NAME, "BadName"], jobs=2)
+    assert results[ENTRY_NAME] is None
+    assert "Entry path already exists" in str(results[SECOND_ENTRY_NAME])
+    assert "Could not locate entry by name" in str(results["BadName"])
+
+    assert TARGET_PATH.is_dir()
+    assert not ENTRY_STORE_PATH.exists()
+    assert not t.config.entries.get(ENTRY_NAME)
+    assert t.config.entries.get(SECOND_ENTRY_NAME)
+    assert saves == [TRANSPOSE_CONFIG_PATH]
+
+
 @setup_store()
 def test_store():
     t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
@@ -112,6 +321,129 @@ def test_store():
     assert t.config.entries["TestEntry"].path == str(TARGET_PATH)
 
 
+@setup_store()
+def test_store_secondary(monkeypatch):
+    monkeypatch.setattr(
+        stores.Store,
+        "free_space",
+        lambda store: 2**30 if store.path == STORE_PATH else 2**31,
+    )
+    TARGET_PATH.joinpath("file.txt").write_text("contents")
+    SECOND_TARGET_PATH.mkdir()
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.store("TestEntry", TARGET_PATH, stores=[str(SECONDARY_STORE_PATH)])
+    assert SECONDARY_STORE_PATH.joinpath("TestEntry", "file.txt").is_file()
+    assert not STORE_PATH.joinpath("TestEntry").exists()
+    assert TARGET_PATH.resolve() == SECONDARY_STORE_PATH.joinpath("TestEntry").resolve()
+    assert TransposeConfig.load(TRANSPOSE_CONFIG_PATH).entries["TestEntry"].store == (
+        str(SECONDARY_STORE_PATH.absolute())
+    )
+    assert t.check(names=["TestEntry"])[0].status == TransposeStatus.OK
+
+    TARGET_PATH.unlink()
+    t.apply("TestEntry")
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "contents"
+
+    # Small enough to stay in the store path
+    t.store_many(
+        {"Second": SECOND_TARGET_PATH},
+        stores=[str(SECONDARY_STORE_PATH)],
+        placement="size-class",
+    )
+    assert STORE_PATH.joinpath("Second").is_dir()
+    assert t.config.entries["Second"].store is None
+
+    TARGET_PATH.unlink()
+    t.restore("TestEntry")
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "contents"
+    assert not SECONDARY_STORE_PATH.joinpath("TestEntry").exists()
+
+
+@setup_store()
+def test_store_special_file(monkeypatch):
+    monkeypatch.setattr(utils, "is_same_device", lambda source, destination: False)
+    TARGET_PATH.joinpath("file.txt").write_text("contents")
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.bind(str(TARGET_PATH.joinpath("socket")))
+        with pytest.raises(TransposeError, match="unable to copy"):
+            t.store("SocketName", TARGET_PATH)
+
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "contents"
+    assert not TARGET_PATH.is_symlink()
+    assert not STORE_PATH.joinpath("SocketName").exists()
+    assert t.journal.pending() == []
+    assert not t.config.entries.get("SocketName")
+
+
+@setup_store()
+def test_store_reflink_always(monkeypatch):
+    def clone_file(fsrc, fdst):
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+    monkeypatch.setattr(utils, "clone_file", clone_file)
+    monkeypatch.setattr(utils, "is_same_device", lambda source, destination: False)
+    TARGET_PATH.joinpath("file.txt").write_text("contents")
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    with pytest.raises(TransposeError, match="Unable to reflink"):
+        t.store("ReflinkName", TARGET_PATH, reflink="always")
+
+    assert TARGET_PATH.joinpath("file.txt").read_text() == "contents"
+    assert not TARGET_PATH.is_symlink()
+    assert not STORE_PATH.joinpath("ReflinkName").exists()
+    assert t.journal.pending() == []
+    assert not t.config.entries.get("ReflinkName")
+
+    t.store("ReflinkName", TARGET_PATH, reflink="auto")
+    assert TARGET_PATH.is_symlink()
+
+
+@setup_store()
+def test_store_progress(monkeypatch):
+    monkeypatch.setattr(utils, "is_same_device", lambda source, destination: False)
+    TARGET_PATH.joinpath("file.txt").write_text("contents")
+    reports = []
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.store("ProgressName", TARGET_PATH, progress=reports.append)
+    assert reports[-1].destination == STORE_PATH.joinpath("ProgressName")
+    assert reports[-1].bytes_copied == reports[-1].total_bytes == len("contents")
+
+    reports.clear()
+    TARGET_PATH.unlink()
+    t.restore("ProgressName", progress=reports.append)
+    assert reports[-1].destination == TARGET_PATH
+    assert reports[-1].files_copied == 1
+
+
+@setup_store()
+def test_store_many(monkeypatch):
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    saves = []
+    monkeypatch.setattr(t.config, "save", saves.append)
+
+    targets = {f"Entry{i}": TARGET_PATH.joinpath(f"dir{i}") for i in range(5)}
+    for path in targets.values():
+        path.mkdir()
+    targets[ENTRY_NAME] = TARGET_PATH
+
+    results = t.store_many(targets, jobs=3)
+    assert "Entry already exists" in str(results[ENTRY_NAME])
+    for i in range(5):
+        assert results[f"Entry{i}"] is None
+        assert TARGET_PATH.joinpath(f"dir{i}").is_symlink()
+        assert STORE_PATH.joinpath(f"Entry{i}").is_dir()
+        assert t.config.entries[f"Entry{i}"].path == str(targets[f"Entry{i}"])
+    assert saves == [TRANSPOSE_CONFIG_PATH]
+
+    # Nothing stored, nothing saved
+    assert t.store_many({"Missing": "UnknownPath/"})["Missing"]
+    assert len(saves) == 1
+
+
 @setup_store()
 def test_store_conflicts():
     t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
@@ -128,6 +460,157 @@ def test_store_conflicts():
     STORE_PATH.joinpath("TestEntry").rmdir()
 
 
+@setup_apply()
+def test_repair():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+
+    results = t.repair()
+    assert [(status.name, status.status, outcome) for status, outcome in results] == [
+        (ENTRY_NAME, TransposeStatus.MISSING_LINK, "repaired"),
+        (SECOND_ENTRY_NAME, TransposeStatus.NOT_A_LINK, "drift"),
+    ]
+    assert TARGET_PATH.is_symlink()
+    assert SECOND_TARGET_PATH.is_dir()
+
+    assert t.repair(names=[ENTRY_NAME]) == []
+
+    results = t.repair(names=[SECOND_ENTRY_NAME], force=True)
+    assert results[0][1] == "repaired"
+    assert SECOND_TARGET_PATH.is_symlink()
+    assert SECOND_TARGET_PATH.with_suffix(".backup").is_dir()
+
+
+@setup_store()
+def test_recover_store_rolled_forward():
+    journal = TransposeJournal(TRANSPOSE_CONFIG_PATH.with_suffix(".journal"))
+    journal.begin("store", "TestEntry", TARGET_PATH)
+    # Interrupted after the move
+    os.rename(TARGET_PATH, STORE_PATH.joinpath("TestEntry"))
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    assert TARGET_PATH.is_symlink()
+    assert t.config.entries["TestEntry"].path == str(TARGET_PATH)
+    assert TransposeConfig.load(TRANSPOSE_CONFIG_PATH).entries.get("TestEntry")
+    assert journal.pending() == []
+
+
+@setup_store()
+def test_recover_store_secondary():
+    journal = TransposeJournal(TRANSPOSE_CONFIG_PATH.with_suffix(".journal"))
+    journal.begin("store", "TestEntry", TARGET_PATH, store=str(SECONDARY_STORE_PATH))
+    SECONDARY_STORE_PATH.mkdir()
+    os.rename(TARGET_PATH, SECONDARY_STORE_PATH.joinpath("TestEntry"))
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    assert TARGET_PATH.resolve() == SECONDARY_STORE_PATH.joinpath("TestEntry").resolve()
+    assert t.config.entries["TestEntry"].store == str(SECONDARY_STORE_PATH)
+    assert journal.pending() == []
+
+
+@setup_store()
+def test_recover_store_rolled_back():
+    journal = TransposeJournal(TRANSPOSE_CONFIG_PATH.with_suffix(".journal"))
+    journal.begin("store", "TestEntry", TARGET_PATH)  # Interrupted before the move
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    assert TARGET_PATH.is_dir()
+    assert not t.config.entries.get("TestEntry")
+    assert journal.pending() == []
+
+
+@setup_store()
+def test_recover_store_unresolved():
+    journal = TransposeJournal(TRANSPOSE_CONFIG_PATH.with_suffix(".journal"))
+    record = journal.begin("store", "TestEntry", TARGET_PATH)
+    STORE_PATH.joinpath("TestEntry").mkdir()  # Partial cross-device copy
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    assert t.recover() == [(record, "unresolved")]
+    assert not t.config.entries.get("TestEntry")
+    assert journal.pending() == [record]
+
+
+@setup_store()
+def test_recover_skipped_while_running():
+    journal = TransposeJournal(TRANSPOSE_CONFIG_PATH.with_suffix(".journal"))
+    record = journal.begin("store", "TestEntry", TARGET_PATH)
+
+    # Another process is still running the operation
+    with journal.lock.shared():
+        Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+        assert journal.pending() == [record]
+
+    Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    assert journal.pending() == []
+
+
+@setup_store()
+def test_store_resume(monkeypatch):
+    monkeypatch.setattr(utils, "is_same_device", lambda source, destination: False)
+    monkeypatch.setattr(utils, "SMALL_FILE_BATCH", 1)
+    for i in range(5):
+        TARGET_PATH.joinpath(f"file-{i}.txt").write_text(str(i))
+    copy_file = utils.copy_file
+
+    def interrupted_copy_file(source, destination, *args, **kwargs):
+        if source.endswith("file-3.txt"):
+            raise KeyboardInterrupt()
+        copy_file(source, destination, *args, **kwargs)
+
+    monkeypatch.setattr(utils, "copy_file", interrupted_copy_file)
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    with pytest.raises(KeyboardInterrupt):
+        t.store("ResumeName", TARGET_PATH)
+
+    monkeypatch.setattr(utils, "copy_file", copy_file)
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    record = t.journal.pending()[0]
+    assert t.recover() == [(record, "resumable")]
+    assert STORE_PATH.joinpath("ResumeName").is_dir()
+    assert not TARGET_PATH.is_symlink()
+
+    t.store("ResumeName", str(TARGET_PATH.absolute()))
+    assert TARGET_PATH.is_symlink()
+    assert TARGET_PATH.joinpath("file-3.txt").read_text() == "3"
+    assert t.config.entries["ResumeName"]
+    assert t.journal.pending() == []
+    assert not t._manifest(record).exists()
+
+
+@setup_restore()
+def test_apply_restore_interrupted():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    record = t.journal.begin("restore", ENTRY_NAME, TARGET_PATH)
+    t._manifest(record).create()
+    TARGET_PATH.mkdir()  # Partially copied back
+
+    with pytest.raises(TransposeError, match=f"run 'transpose restore {ENTRY_NAME}'"):
+        t.apply(ENTRY_NAME, force=True)
+    assert TARGET_PATH.is_dir() and not TARGET_PATH.is_symlink()
+    assert not TARGET_PATH.with_suffix(".backup").exists()
+
+
+@setup_restore()
+def test_recover_restore_rolled_forward():
+    journal = TransposeJournal(TRANSPOSE_CONFIG_PATH.with_suffix(".journal"))
+    journal.begin("restore", ENTRY_NAME, TARGET_PATH)
+    os.rename(ENTRY_STORE_PATH, TARGET_PATH)  # Interrupted before saving the config
+
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    assert not t.config.entries.get(ENTRY_NAME)
+    assert not TransposeConfig.load(TRANSPOSE_CONFIG_PATH).entries.get(ENTRY_NAME)
+    assert journal.pending() == []
+
+
+@setup_store()
+def test_store_journal_committed():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.store("TestEntry", TARGET_PATH)
+
+    assert t.journal.pending() == []
+    assert t.recover() == []
+
+
 @setup_store()
 def test_config_add():
     config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
@@ -174,6 +657,29 @@ def test_config_get():
     assert config.get(ENTRY_NAME).path == str(TARGET_PATH)
 
 
+@setup_store()
+def test_config_find_by_path():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+
+    assert config.find_by_path(TARGET_PATH).name == ENTRY_NAME
+    assert config.find_by_path(TARGET_PATH.joinpath("sub/file")).name == ENTRY_NAME
+    assert config.find_by_path(TARGET_PATH.absolute()).name == ENTRY_NAME
+    assert config.find_by_path(TARGET_PATH.parent) is None
+    assert config.find_by_path("/") is None
+
+    # Closest entry wins
+    config.add("Nested", TARGET_PATH.joinpath("sub"))
+    assert config.find_by_path(TARGET_PATH.joinpath("sub/file")).name == "Nested"
+    assert config.find_by_path(TARGET_PATH.joinpath("other")).name == ENTRY_NAME
+
+    config.update(ENTRY_NAME, "path", "/some/new/path")
+    assert config.find_by_path(TARGET_PATH.joinpath("other")) is None
+    assert config.find_by_path("/some/new/path/file").name == ENTRY_NAME
+
+    config.remove("Nested")
+    assert config.find_by_path(TARGET_PATH.joinpath("sub/file")) is None
+
+
 @setup_store()
 def test_config_remove():
     config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
@@ -216,6 +722,29 @@ def test_config_save():
     )
 
 
+@setup_store()
+def test_config_save_atomic(monkeypatch):
+    original = TRANSPOSE_CONFIG_PATH.read_text()
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.add("NewEntry", TARGET_PATH)
+
+    def fsync(fd):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    with pytest.raises(OSError):
+        config.save(TRANSPOSE_CONFIG_PATH)
+    monkeypatch.undo()
+
+    assert TRANSPOSE_CONFIG_PATH.read_text() == original
+    assert sorted(p.name for p in STORE_PATH.iterdir()) == [
+        "transpose-bad.json",
+        "transpose-invalid.json",
+        "transpose.json",
+        "transpose.json.lock",
+    ]
+
+
 @setup_store()
 def test_config_save_fresh():
     """
@@ -232,6 +761,147 @@ def test_config_save_fresh():
     assert config.entries.get("TestEntry")
 
 
+@setup_store()
+def test_config_log_backend():
+    log_path = JsonBackend.log_path(TRANSPOSE_CONFIG_PATH)
+    original = TRANSPOSE_CONFIG_PATH.read_text()
+
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend="log")
+    config.add("NewEntry", TARGET_PATH)
+    config.disable(ENTRY_NAME)
+    config.remove(SECOND_ENTRY_NAME)
+    config.save(TRANSPOSE_CONFIG_PATH)
+
+    # Only the changes are written
+    assert TRANSPOSE_CONFIG_PATH.read_text() == original
+    assert len(log_path.read_text().splitlines()) == 3
+
+    for backend in ("log", "json"):
+        config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend=backend)
+        assert config.entries["NewEntry"].path == str(TARGET_PATH)
+        assert config.entries[ENTRY_NAME].enabled is False
+        assert not config.entries.get(SECOND_ENTRY_NAME)
+
+    # A full save folds the log into the snapshot
+    config.save(TRANSPOSE_CONFIG_PATH)
+    assert not log_path.exists()
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    assert config.entries.get("NewEntry")
+
+
+@setup_store()
+def test_config_save_concurrent():
+    """
+    Verify saves from two processes which loaded the same config are merged
+    """
+    for backend in ("json", "log"):
+        first = TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend=backend)
+        second = TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend=backend)
+
+        first.add(f"First-{backend}", TARGET_PATH)
+        first.save(TRANSPOSE_CONFIG_PATH)
+        second.add(f"Second-{backend}", SECOND_TARGET_PATH)
+        if second.entries.get(SECOND_ENTRY_NAME):
+            second.remove(SECOND_ENTRY_NAME)
+        second.save(TRANSPOSE_CONFIG_PATH)
+
+        config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+        assert config.entries.get(f"First-{backend}")
+        assert config.entries.get(f"Second-{backend}")
+        assert not config.entries.get(SECOND_ENTRY_NAME)
+        assert second.entries.get(f"First-{backend}")
+
+
+@setup_store()
+def test_config_log_compaction(monkeypatch):
+    monkeypatch.setattr("transpose.backends.CONFIG_LOG_COMPACT_MIN", 4)
+    log_path = JsonBackend.log_path(TRANSPOSE_CONFIG_PATH)
+
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend="log")
+    for i in range(2):
+        config.disable(ENTRY_NAME)
+        config.enable(ENTRY_NAME)
+        config.save(TRANSPOSE_CONFIG_PATH)
+    assert len(log_path.read_text().splitlines()) == 4
+
+    # Compacted once the log outgrows both the minimum and the number of entries
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend="log")
+    config.add("NewEntry", TARGET_PATH)
+    config.save(TRANSPOSE_CONFIG_PATH)
+    assert not log_path.exists()
+
+    with open(TRANSPOSE_CONFIG_PATH, "r") as f:
+        assert sorted(json.load(f)["entries"]) == sorted(
+            [ENTRY_NAME, SECOND_ENTRY_NAME, "NewEntry"]
+        )
+
+
+@setup_store()
+def test_config_log_torn_line():
+    log_path = JsonBackend.log_path(TRANSPOSE_CONFIG_PATH)
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend="log")
+    config.remove(ENTRY_NAME)
+    config.save(TRANSPOSE_CONFIG_PATH)
+    with open(log_path, "a") as f:
+        f.write('{"op": "remove", "na')
+
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    assert not config.entries.get(ENTRY_NAME)
+    assert config.entries.get(SECOND_ENTRY_NAME)
+
+    with pytest.raises(TransposeError, match="Unknown Transpose config backend"):
+        TransposeConfig.load(TRANSPOSE_CONFIG_PATH, backend="xml")
+
+
+def test_entries_mapping():
+    entries = TransposeEntries(
+        {
+            "First": {"path": "/first", "created": "2023-01-21", "enabled": True},
+            "Second": {"path": "/second", "created": "2023-01-21", "enabled": False},
+        }
+    )
+    assert len(entries) == 2
+    assert "First" in entries
+    assert entries["Second"] == TransposeEntry("Second", "/second", "2023-01-21", False)
+
+    del entries["First"]
+    entries["Third"] = TransposeEntry("Third", "/third", "2023-01-21")
+    assert list(entries) == ["Second", "Third"]
+    assert len(entries) == 2
+    assert not entries.get("First")
+    with pytest.raises(KeyError):
+        del entries["First"]
+
+    entries["First"] = TransposeEntry("First", "/new", "2023-01-21")
+    assert entries["First"].path == "/new"
+    assert len(entries) == 3
+    assert entries.to_dict()["First"]["path"] == "/new"
+
+
+@setup_store()
+def test_config_load_lazy():
+    in_config = {"entries": dict(TRANSPOSE_CONFIG["entries"], BadEntry={"path": "/"})}
+    with open(TRANSPOSE_CONFIG_PATH, "w") as f:
+        json.dump(in_config, f)
+
+    # Only the accessed entries are parsed
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    assert config.get(ENTRY_NAME).path == str(TARGET_PATH)
+    assert "BadEntry" in config.entries
+    with pytest.raises(
+        TransposeError, match="Unrecognized Transpose config file format"
+    ):
+        config.get("BadEntry")
+
+    # Entries never accessed are saved as they were loaded
+    config.remove(SECOND_ENTRY_NAME)
+    config.save(TRANSPOSE_CONFIG_PATH)
+    with open(TRANSPOSE_CONFIG_PATH, "r") as f:
+        saved_config = json.load(f)
+    assert saved_config["entries"]["BadEntry"] == {"path": "/"}
+    assert sorted(saved_config["entries"]) == ["BadEntry", ENTRY_NAME]
+
+
 @setup_store()
 def test_config_load():
     config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
@@ -1,8 +1,22 @@
+import errno
 import json
+import logging
+import os
 import pathlib
+import pytest
+import shutil
+import socket
+import stat
 
-from transpose import version
-from transpose.utils import move, remove, symlink
+from transpose import utils, version
+from transpose.utils import (
+    copy_tree,
+    disk_usage,
+    move,
+    read_jsonl,
+    remove,
+    symlink,
+)
 
 
 from .utils import (
@@ -15,11 +29,269 @@ from .utils import (
 
 
 @setup_store()
-def test_file_move():
+def test_file_move(caplog):
+    caplog.set_level(logging.INFO, logger="transpose.utils")
     destination = STORE_PATH.joinpath("test_move")
-    move(source=TARGET_PATH.absolute(), destination=destination.absolute())
+    result = move(source=TARGET_PATH.absolute(), destination=destination.absolute())
     assert not TARGET_PATH.exists()
     assert destination.exists()
+    assert result.strategy == "rename"
+    assert result.duration >= 0
+    assert "using rename" in caplog.text
+
+
+@setup_store()
+def test_file_move_rename_does_not_walk(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("Same device moves must not walk the tree")
+
+    monkeypatch.setattr(utils, "copy_tree", fail)
+    TARGET_PATH.joinpath("nested").mkdir()
+
+    result = move(source=TARGET_PATH, destination=STORE_PATH.joinpath("test_move"))
+    assert result.strategy == "rename"
+    assert STORE_PATH.joinpath("test_move/nested").is_dir()
+
+
+@setup_store()
+def test_file_move_exdev_fallback(monkeypatch, caplog):
+    def rename(source, destination):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr(utils.os, "rename", rename)
+    TARGET_PATH.joinpath("file.txt").write_text("contents")
+
+    destination = STORE_PATH.joinpath("test_move")
+    result = move(source=TARGET_PATH, destination=destination)
+    assert result.strategy == "copy"
+    assert destination.joinpath("file.txt").read_text() == "contents"
+    assert not TARGET_PATH.exists()
+    assert "copying instead" in caplog.text
+
+
+def test_select_move_strategy(monkeypatch):
+    assert utils.select_move_strategy(pathlib.Path("."), pathlib.Path("x")) == "rename"
+
+    monkeypatch.setattr(utils, "is_same_device", lambda source, destination: False)
+    assert utils.select_move_strategy(pathlib.Path("."), pathlib.Path("x")) == "copy"
+
+
+def _populate_tree(path: pathlib.Path) -> None:
+    path.joinpath("nested/deeper").mkdir(parents=True)
+    path.joinpath("large.bin").write_bytes(b"x" * 4096)
+    for i in range(10):
+        path.joinpath(f"nested/small-{i}.txt").write_text(str(i))
+    path.joinpath("nested/deeper/link").symlink_to("../small-0.txt")
+
+
+@setup_store()
+def test_copy_tree(monkeypatch):
+    monkeypatch.setattr(utils, "LARGE_FILE_SIZE", 1024)
+    monkeypatch.setattr(utils, "SMALL_FILE_BATCH", 3)
+    _populate_tree(TARGET_PATH)
+
+    destination = STORE_PATH.joinpath("copied")
+    copy_tree(TARGET_PATH, destination, workers=4)
+
+    assert TARGET_PATH.joinpath("large.bin").exists()
+    assert destination.joinpath("large.bin").read_bytes() == b"x" * 4096
+    assert destination.joinpath("nested/small-9.txt").read_text() == "9"
+    assert destination.joinpath("nested/deeper/link").is_symlink()
+    assert destination.joinpath("nested/deeper/link").read_text() == "0"
+
+    with pytest.raises(FileExistsError):
+        copy_tree(TARGET_PATH, destination)
+    assert destination.joinpath("large.bin").exists()
+
+
+@setup_store()
+def test_disk_usage():
+    _populate_tree(TARGET_PATH)
+    single = STORE_PATH.joinpath("single.txt")
+    single.write_text("single")
+
+    sizes = disk_usage([TARGET_PATH, single], workers=4)
+    assert sizes[TARGET_PATH] > sizes[single] > 0
+
+    # A hardlinked file is only counted once
+    os.link(TARGET_PATH.joinpath("large.bin"), TARGET_PATH.joinpath("hardlink.bin"))
+    assert disk_usage([TARGET_PATH])[TARGET_PATH] == sizes[TARGET_PATH]
+
+
+@setup_store()
+def test_file_move_cross_device(monkeypatch):
+    monkeypatch.setattr(utils, "is_same_device", lambda source, destination: False)
+    monkeypatch.setattr(utils, "LARGE_FILE_SIZE", 1024)
+    _populate_tree(TARGET_PATH)
+
+    destination = STORE_PATH.joinpath("test_move")
+    result = move(source=TARGET_PATH, destination=destination)
+    assert result.strategy == "copy"
+    assert not TARGET_PATH.exists()
+    assert destination.joinpath("large.bin").read_bytes() == b"x" * 4096
+    assert destination.joinpath("nested/deeper/link").is_symlink()
+
+    # Moving into an existing directory
+    TARGET_PATH.mkdir()
+    move(source=TARGET_PATH, destination=destination)
+    assert destination.joinpath(TARGET_PATH.name).is_dir()
+
+
+@setup_store()
+def test_copy_tree_reflink(monkeypatch):
+    cloned = []
+
+    def clone_file(fsrc, fdst):
+        cloned.append(fsrc.name)
+        fdst.write(fsrc.read())
+
+    monkeypatch.setattr(utils, "clone_file", clone_file)
+    monkeypatch.setattr(utils, "LARGE_FILE_SIZE", 1024)
+    _populate_tree(TARGET_PATH)
+
+    copy_tree(TARGET_PATH, STORE_PATH.joinpath("auto"), workers=2)
+    assert len(cloned) == 11  # Every regular file, but not the symlink
+    assert STORE_PATH.joinpath("auto/large.bin").read_bytes() == b"x" * 4096
+
+    cloned.clear()
+    copy_tree(TARGET_PATH, STORE_PATH.joinpath("never"), reflink="never")
+    assert cloned == []
+    assert STORE_PATH.joinpath("never/nested/small-3.txt").read_text() == "3"
+
+
+@setup_store()
+def test_copy_tree_reflink_unsupported(monkeypatch):
+    def clone_file(fsrc, fdst):
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+    monkeypatch.setattr(utils, "clone_file", clone_file)
+    _populate_tree(TARGET_PATH)
+
+    # Falls back to copying bytes
+    copy_tree(TARGET_PATH, STORE_PATH.joinpath("auto"), reflink="auto")
+    assert STORE_PATH.joinpath("auto/large.bin").read_bytes() == b"x" * 4096
+
+    with pytest.raises(utils.ReflinkError):
+        copy_tree(TARGET_PATH, STORE_PATH.joinpath("always"), reflink="always")
+    assert not STORE_PATH.joinpath("always").exists()
+
+    with pytest.raises(utils.ReflinkError):  # A single file
+        copy_tree(
+            TARGET_PATH.joinpath("large.bin"),
+            STORE_PATH.joinpath("always.bin"),
+            reflink="always",
+        )
+    assert not STORE_PATH.joinpath("always.bin").exists()
+
+    with pytest.raises(ValueError):
+        move(TARGET_PATH, STORE_PATH.joinpath("moved"), reflink="sometimes")
+
+
+@setup_store()
+def test_copy_tree_special_files():
+    _populate_tree(TARGET_PATH)
+    os.mkfifo(TARGET_PATH.joinpath("nested", "pipe"))
+    os.chmod(TARGET_PATH.joinpath("nested", "pipe"), 0o640)
+
+    # Recreated rather than opened, which would block until something writes to it
+    copy_tree(TARGET_PATH, STORE_PATH.joinpath("copied"), workers=2)
+    pipe = STORE_PATH.joinpath("copied", "nested", "pipe").lstat()
+    assert stat.S_ISFIFO(pipe.st_mode)
+    assert stat.S_IMODE(pipe.st_mode) == 0o640
+
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.bind(str(TARGET_PATH.joinpath("socket")))
+        with pytest.raises(shutil.SpecialFileError, match="unable to copy"):
+            copy_tree(TARGET_PATH, STORE_PATH.joinpath("failed"))
+    assert not STORE_PATH.joinpath("failed").exists()
+
+
+@setup_store()
+def test_copy_tree_progress(monkeypatch):
+    monkeypatch.setattr(utils, "PROGRESS_INTERVAL", 0)
+    monkeypatch.setattr(utils, "LARGE_FILE_SIZE", 1024)
+    monkeypatch.setattr(utils, "COPY_CHUNK_SIZE", 1024)
+    _populate_tree(TARGET_PATH)
+    reports = []
+
+    destination = STORE_PATH.joinpath("copied")
+    copy_tree(TARGET_PATH, destination, workers=2, progress=reports.append)
+
+    final = reports[-1]
+    assert final.source == TARGET_PATH
+    assert final.destination == destination
+    assert final.total_bytes == final.bytes_copied == 4096 + 10
+    assert final.total_files == final.files_copied == 12  # Including the symlink
+    assert final.eta == 0
+    assert final.bytes_per_second > 0
+    # The large file is reported chunk by chunk
+    assert len(reports) > 12
+    assert [r.bytes_copied for r in reports] == sorted(r.bytes_copied for r in reports)
+
+
+@setup_store()
+def test_file_move_progress(monkeypatch):
+    TARGET_PATH.joinpath("file.txt").write_text("contents")
+    reports = []
+
+    move(TARGET_PATH, STORE_PATH.joinpath("renamed"), progress=reports.append)
+    assert reports == []  # Renames are instant
+
+    monkeypatch.setattr(utils, "is_same_device", lambda source, destination: False)
+    move(STORE_PATH.joinpath("renamed"), TARGET_PATH, progress=reports.append)
+    assert reports[-1].bytes_copied == len("contents")
+    assert reports[-1].files_copied == 1
+
+
+@setup_store()
+def test_copy_tree_resume(monkeypatch):
+    monkeypatch.setattr(utils, "SMALL_FILE_BATCH", 1)
+    _populate_tree(TARGET_PATH)
+    destination = STORE_PATH.joinpath("copied")
+    manifest = utils.CopyManifest(STORE_PATH.joinpath("copied.manifest"))
+    copy_file = utils.copy_file
+    copied = []
+
+    def interrupted_copy_file(source, destination, *args, **kwargs):
+        if source.endswith("small-5.txt"):
+            pathlib.Path(destination).write_text("partial")
+            raise KeyboardInterrupt()
+        copy_file(source, destination, *args, **kwargs)
+
+    monkeypatch.setattr(utils, "copy_file", interrupted_copy_file)
+    with pytest.raises(KeyboardInterrupt):
+        copy_tree(TARGET_PATH, destination, workers=1, manifest=manifest)
+    assert destination.joinpath("nested/small-5.txt").read_text() == "partial"
+
+    def counting_copy_file(source, destination, *args, **kwargs):
+        copied.append(os.path.basename(source))
+        copy_file(source, destination, *args, **kwargs)
+
+    monkeypatch.setattr(utils, "copy_file", counting_copy_file)
+    TARGET_PATH.joinpath("nested/small-0.txt").write_text("changed since")
+    manifest = utils.CopyManifest(manifest.path)
+    copy_tree(TARGET_PATH, destination, workers=1, manifest=manifest)
+
+    assert "small-5.txt" in copied
+    assert "small-0.txt" in copied  # Modified after it was copied
+    assert len(copied) < 11
+    assert destination.joinpath("nested/small-5.txt").read_text() == "5"
+    assert destination.joinpath("nested/small-0.txt").read_text() == "changed since"
+    assert destination.joinpath("large.bin").read_bytes() == b"x" * 4096
+    assert destination.joinpath("nested/deeper/link").is_symlink()
+
+    with pytest.raises(FileExistsError):  # Without a manifest, nothing to resume
+        copy_tree(TARGET_PATH, destination)
+
+
+@setup_store()
+def test_read_jsonl():
+    path = STORE_PATH.joinpath("records.jsonl")
+    assert read_jsonl(path) == []
+
+    # Torn lines, one followed by a later append and one at the end
+    path.write_text('{"id": 1}\n{"id": 2, "na\n{"id": 3}\n{"id": 4')
+    assert read_jsonl(path) == [{"id": 1}, {"id": 3}]
 
 
 @setup_store()
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from transpose import Transpose, TransposeConfig
+from transpose.backends import get_backend
+from transpose.watch import EntryWatcher
+
+from .utils import (
+    ENTRY_NAME,
+    ENTRY_STORE_PATH,
+    SECOND_ENTRY_NAME,
+    STORE_PATH,
+    TARGET_PATH,
+    TRANSPOSE_CONFIG_PATH,
+    setup_apply,
+)
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@setup_apply()
+def test_watch():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    reports = []
+    stop = threading.Event()
+
+    watcher = EntryWatcher(t, debounce=0.05)
+    thread = threading.Thread(
+        target=watcher.run,
+        args=(lambda status, outcome: reports.append((status.name, outcome)), stop),
+    )
+    thread.start()
+
+    try:
+        # Checked on startup, the second entry path is a real directory
+        assert wait_for(lambda: len(reports) == 2)
+        assert (ENTRY_NAME, "repaired") in reports
+        assert (SECOND_ENTRY_NAME, "drift") in reports
+        assert TARGET_PATH.is_symlink()
+
+        TARGET_PATH.unlink()
+        assert wait_for(lambda: len(reports) == 3)
+        assert reports[2] == (ENTRY_NAME, "repaired")
+        assert TARGET_PATH.is_symlink()
+
+        # Restored elsewhere, so no longer watched
+        t2 = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+        TARGET_PATH.unlink()
+        t2.restore(ENTRY_NAME)
+        time.sleep(0.5)
+        assert TARGET_PATH.is_dir() and not TARGET_PATH.is_symlink()
+        assert len(reports) == 3
+    finally:
+        stop.set()
+        thread.join()
+
+
+@setup_apply()
+def test_watch_sqlite():
+    config = TransposeConfig.load(TRANSPOSE_CONFIG_PATH)
+    config.backend = get_backend("sqlite")
+    config.save(STORE_PATH.joinpath("transpose.db"))
+    TRANSPOSE_CONFIG_PATH.unlink()
+
+    t = Transpose(config_path=STORE_PATH.joinpath("transpose.db"))
+    reports = []
+    stop = threading.Event()
+
+    watcher = EntryWatcher(t, debounce=0.05)
+    thread = threading.Thread(
+        target=watcher.run,
+        args=(lambda status, outcome: reports.append((status.name, outcome)), stop),
+    )
+    thread.start()
+
+    try:
+        assert wait_for(lambda: len(reports) == 2)
+        assert TARGET_PATH.is_symlink()
+
+        # Restored by another process, the watcher reloads instead of reporting drift
+        t2 = Transpose(config_path=STORE_PATH.joinpath("transpose.db"))
+        t2.restore(ENTRY_NAME)
+        assert wait_for(lambda: ENTRY_NAME not in t.config.entries)
+        time.sleep(0.5)
+        assert TARGET_PATH.is_dir() and not TARGET_PATH.is_symlink()
+        assert len(reports) == 2
+    finally:
+        stop.set()
+        thread.join()
+
+
+@setup_apply()
+def test_watch_frozen():
+    t = Transpose(config_path=TRANSPOSE_CONFIG_PATH)
+    t.freeze(ENTRY_NAME)
+    reports = []
+    stop = threading.Event()
+
+    # Thawing would wait for the journal lock the watcher holds while repairing
+    watcher = EntryWatcher(t, debounce=0.05)
+    thread = threading.Thread(
+        target=watcher.run,
+        args=(lambda status, outcome: reports.append((status.name, outcome)), stop),
+        daemon=True,
+    )
+    thread.start()
+
+    try:
+        assert wait_for(lambda: (ENTRY_NAME, "repaired") in reports)
+        assert TARGET_PATH.is_symlink()
+        assert not ENTRY_STORE_PATH.exists()
+        assert t.config.entries[ENTRY_NAME].frozen
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+    assert not thread.is_alive()